@@ -0,0 +1,122 @@
+"""
+Transcript fetching benchmark: one video after the other with a new connection
+each (previous behavior) vs. the fetch stage of batch ingestion (`ingest_batch`:
+one thread per video, at most `--workers` fetching at once, through the shared
+fetcher with its pooled sessions, token bucket and jittered retries, and the
+transcripts saved in a video store).
+
+Synthetic transcripts are served by a local fixture server standing in for
+YouTube, with a configurable response latency and share of throttled (429)
+responses, so the throughput can be measured offline. The fetcher is also run
+on the fixture directory itself (no network).
+
+Usage:
+    uv run python -m benchmarks.bench_fetch [--videos 200] [--workers 16] [--latency-ms 50]
+        [--failure-rate 0.05] [--rate 0]
+"""
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from functools import partial
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import requests
+from fetcher import TranscriptFetcher, DirectorySource, HTTPSource
+from store import VideoStore, RAW
+from ingest import fetch_transcription
+from benchmarks.bench_grouping import synthetic_transcript
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    latency = 0.0
+    failure_rate = 0.0
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+    disable_nagle_algorithm = True  # Headers and body are written separately
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            self.send_response(429)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', type=int, default=200)
+    parser.add_argument('--minutes', type=float, default=20, help="Length of every synthetic video")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--failure-rate', type=float, default=0.05, help="Share of throttled (429) responses")
+    parser.add_argument('--rate', type=float, default=0, help="Fetches per second of the token bucket (0: no limit)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        video_ids = [f"video{i:06d}" for i in range(args.videos)]
+        transcription = {'language': 'English', 'language_code': 'en', 'data': synthetic_transcript(args.minutes / 60)}
+        for video_id in video_ids:
+            with open(os.path.join(directory, f"{video_id}.json"), 'w') as f:
+                json.dump(transcription, f)
+        print(f"{args.videos} synthetic transcripts of {args.minutes} minutes, "
+              f"{args.latency_ms} ms latency, {args.failure_rate:.0%} throttled responses\n")
+
+        handler = partial(FixtureHandler, directory=directory)
+        FixtureHandler.latency = args.latency_ms / 1000
+        FixtureHandler.failure_rate = args.failure_rate
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        def report(name: str, seconds: float, fetched: int, stats: dict | None = None):
+            extra = f" ({stats['retries']} retries, {stats['failed']} failed)" if stats else ""
+            print(f"{name:<40} {seconds:8.2f} s {fetched / seconds:9.1f} videos/s{extra}")
+
+        # Previous behavior: sequential, a new connection per video, no retry
+        start = time.perf_counter()
+        fetched = 0
+        for video_id in video_ids:
+            response = requests.get(f"{base_url}/{video_id}.json")
+            if response.ok:
+                response.json()
+                fetched += 1
+        report("sequential, new connection", time.perf_counter() - start, fetched)
+
+        runs = [
+            ("fetcher, 1 worker", HTTPSource(base_url, pool_size=1), 1),
+            (f"fetcher, {args.workers} workers", HTTPSource(base_url, pool_size=args.workers), args.workers),
+            (f"fetcher, directory, {args.workers} workers", DirectorySource(directory), args.workers),
+        ]
+        for i, (name, source, workers) in enumerate(runs):
+            fetcher = TranscriptFetcher(source, rate=args.rate, burst=workers, max_retries=8, backoff_base=0.05)
+            store = VideoStore(os.path.join(directory, f"videos{i}.sqlite"))
+            fetch_limit = threading.BoundedSemaphore(workers)
+
+            def fetch(video_id: str):
+                # Same as the fetch stage of `ingest_video` under the 'fetch' limit of `ingest_batch`
+                with fetch_limit:
+                    try:
+                        fetch_transcription(video_id, fetcher, store)
+                    except Exception:
+                        pass  # Counted by the fetcher
+
+            start = time.perf_counter()
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), ThreadPoolExecutor(workers) as executor:
+                list(executor.map(fetch, video_ids))
+            fetched = sum(1 for video_id in video_ids if store.has(video_id, RAW))
+            report(name, time.perf_counter() - start, fetched, fetcher.stats())
+
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark of the transcript grouping functions on synthetic long transcripts.
+
+Compares the streaming `iter_grouped` based implementation (`utils.py`) with the
+previous implementation (repeated `+=` on the text of every window).
+
+Usage:
+    uv run python -m benchmarks.bench_grouping [--hours 10] [--repeat 5]
+"""
+import random
+import argparse
+from timeit import repeat
+from utils import get_grouped_transcriptions, get_grouped_data, iter_grouped
+
+
+def legacy_grouping(data: list[dict], time: int | float, end_key: str) -> list[dict]:
+    # Previous implementation, kept here as the baseline
+    curr_res = {
+        'start': data[0]['start'],
+        'end': data[0][end_key],
+        'text': data[0]['text']
+    }
+
+    output = []
+    for d in data[1:]:
+        if d['start'] - curr_res['start'] <= time:
+            curr_res['text'] += (" " + d['text'])
+            curr_res['end'] = d[end_key]
+        else:
+            output.append(curr_res)
+            curr_res = {
+                'start': d['start'],
+                'end': d[end_key],
+                'text': d['text']
+            }
+
+    output.append(curr_res)
+    return output
+
+
+def synthetic_transcript(hours: int | float, seed: int = 0, words: list[str] | None = None) -> list[dict]:
+    """
+    Builds a raw transcript (`res.to_raw_data()` format) with one caption line every ~2 seconds.
+    """
+    rng = random.Random(seed)
+    words = words or ["the", "model", "video", "summary", "token", "latency", "index", "vector", "chunk", "time"]
+
+    data = []
+    t = 0.0
+    while t < hours * 3600:
+        duration = rng.uniform(1.0, 3.0)
+        data.append({
+            'start': round(t, 2),
+            'duration': round(duration, 2),
+            'text': " ".join(rng.choices(words, k=rng.randint(4, 12)))
+        })
+        t += duration
+
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    raw = synthetic_transcript(args.hours)
+    base = get_grouped_transcriptions(raw, 60)
+    print(f"Synthetic transcript: {args.hours}h, {len(raw)} caption lines, {len(base)} base chunks\n")
+
+    cases = {
+        'transcriptions (60s), legacy': lambda: legacy_grouping(raw, 60, 'start'),
+        'transcriptions (60s), streaming': lambda: get_grouped_transcriptions(raw, 60),
+        'data (120s/180s/600s), legacy': lambda: [legacy_grouping(base, t, 'end') for t in (120, 180, 600)],
+        'data (120s/180s/600s), streaming': lambda: [get_grouped_data(base, t) for t in (120, 180, 600)],
+        'data (120s), generator only': lambda: sum(1 for _ in iter_grouped(base, 120)),
+    }
+
+    for name, fn in cases.items():
+        best = min(repeat(fn, number=1, repeat=args.repeat))
+        print(f"{name:<36} {best * 1000:9.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Library index benchmark: incremental adds and search latency of the cross-video
+index as the library grows, exact search (matrix product over every vector,
+what the index does below `LIBRARY_HNSW_THRESHOLD`) vs. the HNSW graph.
+
+Synthetic videos are clusters of normalized random vectors (chunks of the same
+video are closer to each other), queries are noisy copies of stored chunks. The
+script prints the add throughput, the time to add one more video once the graph
+exists, the query latency (p50 / p95) of both searches, the recall@k of the
+graph against the exact results, and the latency of searches restricted to a
+few videos (exact over their own vectors).
+
+Usage:
+    uv run python -m benchmarks.bench_library [--sizes 10000 50000 200000] [--dim 256] [--queries 200]
+"""
+import time
+import tempfile
+import argparse
+import statistics
+import faiss
+import numpy as np
+from llm.library_index import LibraryIndex, normalize, HNSW_EF_SEARCH
+
+
+def synthetic_videos(count: int, chunks_per_video: int, dim: int, rng: np.random.Generator):
+    """
+    Yields `(video_id, chunks, vectors)`: every video is a cluster of chunk vectors around its own center.
+    """
+    for v in range(count):
+        center = rng.standard_normal(dim).astype('float32')
+        vectors = center + rng.standard_normal((chunks_per_video, dim)).astype('float32')
+        chunks = [{'start': i * 120.0, 'end': (i + 1) * 120.0, 'text': f"video {v} chunk {i}"}
+                  for i in range(chunks_per_video)]
+        yield f"video{v:06d}", chunks, vectors
+
+
+def percentiles(seconds: list[float]) -> str:
+    ms = sorted(s * 1000 for s in seconds)
+    return f"p50 {statistics.median(ms):7.2f} ms p95 {ms[int(0.95 * (len(ms) - 1))]:7.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 50_000], help="Vectors in the library")
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--chunks-per-video', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--filter-videos', type=int, default=5, help="Videos of the restricted searches")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = np.random.default_rng(0)
+        videos = size // args.chunks_per_video
+        with tempfile.TemporaryDirectory() as directory:
+            # The graph is built when the last video is added, then grows with every add
+            index = LibraryIndex(directory, hnsw_threshold=size)
+            start = time.perf_counter()
+            for video_id, chunks, vectors in synthetic_videos(videos, args.chunks_per_video, args.dim, rng):
+                index.add(video_id, chunks, vectors)
+            add_seconds = time.perf_counter() - start
+
+            extra_id, extra_chunks, extra_vectors = next(synthetic_videos(1, args.chunks_per_video, args.dim, rng))
+            start = time.perf_counter()
+            index.add(extra_id + '-extra', extra_chunks, extra_vectors)
+            incremental_seconds = time.perf_counter() - start
+
+            print(f"{index.ntotal} vectors ({videos + 1} videos, dim {args.dim})")
+            print(f"  adds (incl. graph build)  {add_seconds:8.2f} s {size / add_seconds:10.0f} vectors/s")
+            print(f"  one more video            {incremental_seconds * 1000:8.2f} ms (no rebuild)")
+
+            vectors = np.asarray(index._get_vectors())
+            picked = rng.integers(0, index.ntotal, args.queries)
+            # Noise of norm ~0.3 around unit vectors
+            noise = rng.standard_normal((args.queries, args.dim)).astype('float32') * 0.3 / np.sqrt(args.dim)
+            queries = normalize(vectors[picked] + noise)
+
+            exact_seconds, exact_results = [], []
+            for query in queries:
+                start = time.perf_counter()
+                scores, ids = LibraryIndex._exact_search(vectors, query, args.k)
+                exact_seconds.append(time.perf_counter() - start)
+                exact_results.append(set(ids.tolist()))
+
+            params = faiss.SearchParametersHNSW(efSearch=HNSW_EF_SEARCH)
+            graph_seconds, hits = [], 0
+            for query, expected in zip(queries, exact_results):
+                start = time.perf_counter()
+                scores, ids = index._graph.search(query[None, :], args.k, params=params)
+                graph_seconds.append(time.perf_counter() - start)
+                hits += len(expected & set(ids[0].tolist()))
+
+            filter_ids = [f"video{v:06d}" for v in rng.choice(videos, args.filter_videos, replace=False)]
+            filtered_seconds = []
+            for query in queries:
+                start = time.perf_counter()
+                index.search(query, k=args.k, video_ids=filter_ids)
+                filtered_seconds.append(time.perf_counter() - start)
+
+            print(f"  exact search              {percentiles(exact_seconds)}")
+            print(f"  HNSW search               {percentiles(graph_seconds)} recall@{args.k} "
+                  f"{hits / (args.k * args.queries):.3f}")
+            print(f"  {args.filter_videos} videos only            {percentiles(filtered_seconds)} (incl. metadata)\n")
+
+
+if __name__ == '__main__':
+    main()
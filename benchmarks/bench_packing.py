@@ -0,0 +1,116 @@
+"""
+Chunk packing benchmark: translation blocks and summarization chunks cut by
+time (`TRANSLATION_TIME_DURATION`, `SUMMARIZATION_TIME_DURATION`) vs. packed
+by a token budget (`TRANSLATION_TOKEN_BUDGET`, `SUMMARIZATION_TOKEN_BUDGET`).
+
+The synthetic transcript alternates slow (lecture-like) and fast (podcast-like)
+sections, so time windows give calls of very different sizes. Translation and
+the map-reduce video summary run against the fake chat model; the script prints
+the LLM calls, input / output tokens and the spread of input tokens per call.
+
+Usage:
+    uv run python -m benchmarks.bench_packing [--hours 2] [--translation-tokens 2000] [--summary-tokens 3000]
+"""
+import io
+import random
+import argparse
+import statistics
+from contextlib import redirect_stdout
+from config import (TRANSCRIBED_TEXT_TIME_DURATION, TRANSLATION_TIME_DURATION, SUMMARIZATION_TIME_DURATION,
+                    SUMMARIZATION_REDUCE_TOKEN_BUDGET, SUMMARIZATION_REDUCE_FAN_IN)
+from utils import get_grouped_transcriptions
+from timeline import TimelineIndex
+from llm.fake import FakeChatModel
+from llm.providers import set_clients
+from llm.instrumentation import get_metrics
+from llm.translator import translate_to_english
+from llm.summarizer import map_summarize, reduce_summarize
+
+SPANISH_WORDS = ["el", "modelo", "vídeo", "resumen", "latencia", "índice", "vector", "tiempo",
+                 "entrenamiento", "datos", "red", "capa", "gradiente", "memoria"]
+
+# Section kind -> (words per caption line, seconds per caption line)
+SPEECH_RATES = {
+    'lecture': ((2, 6), (2.5, 5.0)),
+    'podcast': ((12, 22), (1.5, 2.5)),
+}
+
+
+def varying_transcript(hours: int | float, seed: int = 0) -> list[dict]:
+    """
+    Builds a raw transcript alternating slow and fast sections of 5 to 15 minutes.
+    """
+    rng = random.Random(seed)
+    data = []
+    t = 0.0
+    kinds = list(SPEECH_RATES)
+    section = 0
+    while t < hours * 3600:
+        (min_words, max_words), (min_duration, max_duration) = SPEECH_RATES[kinds[section % len(kinds)]]
+        section_end = t + rng.uniform(300, 900)
+        while t < min(section_end, hours * 3600):
+            duration = rng.uniform(min_duration, max_duration)
+            data.append({'start': round(t, 2), 'duration': round(duration, 2),
+                         'text': " ".join(rng.choices(SPANISH_WORDS, k=rng.randint(min_words, max_words)))})
+            t += duration
+        section += 1
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=2)
+    parser.add_argument('--translation-tokens', type=int, default=2000)
+    parser.add_argument('--summary-tokens', type=int, default=3000)
+    args = parser.parse_args()
+
+    chat_model = FakeChatModel()
+    set_clients(chat_model=chat_model)
+    get_metrics().log_path = None
+
+    chunks = get_grouped_transcriptions(varying_transcript(args.hours), TRANSCRIBED_TEXT_TIME_DURATION)
+    timeline = TimelineIndex.from_records(chunks)
+    print(f"Synthetic transcript: {args.hours}h, {len(chunks)} chunks of {TRANSCRIBED_TEXT_TIME_DURATION}s, "
+          f"alternating {' / '.join(SPEECH_RATES)} sections\n")
+
+    def spread(texts: list[str]) -> str:
+        tokens = [chat_model.get_num_tokens(text) for text in texts]
+        return f"tokens per call min {min(tokens):5} median {statistics.median(tokens):7.0f} max {max(tokens):5}"
+
+    def report(name: str, before: dict, texts: list[str]):
+        after = chat_model.usage.snapshot()
+        calls = after.get('calls', 0) - before.get('calls', 0)
+        input_tokens = after.get('input_tokens', 0) - before.get('input_tokens', 0)
+        output_tokens = after.get('output_tokens', 0) - before.get('output_tokens', 0)
+        print(f"{name:<32} {calls:5} LLM calls {input_tokens:8} input {output_tokens:8} output tokens | {spread(texts)}")
+
+    modes = [
+        (f"time ({TRANSLATION_TIME_DURATION}s blocks)", TRANSLATION_TIME_DURATION, None),
+        (f"packed ({args.translation_tokens} tokens)", None, args.translation_tokens),
+    ]
+    print("Translation")
+    for name, max_duration, max_tokens in modes:
+        blocks = [timeline.text_between(first, last - 1)
+                  for first, last in timeline.group_bounds(max_duration, max_tokens, chat_model.get_num_tokens)]
+        before = chat_model.usage.snapshot()
+        with redirect_stdout(io.StringIO()):
+            translate_to_english([dict(chunk) for chunk in chunks], from_lang='es', max_duration=max_duration,
+                                 max_tokens=max_tokens)
+        report(name, before, blocks)
+
+    modes = [
+        (f"time ({SUMMARIZATION_TIME_DURATION}s chunks)", SUMMARIZATION_TIME_DURATION, None),
+        (f"packed ({args.summary_tokens} tokens)", None, args.summary_tokens),
+    ]
+    print("\nVideo summary (map + tree reduce)")
+    for name, time, max_tokens in modes:
+        texts = timeline.grouped(time, max_tokens, chat_model.get_num_tokens).texts()
+        before = chat_model.usage.snapshot()
+        summaries = map_summarize(chat_model, texts)
+        reduce_summarize(chat_model, summaries, token_budget=SUMMARIZATION_REDUCE_TOKEN_BUDGET,
+                         fan_in=SUMMARIZATION_REDUCE_FAN_IN)
+        report(name, before, texts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark of the per-interval summaries: direct map over every interval vs. the summary pyramid.
+
+Asks for summaries at several interval lengths in a row (e.g. every 2, then 5,
+then 10 minutes, then 2 minutes again) on a synthetic transcript, against the
+fake chat model (configurable latency), and prints the LLM calls, tokens, time
+and time to the first interval summary of every request. The direct method
+summarizes the raw text of every interval again. The pyramid summarizes the
+intervals of the first request directly, then is filled in the background
+(printed separately, after the request); the next requests reuse its nodes and
+the saved edge / interval summaries (with `--prebuilt`, the whole pyramid is
+built first, like an ingestion with `--summarize`).
+
+Usage:
+    uv run python -m benchmarks.bench_pyramid [--hours 2] [--intervals 120 300 600 120]
+        [--llm-latency-ms 200] [--prebuilt]
+"""
+import io
+import time
+import argparse
+from contextlib import redirect_stdout
+from utils import get_grouped_transcriptions
+from timeline import TimelineIndex
+from llm.fake import FakeChatModel
+from llm.providers import set_clients
+from llm.instrumentation import get_metrics
+from llm.summarizer import map_summarize, INTERVAL_MAP_CHAIN_TEMPLATE
+from llm.pyramid import SummaryPyramid
+from benchmarks.bench_grouping import synthetic_transcript
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=2)
+    parser.add_argument('--intervals', type=float, nargs='+', default=[120, 300, 600, 120])
+    parser.add_argument('--llm-latency-ms', type=float, default=200)
+    parser.add_argument('--max-concurrency', type=int, default=8)
+    parser.add_argument('--prebuilt', action='store_true', help="Build the whole pyramid before the requests")
+    args = parser.parse_args()
+
+    chat_model = FakeChatModel(latency=args.llm_latency_ms / 1000)
+    set_clients(chat_model=chat_model)
+    get_metrics().log_path = None
+
+    timeline = TimelineIndex.from_records(get_grouped_transcriptions(synthetic_transcript(args.hours), 60))
+    pyramid = SummaryPyramid(timeline, max_concurrency=args.max_concurrency, background_fill=True)
+    print(f"Synthetic transcript: {args.hours}h, {len(timeline)} chunks, {len(pyramid.leaves)} pyramid leaves\n")
+
+    def direct(interval: float, on_summary) -> list[str]:
+        # One map call per interval, on its raw text (nothing is released before the whole map is done)
+        summaries = map_summarize(chat_model, timeline.grouped(interval).texts(), template=INTERVAL_MAP_CHAIN_TEMPLATE,
+                                  max_concurrency=args.max_concurrency)
+        on_summary(0, summaries[0])
+        return summaries
+
+    def from_pyramid(interval: float, on_summary) -> list[dict]:
+        return pyramid.summarize_intervals(interval, on_summary=on_summary)
+
+    def report(name: str, before: dict, seconds: float, first: float | None = None):
+        after = chat_model.usage.snapshot()
+        first_text = f" first after {first:6.2f} s" if first is not None else ""
+        print(f"{name:<18} {after.get('calls', 0) - before.get('calls', 0):6} LLM calls "
+              f"{after.get('input_tokens', 0) - before.get('input_tokens', 0):9} input tokens "
+              f"{seconds:8.2f} s{first_text}")
+
+    if args.prebuilt:
+        before, start = chat_model.usage.snapshot(), time.perf_counter()
+        pyramid.build()
+        report('pyramid build', before, time.perf_counter() - start)
+        print()
+
+    for method, fn in (('direct', direct), ('pyramid', from_pyramid)):
+        for interval in args.intervals:
+            before, start = chat_model.usage.snapshot(), time.perf_counter()
+            first = []
+            with redirect_stdout(io.StringIO()):
+                fn(interval, lambda i, summary: first.append(time.perf_counter() - start) if i == 0 else None)
+            report(f"{method} {interval:.0f}s", before, time.perf_counter() - start, first[0])
+
+            if method == 'pyramid':
+                # Background fill started by the request (if any), measured on its own
+                before, start = chat_model.usage.snapshot(), time.perf_counter()
+                fill = pyramid._fill_thread
+                if fill is not None and fill.is_alive():
+                    fill.join()
+                    report('  background fill', before, time.perf_counter() - start)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Retrieval latency benchmark: FAISS-only vs. local BM25 vs. hybrid (BM25 + FAISS).
+
+Runs offline: the embedding model is a deterministic fake with a simulated
+network round-trip (`--embedding-latency-ms`), which is what the lexical fast
+path saves. Also reports the size and load time of the BM25 index.
+
+Usage:
+    uv run python -m benchmarks.bench_retrieval [--hours 10] [--queries 200] [--embedding-latency-ms 80]
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+from lexical_index import BM25Index
+from utils import get_grouped_transcriptions, get_grouped_data
+from benchmarks.bench_grouping import synthetic_transcript
+
+
+class SlowFakeEmbedding(DeterministicFakeEmbedding):
+    """
+    Deterministic fake embeddings that sleep like a remote embedding call.
+    """
+    latency: float = 0.0
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--embedding-latency-ms', type=float, default=80)
+    args = parser.parse_args()
+
+    base = get_grouped_transcriptions(synthetic_transcript(args.hours), 60)
+    chunks = get_grouped_data(base, 120)
+    texts = [c['text'] for c in chunks]
+
+    embedding = SlowFakeEmbedding(size=1536, latency=args.embedding_latency_ms / 1000)
+    store = FAISS.from_texts(texts, embedding)
+    lexical_index = BM25Index.from_texts(texts)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bm25.pkl')
+        lexical_index.save(path)
+        start = time.perf_counter()
+        BM25Index.load(path)
+        load_ms = (time.perf_counter() - start) * 1000
+        print(f"{len(texts)} chunks, BM25 index: {os.path.getsize(path) / 1024:.1f} KB on disk, loads in {load_ms:.2f} ms\n")
+
+    rng = random.Random(0)
+    queries = [" ".join(rng.sample(texts[rng.randrange(len(texts))].split(), 3)) for _ in range(args.queries)]
+
+    def faiss_only(query):
+        return store.similarity_search_with_score_by_vector(embedding.embed_query(query), k=3)
+
+    def bm25_only(query):
+        return lexical_index.search(query, k=3)
+
+    def hybrid(query):
+        lexical_index.search(query, k=3)
+        return store.similarity_search_with_score_by_vector(embedding.embed_query(query), k=3)
+
+    for name, fn in {'FAISS only': faiss_only, 'BM25 only (fast path)': bm25_only, 'Hybrid (BM25 + FAISS)': hybrid}.items():
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            fn(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"{name:<24} p50 {percentile(latencies, 50):8.3f} ms   p95 {percentile(latencies, 95):8.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Storage benchmark: pretty-printed per-video JSON files vs. the SQLite video store.
+
+Compares the size on disk and the load time of the raw captions and of the
+grouped chunks, and the time of a timestamp lookup (only the chunks around
+the timestamp are read from the store).
+
+Usage:
+    uv run python -m benchmarks.bench_store [--hours 10] [--repeat 5]
+"""
+import os
+import json
+import random
+import argparse
+import tempfile
+from timeit import repeat
+from store import VideoStore, GROUPED
+from timeline import TimelineIndex
+from utils import get_grouped_transcriptions
+from benchmarks.bench_grouping import synthetic_transcript
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    raw = synthetic_transcript(args.hours)
+    transcription = {'language': 'English', 'language_code': 'en', 'data': raw}
+    grouped = get_grouped_transcriptions(raw, 60)
+    print(f"Synthetic transcript: {args.hours}h, {len(raw)} caption lines, {len(grouped)} chunks\n")
+
+    with tempfile.TemporaryDirectory() as directory:
+        raw_path = os.path.join(directory, 'raw.json')
+        grouped_path = os.path.join(directory, 'grouped.json')
+        # Same format as the previous versions
+        with open(raw_path, 'w') as f:
+            json.dump(transcription, f, indent=5)
+        with open(grouped_path, 'w') as f:
+            json.dump(grouped, f, indent=5)
+
+        database_path = os.path.join(directory, 'videos.sqlite')
+        store = VideoStore(database_path)
+        store.save_transcription('video', transcription)
+        store.save_timeline('video', GROUPED, TimelineIndex.from_records(grouped), window=60)
+        store._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        json_size = os.path.getsize(raw_path) + os.path.getsize(grouped_path)
+        store_size = os.path.getsize(database_path)
+        print(f"{'size, JSON files':<36} {json_size / 1024:9.1f} KiB")
+        print(f"{'size, video store':<36} {store_size / 1024:9.1f} KiB\n")
+
+        def load_json(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+
+        rng = random.Random(0)
+        duration = raw[-1]['start']
+
+        cases = {
+            'raw captions, JSON': lambda: load_json(raw_path),
+            'raw captions, store': lambda: store.load_transcription('video'),
+            'grouped chunks, JSON': lambda: TimelineIndex.from_records(load_json(grouped_path)),
+            'grouped chunks, store': lambda: store.load_timeline('video', GROUPED),
+            'timestamp lookup, JSON': lambda: TimelineIndex.from_records(load_json(grouped_path)).find(rng.uniform(0, duration)),
+            'timestamp lookup, store range read': lambda: store.load_around('video', GROUPED, rng.uniform(0, duration)),
+        }
+
+        for name, fn in cases.items():
+            best = min(repeat(fn, number=1, repeat=args.repeat))
+            print(f"{name:<36} {best * 1000:9.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
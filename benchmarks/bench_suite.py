@@ -0,0 +1,298 @@
+"""
+End-to-end offline benchmark suite, for tracking regressions between releases.
+
+Runs the main stages on synthetic transcripts of several lengths and languages,
+against the fake chat / embedding models (`llm/fake.py`) with a configurable
+latency, output throughput and failure rate (failures are rate-limit errors,
+retried like real ones). No API key or network access is needed.
+
+Measured cases: `get_grouped_transcriptions`, `translate_to_english` (non-English
+transcripts), `create_vector_store`, the `Youtube_Video_Summarizer` and
+`Question_Answering` tools, full agent turns, and the turns of one long chat
+session (history compacted to `CHAT_HISTORY_TOKEN_BUDGET`, so their latency
+should stay flat). Streamed interval summary turns also report the time to
+the first interval summary, on a video without any summary yet (cold: about
+one LLM call, whatever the video length) and on a video whose summary pyramid
+was built at ingestion (warm).
+
+The results are written as JSON: per case, latency percentiles (ms), and the
+calls / failures / tokens sent to each model per run.
+
+Usage:
+    uv run python -m benchmarks.bench_suite [--hours 0.5 2] [--languages English Spanish]
+        [--llm-latency-ms 300] [--tokens-per-second 80] [--failure-rate 0.02] [--output bench_results.json]
+"""
+import io
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from config import (TRANSCRIBED_TEXT_TIME_DURATION, TRANSLATION_TIME_DURATION, VECTOR_STORE_TIME_DURATIONS,
+                    SUMMARIZATION_TIME_DURATION, TRANSLATION_MAX_CONCURRENCY, SUMMARIZATION_MAX_CONCURRENCY,
+                    CHAT_HISTORY_TOKEN_BUDGET, CHAT_HISTORY_KEEP_TURNS, CHAT_HISTORY_SUMMARIZE)
+from utils import get_grouped_transcriptions
+from timeline import TimelineIndex
+from store import VideoStore, set_video_store
+from llm.fake import FakeChatModel, FakeEmbeddings
+from llm.providers import set_clients
+from llm.instrumentation import get_metrics
+from llm.embedding_cache import CachedEmbeddings
+from llm.translator import translate_to_english
+from llm.vector_store import create_vector_store
+from llm.context import ChatContext
+from llm.pyramid import SummaryPyramid
+from llm.agents import create_tools, create_agent, stream_agent, get_message_text, SYSTEM_PROMPT
+from langchain_core.messages import SystemMessage, HumanMessage
+from benchmarks.bench_grouping import synthetic_transcript
+
+# Language -> (language code, vocabulary of the synthetic captions)
+LANGUAGES = {
+    'English': ('en', ["the", "model", "video", "summary", "token", "latency", "index", "vector", "chunk", "time",
+                       "training", "dataset", "network", "layer", "gradient", "memory"]),
+    'Spanish': ('es', ["el", "modelo", "vídeo", "resumen", "latencia", "índice", "vector", "tiempo",
+                       "entrenamiento", "datos", "red", "capa", "gradiente", "memoria"]),
+    'Hindi': ('hi', ["मॉडल", "वीडियो", "सारांश", "समय", "डेटा", "नेटवर्क", "परत", "स्मृति", "प्रशिक्षण", "सूचकांक"]),
+}
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values: list[float], q: int | float) -> float:
+    # Linear interpolation between the closest ranks
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def first_output(outputs: list):
+    # Output of a stage, used as the input of the next cases
+    for output in outputs:
+        if output is not None:
+            return output
+    raise RuntimeError("Every run of the stage failed.")
+
+
+def usage_delta(before: dict[str, int], after: dict[str, int]) -> dict[str, int]:
+    return {name: after.get(name, 0) - before.get(name, 0) for name in after}
+
+
+class Suite:
+    """
+    Runs the cases and collects their measurements.
+    """
+
+    def __init__(self, chat_model: FakeChatModel, embeddings: FakeEmbeddings, directory: str):
+        self.chat_model = chat_model
+        self.embeddings = embeddings
+        self.directory = directory
+        self.results = []
+        set_clients(chat_model=chat_model, embeddings=self.fresh_embeddings())
+        # Benchmark runs stay out of the production metrics log
+        get_metrics().log_path = None
+
+    def fresh_embeddings(self) -> CachedEmbeddings:
+        """
+        Returns the fake embeddings behind an empty embedding cache (every text is embedded again).
+        """
+        database_path = os.path.join(tempfile.mkdtemp(dir=self.directory), 'embedding_cache.sqlite')
+        return CachedEmbeddings(self.embeddings, database_path=database_path, namespace='fake')
+
+    def measure(self, case: str, labels: dict, fn, runs: int, setup=None, first_output: bool = False) -> list:
+        """
+        Calls `fn(setup(i))` `runs` times (the setup is not timed) and records the latencies, the
+        model usage and the runs that failed (e.g. a rate limit that was not retried).
+        With `first_output`, `fn` returns the seconds until its first output, also recorded.
+        """
+        errors = 0
+        latencies = []
+        llm_usage = []
+        embedding_usage = []
+        outputs = []
+        for i in range(runs):
+            argument = setup(i) if setup else i
+            llm_before, embedding_before = self.chat_model.usage.snapshot(), self.embeddings.usage.snapshot()
+
+            start = time.perf_counter()
+            try:
+                with redirect_stdout(io.StringIO()):
+                    outputs.append(fn(argument))
+            except Exception:
+                errors += 1
+                outputs.append(None)
+            latencies.append(time.perf_counter() - start)
+
+            llm_usage.append(usage_delta(llm_before, self.chat_model.usage.snapshot()))
+            embedding_usage.append(usage_delta(embedding_before, self.embeddings.usage.snapshot()))
+
+        latencies.sort()
+        result = {
+            'case': case,
+            **labels,
+            'runs': runs,
+            'errors': errors,
+            'latency_ms': {
+                'mean': 1000 * sum(latencies) / runs,
+                'min': 1000 * latencies[0],
+                'max': 1000 * latencies[-1],
+                **{f"p{q}": 1000 * percentile(latencies, q) for q in PERCENTILES}
+            },
+            # Mean per run
+            'llm': {name: sum(u.get(name, 0) for u in llm_usage) / runs
+                    for name in ('calls', 'failures', 'input_tokens', 'output_tokens')},
+            'embeddings': {name: sum(u.get(name, 0) for u in embedding_usage) / runs
+                           for name in ('calls', 'failures', 'texts', 'input_tokens')},
+        }
+        if first_output and errors < runs:
+            first_latencies = sorted(output for output in outputs if output is not None)
+            result['first_output_ms'] = {f"p{q}": 1000 * percentile(first_latencies, q) for q in PERCENTILES}
+        self.results.append(result)
+
+        print(f"{case:<22} {labels.get('language', ''):<8} {labels.get('hours', ''):>5}h "
+              f"p50 {result['latency_ms']['p50']:10.1f} ms  p95 {result['latency_ms']['p95']:10.1f} ms  "
+              f"LLM calls {result['llm']['calls']:7.1f}  embedding calls {result['embeddings']['calls']:6.1f}")
+        return outputs
+
+    def run_video(self, hours: float, language: str, repeat: int, queries: int, turns: int, seed: int):
+        language_code, words = LANGUAGES[language]
+        raw = synthetic_transcript(hours, seed=seed, words=words)
+        labels = {'hours': hours, 'language': language, 'caption_lines': len(raw)}
+        rng = random.Random(seed)
+
+        chunks = self.measure('grouping', labels,
+                              lambda _: get_grouped_transcriptions(raw, TRANSCRIBED_TEXT_TIME_DURATION), repeat)
+        chunks = first_output(chunks)
+        labels['chunks'] = len(chunks)
+
+        if language != 'English':
+            source_chunks = chunks
+            chunks = self.measure('translation', labels, lambda _: translate_to_english(
+                source_chunks, from_lang=language_code, max_duration=TRANSLATION_TIME_DURATION,
+                max_concurrency=TRANSLATION_MAX_CONCURRENCY), repeat)
+            chunks = first_output(chunks)
+        timeline = TimelineIndex.from_records(chunks)
+
+        def new_vector_db_path(_) -> str:
+            # Nothing reused from the previous run: new index folder and empty embedding cache
+            set_clients(embeddings=self.fresh_embeddings())
+            return tempfile.mkdtemp(dir=self.directory)
+
+        def build_vector_store(path: str) -> str:
+            create_vector_store(timeline, granularities=VECTOR_STORE_TIME_DURATIONS, vector_db_path=path)
+            return path
+
+        vector_db_path = first_output(
+            self.measure('vector_store', labels, build_vector_store, repeat, setup=new_vector_db_path))
+
+        tools = {t.name: t for t in create_tools(timeline, vector_db_path=vector_db_path,
+                                                 summarization_group_time=SUMMARIZATION_TIME_DURATION,
+                                                 map_max_concurrency=SUMMARIZATION_MAX_CONCURRENCY)}
+        self.measure('summarize_video', labels, lambda _: tools['Youtube_Video_Summarizer'].invoke({}), repeat)
+
+        def random_question(_) -> str:
+            return f"What do they say about the {' '.join(rng.sample(words, 2))}?"
+
+        self.measure('qna_rag', labels, lambda query: tools['Question_Answering'].invoke({'query': query}),
+                     queries, setup=random_question)
+
+        agent = create_agent(timeline, vector_db_path=vector_db_path, tools=list(tools.values()))
+        duration = timeline.ends[-1]
+
+        def random_turn(i) -> str:
+            # Mix of the tools a chat session uses (Q&A first, then timestamp lookups and summaries)
+            kind = ('qna', 'qna', 'timestamp', 'interval_summary', 'summary')[i % 5]
+            if kind == 'qna':
+                return random_question(i)
+            if kind == 'timestamp':
+                t = int(rng.uniform(0, duration))
+                return f"What happens at {t // 60}:{t % 60:02d}?"
+            if kind == 'interval_summary':
+                return "Summarize the video every 10 minutes"
+            return "Summarize the video"
+
+        self.measure('agent_turn', labels, lambda message: agent.invoke(
+            {'messages': [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=message)]}),
+            turns, setup=random_turn)
+
+        def interval_summary_turn(turn_agent) -> float:
+            start = time.perf_counter()
+            first = None
+            messages = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content="Summarize the video every 5 minutes")]
+            for kind, _ in stream_agent(turn_agent, messages):
+                if kind == 'interval_summary' and first is None:
+                    first = time.perf_counter() - start
+            return first
+
+        def new_agent(video_id: str | None = None):
+            return create_agent(timeline, vector_db_path=vector_db_path, video_id=video_id,
+                                map_max_concurrency=SUMMARIZATION_MAX_CONCURRENCY)
+
+        # Cold: nothing summarized yet (the agent turns above may have summarized intervals in their own tools)
+        self.measure('interval_summary_turn', labels, interval_summary_turn, repeat,
+                     setup=lambda _: new_agent(), first_output=True)
+
+        # Warm: summary pyramid built at ingestion (not timed), and saved in a separate store
+        store = VideoStore(os.path.join(tempfile.mkdtemp(dir=self.directory), 'videos.sqlite'))
+        set_video_store(store)
+        with redirect_stdout(io.StringIO()):
+            SummaryPyramid(timeline, video_id='bench', store=store,
+                           max_concurrency=SUMMARIZATION_MAX_CONCURRENCY).build()
+        self.measure('interval_summary_turn_warm', labels, interval_summary_turn, repeat,
+                     setup=lambda _: new_agent('bench'), first_output=True)
+
+        chat_context = ChatContext(SYSTEM_PROMPT, token_budget=CHAT_HISTORY_TOKEN_BUDGET,
+                                   keep_turns=CHAT_HISTORY_KEEP_TURNS, summarize=CHAT_HISTORY_SUMMARIZE)
+
+        def session_turn(message: str):
+            # Compaction included (the chat runs it between turns)
+            result = agent.invoke({'messages': chat_context.messages(message)})
+            chat_context.add_turn(message, get_message_text(result['messages'][-1]))
+            chat_context.compact()
+
+        self.measure('session_turn', labels, session_turn, turns, setup=random_turn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, nargs='+', default=[0.5, 2])
+    parser.add_argument('--languages', nargs='+', default=['English', 'Spanish'], choices=sorted(LANGUAGES))
+    parser.add_argument('--repeat', type=int, default=3, help="Runs of the ingestion and summary cases")
+    parser.add_argument('--queries', type=int, default=50, help="Runs of the Q&A case")
+    parser.add_argument('--turns', type=int, default=10, help="Runs of the agent turn case")
+    parser.add_argument('--llm-latency-ms', type=float, default=300)
+    parser.add_argument('--tokens-per-second', type=float, default=80, help="Output throughput of the fake LLM (0: instant)")
+    parser.add_argument('--embedding-latency-ms', type=float, default=80)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Probability that a model call is rate-limited")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    chat_model = FakeChatModel(latency=args.llm_latency_ms / 1000, tokens_per_second=args.tokens_per_second,
+                               failure_rate=args.failure_rate, seed=args.seed)
+    embeddings = FakeEmbeddings(latency=args.embedding_latency_ms / 1000, failure_rate=args.failure_rate, seed=args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        suite = Suite(chat_model, embeddings, directory)
+        for hours in args.hours:
+            for language in args.languages:
+                suite.run_video(hours, language, args.repeat, args.queries, args.turns, args.seed)
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'results': suite.results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import os
+
+languages = [
+    'en',       # English
+    'hi',       # Hindi
+    'es',       # Spanish
+    'fr',       # French
+    'de',       # German
+    'pt',       # Portuguese
+    'ru',       # Russian
+    'ar',       # Arabic
+    'ja',       # Japanese
+    'ko',       # Korean
+    'zh-Hans',  # Chinese Simplified
+    'zh-Hant',  # Chinese Traditional
+    'id',       # Indonesian
+    'it',       # Italian
+    'bn',       # Bengali
+]
+
+# Directory paths (transcriptions / translations: JSON files of previous versions, imported into the video store)
+TRANSLATION_DIR = 'translations'
+TRANSCRIPTION_DIR = 'transcriptions'
+VECTOR_DB_PATH = os.path.join('db', 'faiss_db')
+LLM_CACHE_PATH = os.path.join('db', 'llm_cache.sqlite')
+ANSWER_CACHE_PATH = os.path.join('db', 'answer_cache.sqlite')
+EMBEDDING_CACHE_PATH = os.path.join('db', 'embedding_cache.sqlite')
+VIDEO_STORE_PATH = os.path.join('db', 'videos.sqlite')  # Captions, grouped chunks and translations of every video
+METRICS_LOG_PATH = os.path.join('logs', 'metrics.jsonl')  # One JSON record per finished stage run (None to disable)
+
+# Model provider: 'azure', 'gemini' or 'fake' (offline), overridden by the LLM_PROVIDER environment variable
+LLM_PROVIDER = 'azure'
+GEMINI_CHAT_MODEL = 'gemini-2.5-flash'
+GEMINI_EMBEDDING_MODEL = 'models/gemini-embedding-001'
+
+# Shared HTTP connection pool of the model clients (change as needed). Azure only: the Gemini clients
+# (Google client library, gRPC by default) can't use it, each keeps its own channel for the whole process
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+HTTP_KEEPALIVE_EXPIRY = 30  # Seconds an idle connection is kept open
+HTTP_CONNECT_TIMEOUT = 10  # Seconds
+HTTP_READ_TIMEOUT = 120  # Seconds (long completions)
+
+# Transcript source: 'youtube', a directory of <video_id>.json files or the base URL of a fixture server
+# (offline runs, benchmarks), overridden by the TRANSCRIPT_SOURCE environment variable
+TRANSCRIPT_SOURCE = 'youtube'
+FETCH_SESSION_POOL_SIZE = 8  # Pooled sessions (transcripts fetched at the same time)
+FETCH_RATE_PER_SECOND = 5  # Fetch attempts started per second, across all threads (0 for no limit)
+FETCH_BURST = 10  # Attempts that may start at once after an idle period
+FETCH_MAX_RETRIES = 4  # Attempts per video on throttling / network errors (jittered exponential backoff)
+FETCH_TIMEOUT = 30  # Seconds (fixture server source)
+FETCH_VERIFY_SSL = True  # Set to False to avoid SSL errors behind an intercepting proxy
+
+# Per chunk time durations (in seconds, change as needed)
+TRANSCRIBED_TEXT_TIME_DURATION = 60  # ~1 minute per chunk
+TRANSLATION_TIME_DURATION = 120  # ~2 minutes per chunk
+VECTOR_STORE_TIME_DURATIONS = (60, 120, 600)  # One index per duration (fine: ~1 minute, ..., coarse: ~10 minutes per chunk)
+SUMMARIZATION_TIME_DURATION = 120  # ~2 minutes per chunk
+
+# Token-aware packing (opt-in, in tokens of the chat model): translation blocks / summarization chunks are cut by
+# a token budget instead of by the durations above, so every call gets about the same amount of text whatever the
+# speech rate (None to keep the durations)
+TRANSLATION_TOKEN_BUDGET = None  # e.g. 2000
+SUMMARIZATION_TOKEN_BUDGET = None  # e.g. 3000
+
+# Library index: one vector index over every ingested video (questions across a channel / playlist)
+LIBRARY_INDEX_PATH = os.path.join('db', 'library')
+LIBRARY_INDEX_GRANULARITY = 120  # Chunk duration (one of VECTOR_STORE_TIME_DURATIONS: its embeddings are cached)
+LIBRARY_HNSW_THRESHOLD = 50000  # Vectors above which an HNSW graph replaces the exact search
+LIBRARY_EXACT_SEARCH_MAX_CHUNKS = 20000  # Searches restricted to at most this many chunks stay exact
+
+# Maximum number of parallel LLM calls while summarizing chunks
+SUMMARIZATION_MAX_CONCURRENCY = 8
+
+# Questions at least this similar (cosine) to an already answered one reuse its answer
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+
+# Maximum number of parallel LLM calls while translating blocks
+TRANSLATION_MAX_CONCURRENCY = 8
+
+# Tree reduce of the chunk summaries (token budget and number of summaries per reduce call)
+SUMMARIZATION_REDUCE_TOKEN_BUDGET = 6000
+SUMMARIZATION_REDUCE_FAN_IN = 8
+
+# Summary pyramid: interval summaries (and the video summary) are assembled from saved summaries of aligned windows
+SUMMARY_PYRAMID_BASE_WINDOW = 60  # Seconds per leaf
+SUMMARY_PYRAMID_AT_INGESTION = False  # Build it while ingesting (extra LLM calls, every summary is fast later)
+SUMMARY_PYRAMID_BACKGROUND_FILL = True  # Else build it in the background after the first interval summaries
+
+# Chat history sent to the agent with every message (tokens, change as needed)
+CHAT_HISTORY_TOKEN_BUDGET = 4000  # Past turns and the summary of the older ones
+CHAT_HISTORY_KEEP_TURNS = 2  # Most recent turns always sent whole
+CHAT_HISTORY_SUMMARIZE = True  # Summarize the turns that no longer fit (else keep a short excerpt of them)
+CHAT_TOOL_OUTPUT_MAX_TOKENS = 300  # Tool outputs already used by the agent above this are replaced by a reference
+
+# Batch ingestion: number of videos in each stage at the same time (change as needed)
+INGEST_FETCH_WORKERS = 8
+INGEST_TRANSLATE_WORKERS = 2
+INGEST_EMBED_WORKERS = 4
+
+# Streaming ingestion: translated blocks are embedded while the translation runs
+PIPELINE_QUEUE_SIZE = 32  # Items buffered between two stages
+PIPELINE_BATCH_SIZE = 64  # Chunk texts per embedding call
+
+# Instrumentation: estimated cost in USD per million tokens (change for your models / deployment)
+LLM_PROMPT_PRICE_PER_MILLION = 2.50
+LLM_COMPLETION_PRICE_PER_MILLION = 10.00
+EMBEDDING_PRICE_PER_MILLION = 0.10
+METRICS_PROMETHEUS_ENDPOINT = True  # Serve the per-stage metrics at GET /metrics (Prometheus text format)
+
+# HTTP server mode (change as needed)
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8080
+SERVER_WORKERS = 16  # Threads running the blocking work (LLM calls, searches, ingestion)
+SERVER_MAX_VIDEOS = 64  # Videos whose tools and compiled agent are kept in memory (LRU)
+SERVER_MAX_SESSIONS = 1000  # Chat sessions kept in memory (LRU)
+SERVER_MAX_JOBS = 1000  # Ingestion jobs kept for GET /jobs (the oldest finished ones are dropped first)
+
+
+def validate_config():
+    """
+    Checks that the configured chunk durations are consistent.
+
+    Raises:
+        ValueError: If a chunk duration is smaller than the transcribed text chunk duration.
+    """
+    if TRANSLATION_TIME_DURATION < TRANSCRIBED_TEXT_TIME_DURATION:
+        raise ValueError(
+            "Translation chunk time duration can't be lesser than transcribed text time duration!")
+
+    if min(VECTOR_STORE_TIME_DURATIONS) < TRANSCRIBED_TEXT_TIME_DURATION:
+        raise ValueError(
+            "Vector store chunk time duration can't be lesser than transcribed text time duration!")
+
+    if SUMMARIZATION_TIME_DURATION < TRANSCRIBED_TEXT_TIME_DURATION:
+        raise ValueError(
+            "Summarization chunk time duration can't be lesser than transcribed text time duration!")
+
+    if SUMMARY_PYRAMID_BASE_WINDOW < TRANSCRIBED_TEXT_TIME_DURATION:
+        raise ValueError(
+            "Summary pyramid base window can't be lesser than transcribed text time duration!")
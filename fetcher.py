@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import queue
+import random
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+import requests
+from requests.adapters import HTTPAdapter
+from youtube_transcript_api import YouTubeTranscriptApi, RequestBlocked, YouTubeRequestFailed
+from config import (languages, TRANSCRIPT_SOURCE, FETCH_SESSION_POOL_SIZE, FETCH_RATE_PER_SECOND, FETCH_BURST,
+                    FETCH_MAX_RETRIES, FETCH_TIMEOUT, FETCH_VERIFY_SSL)
+from llm.instrumentation import get_metrics
+
+# Defaults (change as needed)
+DEFAULT_POOL_SIZE = 8  # Sessions (parallel fetches beyond it wait for a free one)
+DEFAULT_RATE = 5.0  # Fetches started per second
+DEFAULT_BURST = 10  # Fetches that may start at once after an idle period
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_TIMEOUT = 30  # Seconds
+BACKOFF_BASE = 1.0  # Seconds before the first retry (doubled at every attempt, full jitter)
+BACKOFF_MAX = 60.0
+
+# Errors worth retrying: throttling, blocked requests and transient network / server failures
+RETRYABLE_ERRORS = (RequestBlocked, YouTubeRequestFailed, requests.ConnectionError, requests.Timeout)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is not None and (response.status_code == 429 or response.status_code >= 500)
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+def get_retry_after(error: Exception) -> float:
+    """
+    Returns the delay asked by the server (`Retry-After` header, in seconds), else 0.
+    """
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('Retry-After', 0)) if response is not None else 0
+    except ValueError:
+        return 0  # HTTP date: the backoff applies
+
+
+def create_session(pool_size: int, verify: bool = True) -> requests.Session:
+    """
+    Returns a session keeping up to `pool_size` keep-alive connections per host.
+    """
+    session = requests.Session()
+    session.verify = verify
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, at most `capacity` saved up.
+    Every caller reserves a token and sleeps until it is due, so waiting callers are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Takes one token, waiting until it is available.
+
+        Returns:
+            The seconds waited.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class YouTubeSource:
+    """
+    Transcripts fetched from YouTube. Every fetch borrows one of `pool_size`
+    API clients, each with its own pooled session (the transcript API keeps
+    headers and cookies on its session), so connections are reused across videos.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, verify: bool = True):
+        """
+        Args:
+            pool_size: Number of sessions (fetches running at once beyond it wait for a free session).
+            verify: Whether to verify SSL certificates (disable only behind an intercepting proxy).
+        """
+        self._clients = queue.Queue()
+        for _ in range(pool_size):
+            self._clients.put(YouTubeTranscriptApi(http_client=create_session(pool_size, verify)))
+
+    @contextmanager
+    def _client(self) -> Iterator[YouTubeTranscriptApi]:
+        client = self._clients.get()
+        try:
+            yield client
+        finally:
+            self._clients.put(client)
+
+    def fetch(self, video_id: str) -> dict:
+        with self._client() as client:
+            res = client.fetch(video_id, languages=languages)
+        return {
+            'language': res.language,
+            'language_code': res.language_code,
+            'data': res.to_raw_data()
+        }
+
+
+class DirectorySource:
+    """
+    Transcripts read from `<video_id>.json` files (same format as the transcription
+    JSON files: language, language_code and the caption lines), e.g. fixtures for offline runs.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def fetch(self, video_id: str) -> dict:
+        with open(os.path.join(self.directory, f"{video_id}.json"), 'r') as f:
+            return json.load(f)
+
+
+class HTTPSource:
+    """
+    Transcripts served as `<base_url>/<video_id>.json` (same format as `DirectorySource`),
+    e.g. by a fixture server or an internal mirror, over one pooled session.
+    """
+
+    def __init__(self, base_url: str, pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT,
+                 verify: bool = True):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = create_session(pool_size, verify)
+
+    def fetch(self, video_id: str) -> dict:
+        response = self.session.get(f"{self.base_url}/{video_id}.json", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+def create_source(spec: str = 'youtube', pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT,
+                  verify: bool = True):
+    """
+    Returns the transcript source of `spec`: 'youtube', the base URL of a
+    fixture server ('http(s)://...') or a directory of `<video_id>.json` files.
+    """
+    if spec == 'youtube':
+        return YouTubeSource(pool_size, verify=verify)
+    if spec.startswith(('http://', 'https://')):
+        return HTTPSource(spec, pool_size, timeout=timeout, verify=verify)
+    return DirectorySource(spec)
+
+
+class TranscriptFetcher:
+    """
+    Fetches transcripts from a source for many videos concurrently.
+
+    Every attempt first takes a token from a shared token bucket, so the
+    request rate stays under `rate` per second whatever the number of
+    threads fetching at once. Throttled, blocked and transient network
+    failures are retried with exponential backoff and full jitter (or the
+    `Retry-After` delay of the server), so concurrent fetches that were
+    throttled together don't all retry at the same moment. Other errors
+    (no transcript, unavailable video) fail immediately.
+    """
+
+    def __init__(self, source, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = BACKOFF_BASE):
+        """
+        Args:
+            source: Object with a `fetch(video_id) -> dict` method (`YouTubeSource`, `DirectorySource`, ...).
+            rate: Maximum number of attempts started per second (0 for no limit).
+            burst: Attempts that may start at once after an idle period.
+            max_retries: Maximum number of attempts per video.
+            backoff_base: Maximum delay before the first retry, in seconds (doubled at every attempt).
+        """
+        self.source = source
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+        self._lock = threading.Lock()
+        self._counts = {'fetched': 0, 'failed': 0, 'retries': 0, 'throttled_seconds': 0.0}
+
+    def _count(self, name: str, value: float = 1):
+        with self._lock:
+            self._counts[name] += value
+
+    def fetch(self, video_id: str) -> dict:
+        """
+        Returns the transcription of the video (`{'language', 'language_code', 'data'}`).
+
+        Raises:
+            Exception: The error of the source, if not retryable or after the last attempt.
+        """
+        for attempt in range(self.max_retries):
+            if self.bucket:
+                self._count('throttled_seconds', self.bucket.acquire())
+            try:
+                transcription = self.source.fetch(video_id)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries - 1:
+                    self._count('failed')
+                    raise
+                self._count('retries')
+                get_metrics().record_retry()
+                delay = random.uniform(0, min(BACKOFF_MAX, self.backoff_base * 2 ** attempt))
+                time.sleep(max(delay, get_retry_after(e)))
+            else:
+                self._count('fetched')
+                return transcription
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts, throttled_seconds=round(self._counts['throttled_seconds'], 3))
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> TranscriptFetcher:
+    """
+    Returns the process-wide fetcher of the configured source (`TRANSCRIPT_SOURCE`
+    environment variable, else `config.TRANSCRIPT_SOURCE`), created on first use.
+    """
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            source = create_source(os.environ.get('TRANSCRIPT_SOURCE', TRANSCRIPT_SOURCE), FETCH_SESSION_POOL_SIZE,
+                                   timeout=FETCH_TIMEOUT, verify=FETCH_VERIFY_SSL)
+            _fetcher = TranscriptFetcher(source, rate=FETCH_RATE_PER_SECOND, burst=FETCH_BURST,
+                                         max_retries=FETCH_MAX_RETRIES)
+        return _fetcher
@@ -0,0 +1,342 @@
+import os
+import re
+import json
+import time
+import threading
+from typing import Callable
+from contextlib import nullcontext, ExitStack
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import (TRANSLATION_DIR, TRANSCRIPTION_DIR, VECTOR_DB_PATH, TRANSCRIBED_TEXT_TIME_DURATION,
+                    TRANSLATION_TIME_DURATION, VECTOR_STORE_TIME_DURATIONS, TRANSLATION_MAX_CONCURRENCY,
+                    INGEST_FETCH_WORKERS, INGEST_TRANSLATE_WORKERS, INGEST_EMBED_WORKERS, SUMMARIZATION_MAX_CONCURRENCY,
+                    PIPELINE_QUEUE_SIZE, PIPELINE_BATCH_SIZE, SUMMARY_PYRAMID_BASE_WINDOW, TRANSLATION_TOKEN_BUDGET,
+                    LIBRARY_INDEX_GRANULARITY)
+from utils import extract_video_id, get_grouped_transcriptions
+from timeline import TimelineIndex
+from pipeline import IngestionPipeline
+from store import VideoStore, RAW, GROUPED, TRANSLATED, get_video_store
+from fetcher import TranscriptFetcher, get_fetcher
+from llm.translator import translate_to_english
+from llm.vector_store import create_vector_store, replace_vector_store, get_missing_granularities
+from llm.pyramid import SummaryPyramid, summarize_leaves
+from llm.library_index import get_library_index
+from llm.providers import get_embeddings
+from llm.instrumentation import stage
+
+VIDEO_ID_PATTERN = re.compile(r"^[\w-]{11}$")
+
+
+def fetch_transcription(video_id: str, fetcher: TranscriptFetcher, store: VideoStore) -> bool:
+    """
+    Saves the transcription of the video in the store, fetching it only if it is not saved yet
+    (a JSON file written by a previous version is imported instead).
+
+    Returns:
+        Whether the transcription was fetched.
+    """
+    if store.has(video_id, RAW):
+        print('Transcription already exists.')
+        return False
+
+    transcription_file_path = os.path.join(TRANSCRIPTION_DIR, f"{video_id}.json")
+    if (os.path.exists(transcription_file_path)):
+        print('Transcription already exists (importing the JSON file).')
+        with open(transcription_file_path, 'r') as f:
+            store.save_transcription(video_id, json.load(f))
+        return False
+
+    print("Transcription started...")
+    transcripted_data = fetcher.fetch(video_id)
+    print("Transcription done.")
+    store.save_transcription(video_id, transcripted_data)
+
+    return True
+
+
+def get_grouped_chunks(video_id: str, store: VideoStore) -> TimelineIndex:
+    """
+    Returns the transcription merged into `TRANSCRIBED_TEXT_TIME_DURATION` chunks, grouping it only once.
+    """
+    grouped = store.load_timeline(video_id, GROUPED, window=TRANSCRIBED_TEXT_TIME_DURATION)
+    if grouped is None:
+        transcripted_data = store.load_transcription(video_id)
+        grouped = TimelineIndex.from_records(get_grouped_transcriptions(
+            transcriptions=transcripted_data['data'], time=TRANSCRIBED_TEXT_TIME_DURATION))
+        store.save_timeline(video_id, GROUPED, grouped, window=TRANSCRIBED_TEXT_TIME_DURATION)
+
+    return grouped
+
+
+def translate_transcription(video_id: str, language_code: str, grouped: TimelineIndex, store: VideoStore,
+                            on_block: Callable[[int, list[dict]], None] | None = None) -> tuple[TimelineIndex, str]:
+    """
+    Returns the English translation of the grouped transcription, translating it only if it is not saved yet.
+    While translating, `on_block` receives every translated block as soon as it is available.
+
+    Segments the model kept dropping are saved with their original text, and their
+    journal is kept: the next run translates them again (and only them).
+
+    Returns:
+        The translated chunks, and the status of the translation: 'done' (translated now),
+        'cached' (already saved) or 'partial' (some segments are still untranslated).
+    """
+    os.makedirs(TRANSLATION_DIR, exist_ok=True)
+    translation_journal_path = os.path.join(
+        TRANSLATION_DIR, f"{video_id}.journal.jsonl")
+
+    translated = store.load_timeline(video_id, TRANSLATED, window=TRANSCRIBED_TEXT_TIME_DURATION)
+    if translated is not None and not os.path.exists(translation_journal_path):
+        print('Translation already exists.')
+        return translated, 'cached'
+
+    translation_file_path = os.path.join(TRANSLATION_DIR, f"{video_id}.json")
+    if (os.path.exists(translation_file_path)):
+        print('Translation already exists (importing the JSON file).')
+        with open(translation_file_path, 'r') as f:
+            translated = TimelineIndex.from_records(json.load(f))
+        store.save_timeline(video_id, TRANSLATED, translated, window=TRANSCRIBED_TEXT_TIME_DURATION)
+        return translated, 'cached'
+
+    # Finished blocks are journaled, so an interrupted (or partial) translation resumes where it stopped
+    translated_output = translate_to_english(
+        chunks=grouped.to_records(), from_lang=language_code,
+        max_duration=TRANSLATION_TIME_DURATION if TRANSLATION_TOKEN_BUDGET is None else None,
+        max_tokens=TRANSLATION_TOKEN_BUDGET, journal_path=translation_journal_path,
+        max_concurrency=TRANSLATION_MAX_CONCURRENCY, on_block=on_block)
+    translated = TimelineIndex.from_records(translated_output)
+    store.save_timeline(video_id, TRANSLATED, translated, window=TRANSCRIBED_TEXT_TIME_DURATION)
+
+    untranslated = sum(1 for chunk in translated_output if chunk.get('untranslated'))
+    if untranslated:
+        print(f"{untranslated} segments kept their original text, they are translated again on the next run.")
+        return translated, 'partial'
+
+    os.remove(translation_journal_path)
+    return translated, 'done'
+
+
+def create_pipeline(summarize: bool = False) -> IngestionPipeline:
+    """
+    Returns a streaming pipeline that embeds the vector store chunks (and optionally
+    summarizes the summary pyramid leaves) of the blocks submitted to it.
+    """
+    def summarize_texts(texts: list[str]) -> list[str]:
+        return summarize_leaves(texts, max_concurrency=SUMMARIZATION_MAX_CONCURRENCY)
+
+    # The pipeline threads don't inherit the caller's stage: their calls are counted under 'embed' / 'pyramid'
+    return IngestionPipeline(stage('embed')(get_embeddings().embed_documents), granularities=VECTOR_STORE_TIME_DURATIONS,
+                             summarize=stage('pyramid')(summarize_texts) if summarize else None,
+                             summary_window=SUMMARY_PYRAMID_BASE_WINDOW,
+                             queue_size=PIPELINE_QUEUE_SIZE, batch_size=PIPELINE_BATCH_SIZE)
+
+
+def ingest_video(video_id: str, fetcher: TranscriptFetcher | None = None,
+                 stage_limits: dict[str, threading.Semaphore] | None = None,
+                 summarize: bool = False) -> tuple[TimelineIndex, dict[str, str]]:
+    """
+    Runs the ingestion of one video: fetch -> group -> translate (if needed) -> embed -> library index.
+
+    Every stage reuses the work saved by previous runs (transcription, grouped chunks and
+    translation in the video store, vector store). A partial translation (segments the
+    model kept dropping) is retried by the next run, which rebuilds the vector store (next to
+    the current one, swapped in once complete) if any of those segments got translated;
+    the video is only added to the library index once it is fully translated.
+    When the vector store has to be built, translation, embedding and the summary
+    pyramid leaves are pipelined: every translated block is embedded (through the
+    embedding cache) and its leaves summarized while the next blocks are still being
+    translated, so the final vector store build only reads the cached embeddings, and
+    the pyramid build only summarizes the levels above the leaves.
+
+    Args:
+        video_id: YouTube video id.
+        fetcher: Transcript fetcher (the process-wide one if not given).
+        stage_limits: Optional semaphores ('fetch', 'translate', 'embed') limiting how many
+                      videos are in each stage at the same time (a video embedding its blocks
+                      while they are translated holds both 'translate' and 'embed').
+        summarize: Whether to also build the summary pyramid (interval summaries, and the
+                   whole-video summary from its root).
+
+    Returns:
+        The English timeline of the video, and the status of every stage
+        ('done', 'cached', 'not needed', 'partial' for the translation, or
+        'failed' / 'pending' for the library index).
+    """
+    stage_limits = stage_limits or {}
+    stages = {}
+    vector_db_path = os.path.join(VECTOR_DB_PATH, video_id)
+    store = get_video_store()
+
+    with stage_limits.get('fetch', nullcontext()), stage('fetch', video_id=video_id):
+        fetched = fetch_transcription(video_id, fetcher or get_fetcher(), store)
+    stages['fetch'] = 'done' if fetched else 'cached'
+
+    transcription_lang, transcription_lang_code = store.get_language(video_id)
+    print(f"Transcription Language: {transcription_lang}")
+
+    # Merge the transcriptions into specified time chunks
+    with stage('group', video_id=video_id):
+        timeline = get_grouped_chunks(video_id, store)
+
+    # Translate the transcriptions, if not in english
+    stages['translate'] = 'not needed'
+    pipeline = None
+    partial = None
+    with ExitStack() as limits:
+        needs_translation = 'english' not in transcription_lang.lower()
+        if needs_translation:
+            limits.enter_context(stage_limits.get('translate', nullcontext()))
+            if (os.path.exists(os.path.join(TRANSLATION_DIR, f"{video_id}.journal.jsonl"))
+                    and os.path.exists(vector_db_path)):
+                # Built from a partial translation: compared with the retried one below
+                partial = store.load_timeline(video_id, TRANSLATED, window=TRANSCRIBED_TEXT_TIME_DURATION)
+
+        # Embeds (and summarizes) the translated blocks while the translation runs: the pipeline
+        # counts against the 'embed' limit for as long as it exists
+        if get_missing_granularities(vector_db_path, VECTOR_STORE_TIME_DURATIONS):
+            limits.enter_context(stage_limits.get('embed', nullcontext()))
+            pipeline = create_pipeline(summarize=summarize)
+
+        try:
+            if needs_translation:
+                with stage('translate', video_id=video_id):
+                    timeline, stages['translate'] = translate_transcription(
+                        video_id, transcription_lang_code, timeline, store,
+                        on_block=pipeline.submit if pipeline else None)
+
+            if pipeline:
+                if stages['translate'] not in ('done', 'partial'):
+                    # Already in English (or translated before): the whole transcript is one block
+                    pipeline.submit(0, timeline.to_records())
+                pipeline_stats = pipeline.close()
+                print(f"Pipeline: {pipeline_stats}")
+        except Exception:
+            if pipeline:
+                try:
+                    pipeline.close()
+                except Exception:
+                    pass  # The original error is the relevant one
+            raise
+
+    # Create vector store for RAG (the embeddings are already cached by the pipeline)
+    with stage_limits.get('embed', nullcontext()), stage('embed', video_id=video_id):
+        if partial is not None and partial.texts() != timeline.texts():
+            # Some dropped segments are translated now (the unchanged chunks hit the embedding cache)
+            replace_vector_store(timeline, granularities=VECTOR_STORE_TIME_DURATIONS, vector_db_path=vector_db_path)
+            created = True
+        else:
+            created = create_vector_store(timeline, granularities=VECTOR_STORE_TIME_DURATIONS,
+                                          vector_db_path=vector_db_path)
+    stages['embed'] = 'done' if created else 'cached'
+
+    # Cross-video index (its chunks are one of the vector store granularities: embeddings already cached)
+    if stages['translate'] == 'partial':
+        # Videos can't be replaced in the library index: added by the run that completes the translation
+        stages['library'] = 'pending'
+    else:
+        try:
+            with stage_limits.get('embed', nullcontext()):
+                added = get_library_index().add_video(video_id, timeline, granularity=LIBRARY_INDEX_GRANULARITY)
+            stages['library'] = 'done' if added else 'cached'
+        except ValueError as e:
+            # Library built with other embeddings (namespace / dimension): the video itself is still usable
+            print(f"Video not added to the library index: {e}")
+            stages['library'] = 'failed'
+
+    # Every interval summary (and the video summary) is then assembled from saved summaries
+    if summarize:
+        pyramid = SummaryPyramid(timeline, base_window=SUMMARY_PYRAMID_BASE_WINDOW, video_id=video_id, store=store,
+                                 max_concurrency=SUMMARIZATION_MAX_CONCURRENCY)
+        # Leaves summarized by the pipeline (saved now: saving the translation deleted the video summaries)
+        leaves = pipeline.summaries if pipeline else {}
+        pyramid.add_leaves(leaves)
+        stages['pyramid'] = 'done' if pyramid.build() or leaves else 'cached'
+
+    return timeline, stages
+
+
+def read_video_ids(input_path: str) -> list[str]:
+    """
+    Reads the videos to ingest from a text file (one URL or video id per line)
+    or a JSON Lines file (objects with a 'url', 'video_id' or 'id' key).
+
+    Blank lines, `#` comments, duplicates and lines without a video are skipped.
+    """
+    video_ids = []
+    with open(input_path, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            if line.startswith('{'):
+                record = json.loads(line)
+                value = record.get('url') or record.get('video_id') or record.get('id') or ''
+            else:
+                value = line
+
+            video_id = extract_video_id(value) or (value if VIDEO_ID_PATTERN.match(value) else None)
+            if video_id is None:
+                print(f"Line {line_number}: no YouTube URL or video id, skipped.")
+            elif video_id not in video_ids:
+                video_ids.append(video_id)
+
+    return video_ids
+
+
+def ingest_batch(video_ids: list[str], report_path: str, fetch_workers: int = INGEST_FETCH_WORKERS,
+                 translate_workers: int = INGEST_TRANSLATE_WORKERS, embed_workers: int = INGEST_EMBED_WORKERS,
+                 summarize: bool = False) -> list[dict]:
+    """
+    Ingests many videos in parallel, without any user interaction.
+
+    Each stage has its own worker limit, so e.g. many transcripts can be fetched
+    while a few videos are being translated. Work that already exists is skipped.
+    Transcripts go through the shared fetcher (pooled sessions, rate limit and
+    retries with backoff), whatever the number of videos fetched at once.
+    One status record per video is appended to `report_path` (JSON Lines) as
+    soon as the video is finished.
+
+    Args:
+        video_ids: Videos to ingest.
+        report_path: Path of the JSON Lines status report.
+        fetch_workers: Maximum number of videos being fetched at the same time.
+        translate_workers: Maximum number of videos being translated at the same time.
+        embed_workers: Maximum number of videos being embedded at the same time.
+        summarize: Whether to also build the summary pyramid of every video.
+
+    Returns:
+        The status records (same content as the report).
+    """
+    stage_limits = {
+        'fetch': threading.BoundedSemaphore(fetch_workers),
+        'translate': threading.BoundedSemaphore(translate_workers),
+        'embed': threading.BoundedSemaphore(embed_workers)
+    }
+    fetcher = get_fetcher()
+
+    def ingest_for_report(video_id: str) -> dict:
+        start = time.perf_counter()
+        record = {'video_id': video_id}
+        try:
+            _, stages = ingest_video(video_id, fetcher, stage_limits, summarize=summarize)
+            record['status'] = 'done' if 'done' in stages.values() else 'skipped'
+            record['stages'] = stages
+        except Exception as e:
+            record['status'] = 'failed'
+            record['error'] = f"{type(e).__name__}: {e}"
+        record['seconds'] = round(time.perf_counter() - start, 3)
+        return record
+
+    records = []
+    workers = fetch_workers + translate_workers + embed_workers
+    with ThreadPoolExecutor(max_workers=workers) as executor, open(report_path, 'a') as report:
+        futures = [executor.submit(ingest_for_report, video_id) for video_id in video_ids]
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            report.write(json.dumps(record) + "\n")
+            report.flush()
+            print(f"[{len(records)}/{len(video_ids)}] {record['video_id']}: {record['status']}")
+
+    get_library_index().save()
+    return records
@@ -0,0 +1,141 @@
+import re
+import math
+import pickle
+from array import array
+from typing import Iterable
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Words too common to say anything about a chunk
+STOP_WORDS = frozenset("""
+a an and are as at be but by do does for from had has have he her his how i if in into is it its me my of on or
+our she so that the their them then there these they this to was we were what when where which who why will with
+you your about can did just not
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lower-cases the text and splits it into word tokens (numbers and codes like `4o` are kept), without stop words.
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class BM25Index:
+    """
+    Compact in-memory BM25 inverted index over a list of documents.
+
+    Postings are stored in CSR form: for term `t`, the documents containing it
+    are `doc_ids[offsets[t]:offsets[t + 1]]` and their term frequencies are the
+    same slice of `term_freqs`. Everything lives in a handful of flat arrays,
+    so the index pickles into a small file that loads quickly.
+
+    Document ids are positions in the list the index was built from (the
+    same order as the documents of the FAISS store saved next to it).
+    """
+
+    def __init__(self, vocabulary: dict[str, int], offsets: array, doc_ids: array, term_freqs: array,
+                 doc_lengths: array, k1: float = 1.5, b: float = 0.75):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if sum(doc_lengths) else 1.0
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> 'BM25Index':
+        """
+        Builds the index from the texts of the documents.
+        """
+        postings: dict[str, list[tuple[int, int]]] = {}
+        doc_lengths = array('i')
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+
+            counts: dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((doc_id, count))
+
+        vocabulary = {}
+        offsets = array('i', [0])
+        doc_ids = array('i')
+        term_freqs = array('i')
+        for term_id, (term, term_postings) in enumerate(postings.items()):
+            vocabulary[term] = term_id
+            for doc_id, count in term_postings:
+                doc_ids.append(doc_id)
+                term_freqs.append(count)
+            offsets.append(len(doc_ids))
+
+        return cls(vocabulary, offsets, doc_ids, term_freqs, doc_lengths, k1=k1, b=b)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def idf(self, term_id: int) -> float:
+        df = self.offsets[term_id + 1] - self.offsets[term_id]
+        return math.log(1 + (len(self) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 3) -> tuple[list[tuple[int, float]], list[int]]:
+        """
+        Scores the documents against the query with BM25.
+
+        Args:
+            query: The query text.
+            k: Number of documents to return.
+
+        Returns:
+            The top `k` (document id, score) pairs, best first, and for each of
+            them the number of distinct query terms it contains.
+        """
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+
+        scores: dict[int, float] = {}
+        matched_terms: dict[int, int] = {}
+        for term_id in term_ids:
+            idf = self.idf(term_id)
+            for i in range(self.offsets[term_id], self.offsets[term_id + 1]):
+                doc_id = self.doc_ids[i]
+                tf = self.term_freqs[i]
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                matched_terms[doc_id] = matched_terms.get(doc_id, 0) + 1
+
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return top, [matched_terms[doc_id] for doc_id, _ in top]
+
+    def save(self, path: str):
+        """
+        Saves the index to a single file.
+        """
+        with open(path, 'wb') as f:
+            pickle.dump({
+                'vocabulary': self.vocabulary,
+                'offsets': self.offsets,
+                'doc_ids': self.doc_ids,
+                'term_freqs': self.term_freqs,
+                'doc_lengths': self.doc_lengths,
+                'k1': self.k1,
+                'b': self.b
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        """
+        Loads an index saved with `save` (only load files created by this application).
+        """
+        with open(path, 'rb') as f:
+            return cls(**pickle.load(f))
+
+    def estimate_size(self) -> int:
+        """
+        Rough memory footprint of the index, in bytes.
+        """
+        arrays_size = sum(a.itemsize * len(a) for a in (self.offsets, self.doc_ids, self.term_freqs, self.doc_lengths))
+        return arrays_size + sum(len(term) + 64 for term in self.vocabulary)
@@ -1,58 +1,159 @@
-from dotenv import load_dotenv
-import os
-import copy
-from llm.vector_store import load_vector_store
-from utils import get_grouped_data
-# from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
+from llm.vector_store import search_vector_stores
+from llm.summarizer import map_summarize, reduce_summarize, DEFAULT_REDUCE_TOKEN_BUDGET, DEFAULT_REDUCE_FAN_IN
+from llm.batching import DEFAULT_MAX_CONCURRENCY
+from llm.providers import get_chat_model
+from llm.instrumentation import stage
+from llm.context import compact_tool_messages, get_sources, DEFAULT_TOOL_OUTPUT_MAX_TOKENS
+from llm.pyramid import SummaryPyramid, DEFAULT_BASE_WINDOW
+from llm.library_index import search_library
+from store import get_video_store
+from timeline import TimelineIndex
 from langchain.tools import tool
+from langchain_core.tools import BaseTool
 from langgraph.graph.message import add_messages
 from langgraph.graph import StateGraph, START, END
-from langchain_core.messages import BaseMessage
-from typing import TypedDict, Annotated, Sequence
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from langgraph.config import get_stream_writer
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage, AIMessage
+from typing import TypedDict, Annotated, Sequence, Callable, Iterator, Any
 from langgraph.prebuilt import ToolNode
 
-load_dotenv()
 
-# llm = ChatGoogleGenerativeAI(
-#     model="gemini-2.5-flash",
-#     temperature=0.2
-# )
+class AgentState(TypedDict):
+    messages: Annotated[Sequence[BaseMessage], add_messages]
 
-llm = AzureChatOpenAI(
-    api_key=os.environ["AZURE_OPENAI_GPT4O_API_KEY"],
-    azure_deployment=os.environ["AZURE_OPENAI_GPT4O_DEPLOYMENT_NAME"],
-    azure_endpoint=os.environ["AZURE_OPENAI_GPT4O_ENDPOINT"],
-    api_version=os.environ["AZURE_OPENAI_GPT4O_API_VERSION"]
-)
 
-embedding = AzureOpenAIEmbeddings(
-    api_key=os.environ["AZURE_OPENAI_EMBEDDINGS_ADA_API_KEY"],
-    api_version=os.environ["AZURE_OPENAI_API_EMBEDDINGS_ADA_VERSION"],
-    azure_deployment=os.environ["AZURE_OPENAI_EMBEDDINGS_ADA_DEPLOYEMENT_NAME"],
-    azure_endpoint=os.environ["AZURE_OPENAI_API_EMBEDDINGS_ADA_ENDPOINT"]
-)
+SYSTEM_PROMPT = """
+    You are a helpful AI assistant who excels in youtube video summarizing, getting particular information from the video, answering user queries efficiently. Based on the tools and knowledge uyou have please address the user queries correctly.
+    
+    DO NOT ASK FOR LINKS, only answer based on the information you have.
+    
+    Correctly call the tools with the specific input types by seeing the method signature and docstring. Summarize the result correctly to the user.
+    
+    1. When calling the 'Get_Time_Related_Information', more focus on the current time frame, than the previous and next contexts (if present). 
+    
+    2. When user asks about summarizing the video, call the 'Youtube_Video_Summarizer' tool.
+    
+    3. When the user asks about summarizing the video per given time frame, call the 'Youtube_Video_Summarizer_Per_Given_Time_Chunk' tool. When giving the answer, convert seconds to minutes format. For example 80s means 1:20 minute.
+    
+    4. When using 'Question_Answering', attach the timestamps in minutes form, after the response of the user query. TRY TO APPROXIMATE, the timestamp range (NARROW DOWN based on where you are finding the answer, for example, if you get the answer in the middle of the timestamp range (e.g, 150s to 250s), narrow down it to (175s to 225s). Example: For an initial range of 150s to 250s where the answer is central, provide a narrowed range like 175s to 225s, which translates to (Starts at 2:55 - Ends at 3:45) in the final output 
+    e.g, 
+    <RESPONSE>
+    source: [1:20 to 1:45, 2:30 to 2:50]    
+    
+    DO NOT HALUCINATE. If you don't know the answer, simply say Sorry I couldn't find the answer of your query, do not make things by your own!
+    """
+
+LIBRARY_SYSTEM_PROMPT = """
+    You are a helpful AI assistant who answers user queries about a library of youtube videos (e.g. a channel or a playlist), based on the tools and knowledge you have.
+    
+    DO NOT ASK FOR LINKS, only answer based on the information you have.
+    
+    Call the 'Library_Question_Answering' tool to find the relevant parts of the videos. The answer can come from several videos: compare or combine them when the user asks to, and say which video each part of the answer comes from.
+    
+    After the response, attach the video id along with the timestamps in minutes form, narrowed down to where you found the answer. For example 80s means 1:20 minute.
+    e.g, 
+    <RESPONSE>
+    source: [VIDEO_ID 1:20 to 1:45, OTHER_VIDEO_ID 2:30 to 2:50]
+    
+    DO NOT HALUCINATE. If you don't know the answer, simply say Sorry I couldn't find the answer of your query, do not make things by your own!
+    """
 
-class AgentState(TypedDict):
-    messages: Annotated[Sequence[BaseMessage], add_messages]
 
-def create_agent(data: list[dict], vector_db_path: str, summarization_group_time: int | float = 180):
+def get_time_related_info_text(timeline: TimelineIndex, time_in_sec: int | float) -> str | None:
     """
-    Creates the AI YouTube Video agent.
+    Returns the text said at `time_in_sec` with the previous and the next chunks (see `Get_Time_Related_Information`).
+    `timeline` only needs to cover these chunks (e.g. `VideoStore.load_around`).
+    """
+    if time_in_sec < 0:
+        return "Invalid time stamp"
+    result = ""
+
+    index = timeline.find(time_in_sec)
+    # Only useful when exact match can't be computed (0-10) (12-21), but user asks for 11
+    next_index = timeline.next_after(time_in_sec) if index == -1 else -1
+
+    if index != -1:
+        prev_index, after_index = timeline.neighbors(index)
+        if prev_index is not None:
+            result = f"""
+                        FROM {timeline.starts[prev_index]}s to {timeline.ends[prev_index]} (WHAT HAPPENED PREVIOUSLY)
+                        {timeline.text(prev_index)}
+                        """
+        result += f"""
+                        \n
+                        FROM {timeline.starts[index]}s to {timeline.ends[index]} (GIVEN TIME QUERY)
+                        {timeline.text(index)}
+                        """
+        if after_index is not None:
+            result += f"""
+                        \n
+                        FROM {timeline.starts[after_index]}s to {timeline.ends[after_index]} (WHAT HAPPENS NEXT)
+                        {timeline.text(after_index)}
+                        """
+    elif next_index != -1:
+        prev_index, _ = timeline.neighbors(next_index)
+        if prev_index is not None:
+            result = f"""
+                        FROM {timeline.starts[prev_index]}s to {timeline.ends[prev_index]} (WHAT HAPPENED PREVIOUSLY)
+                        {timeline.text(prev_index)}
+                        """
+        result += f"""
+                        \n
+                        FROM {timeline.starts[next_index]}s to {timeline.ends[next_index]} (WHAT HAPPENS NEXT)
+                        {timeline.text(next_index)}
+    
+                        """
+    return result or None
+
+
+def get_event_writer() -> Callable[[dict], None] | None:
+    """
+    Returns the writer of the custom events streamed by the running agent (see `stream_agent`),
+    or None when a tool is invoked outside of the agent.
+    """
+    try:
+        return get_stream_writer()
+    except (RuntimeError, KeyError):
+        return None
+
+
+def create_tools(data: list[dict] | TimelineIndex, vector_db_path: str, summarization_group_time: int | float = 180,
+                 map_max_concurrency: int = DEFAULT_MAX_CONCURRENCY, reduce_token_budget: int = DEFAULT_REDUCE_TOKEN_BUDGET,
+                 reduce_fan_in: int = DEFAULT_REDUCE_FAN_IN, video_id: str | None = None,
+                 summary_base_window: int | float = DEFAULT_BASE_WINDOW,
+                 summarization_token_budget: int | None = None, summary_background_fill: bool = False) -> list[BaseTool]:
+    """
+    Creates the tools of the AI YouTube Video agent (they can also be invoked directly).
     
     Args
-        data: Transcription data
+        data: Transcription data (list of 'start', 'end', 'text' dictionaries or a `TimelineIndex`)
         vector_db_path: Vector database path
         summarization_group_time: Time limit for each summarization chunk
+        map_max_concurrency: Maximum number of parallel LLM calls during the summarization map and reduce phases
+        reduce_token_budget: Maximum number of input tokens of a single reduce call
+        reduce_fan_in: Maximum number of summaries combined by a single reduce call
+        video_id: Video id, to reuse the summary pyramid saved in the video store (only kept in memory without it)
+        summary_base_window: Seconds covered by a leaf of the summary pyramid
+        summarization_token_budget: Packs the summarization chunks by tokens of the chat model instead of by time (optional)
+        summary_background_fill: Builds the whole summary pyramid in the background after the first interval summaries
     """
-    processed_data = copy.deepcopy(data)
+    # Array-backed timeline (O(log n) timestamp lookups, cached groupings per granularity)
+    timeline = data if isinstance(data, TimelineIndex) else TimelineIndex.from_records(data)
     
-    # Merge into ~3-minute blocks (For better summarization)
-    summarization_data = get_grouped_data(processed_data, summarization_group_time)
+    # Merge into ~3-minute blocks (For better summarization), or into blocks of about the same number of tokens
+    if summarization_token_budget:
+        summarization_data = timeline.grouped(None, max_tokens=summarization_token_budget,
+                                              count_tokens=get_chat_model().get_num_tokens)
+    else:
+        summarization_data = timeline.grouped(summarization_group_time)
+
+    # Interval summaries (and the video summary, once it is built) are assembled from cached summaries of aligned windows
+    pyramid = SummaryPyramid(timeline, base_window=summary_base_window, video_id=video_id,
+                             store=get_video_store() if video_id else None, max_concurrency=map_max_concurrency,
+                             background_fill=summary_background_fill)
 
     @tool(name_or_callable='Get_Time_Related_Information', description='Useful when the user asks about what happened in the video, in a particular time', parse_docstring=True)
+    @stage('tool:Get_Time_Related_Information')
     def get_time_related_info(time_in_sec: int | float) -> str | None:
         """
         Useful when the user asks about what happened in the video, in a particular time.
@@ -81,86 +182,33 @@ def create_agent(data: list[dict], vector_db_path: str, summarization_group_time
             str or None: Description of the events around the specified timestamp, 
                         or None if nothing is found.
         """
-        if time_in_sec < 0:
-            return "Invalid time stamp"
-        index = -1
-        next_index = -1
-        result = ""
-        n = len(processed_data)
-
-        for i, dict in enumerate(processed_data):
-            if time_in_sec >= dict['start'] and time_in_sec <= dict['end']:
-                index = i
-                break
-            # Only useful when exact match can't be computed (0-10) (12-21), but user asks for 11
-            if time_in_sec <= dict['start'] and time_in_sec <= dict['end']:
-                next_index = i
-                break
-
-        if index != -1:
-            if index - 1 >= 0:
-                result = f"""
-                        FROM {processed_data[index - 1]['start']}s to {processed_data[index - 1]['end']} (WHAT HAPPENED PREVIOUSLY)
-                        {processed_data[index - 1]['text']}
-                        """
-            result += f"""
-                        \n
-                        FROM {processed_data[index]['start']}s to {processed_data[index]['end']} (GIVEN TIME QUERY)
-                        {processed_data[index]['text']}
-                        """
-            if index + 1 < n:
-                result += f"""
-                        \n
-                        FROM {processed_data[index + 1]['start']}s to {processed_data[index + 1]['end']} (WHAT HAPPENS NEXT)
-                        {processed_data[index + 1]['text']}
-                        """
-        elif next_index != -1:
-            if next_index - 1 >= 0:
-                result = f"""
-                        FROM {processed_data[next_index - 1]['start']}s to {processed_data[next_index - 1]['end']} (WHAT HAPPENED PREVIOUSLY)
-                        {processed_data[next_index - 1]['text']}
-                        """
-            result += f"""
-                        \n
-                        FROM {processed_data[next_index]['start']}s to {processed_data[next_index]['end']} (WHAT HAPPENS NEXT)
-                        {processed_data[next_index]['text']}
-    
-                        """
-        return result or None
+        return get_time_related_info_text(timeline, time_in_sec)
 
     @tool(name_or_callable='Youtube_Video_Summarizer', description='Useful when the user asks about summarizing the entire video. Call this tool whenever user asks about summarization.')
+    @stage('tool:Youtube_Video_Summarizer')
     def summarize_video() -> str:
-        map_chain_template = [
-            ('system', "You are a helpful AI assistant. Your job is to efficiently summarize the ducument chunk that is passed to you by the user. DON'T HALUCINATE, DON'T MAKE UP STORIES, summarize solely based on the text that is provided to you. DON'T LOSE MUCH INFORMATION, as these summaries will be re-summarized again, combined."),
-            ('user', 'Please summarize the chunk: {document}')
-        ]
-        
+        # Root of the summary pyramid, when it was built (at ingestion or in the background)
+        final_summary = pyramid.summary()
+        if final_summary is not None:
+            return final_summary
+
         print("Summarizing...")
-        
-        map_chain_prompt_template = ChatPromptTemplate.from_messages(map_chain_template)
-        map_chain = map_chain_prompt_template | llm | StrOutputParser()
-        
-        summaries = [map_chain.invoke(d['text']) for d in summarization_data]
-        all_summaries = "\n".join(summaries)
-        
-        reduce_chain_template = [
-            ('system', "You are a helpful AI assistant. Your job is to efficiently summarize the summaries (basically you need to provide summary of the summaries) that is passed to you by the user. DON'T HALUCINATE, DON'T MAKE UP STORIES, summarize solely based on the text that is provided to you!. DON'T LOSE MUCH INFORMATION, summarize efficienly."),
-            ('user', 'Please summarize the summaries : {document}')
-        ]
 
-        reduce_chain_prompt_template = ChatPromptTemplate.from_messages(reduce_chain_template)
-        reduce_chain = reduce_chain_prompt_template | llm | StrOutputParser()
-        
-        final_summary = reduce_chain.invoke(all_summaries)
-        
+        summaries = map_summarize(get_chat_model(), summarization_data.texts(),
+                                  max_concurrency=map_max_concurrency)
+        final_summary = reduce_summarize(get_chat_model(), summaries, token_budget=reduce_token_budget,
+                                         fan_in=reduce_fan_in, max_concurrency=map_max_concurrency)
+
         return final_summary
     
     @tool(name_or_callable='Youtube_Video_Summarizer_Per_Given_Time_Chunk', description='Useful for summarizing a YouTube video based on specific time segments or intervals specified by the user. For instance, it can summarize the content every two minutes. Use this when the user needs a detailed, segmented summary rather than a single, overall summary.', parse_docstring=True)
+    @stage('tool:Youtube_Video_Summarizer_Per_Given_Time_Chunk')
     def summarize_video_per_given_time(time_in_sec: int | float) -> list[str]:
         """Generates segment-by-segment summaries of a YouTube video.
 
-        Divides the video into equal-length chunks defined by `time_in_sec`
-        and summarizes the content of each segment chronologically.
+        Divides the video into consecutive segments of about `time_in_sec` seconds
+        (segments start and end at transcript chunk boundaries, so they can't be
+        shorter than a chunk) and summarizes the content of each segment chronologically.
 
         Args:
             time_in_sec: The length of each summary chunk in seconds (must be > 25).
@@ -176,40 +224,41 @@ def create_agent(data: list[dict], vector_db_path: str, summarization_group_time
         if time_in_sec <= 25:
             return "Error: Time frame must be greater than 10 seconds."
         
-        summarization_data_time_wise = get_grouped_data(processed_data, time_in_sec)
-        map_chain_template = [
-            ('system', "You are a helpful AI assistant. Your job is to efficiently summarize the ducument chunk that is passed to you by the user. DON'T HALUCINATE, DON'T MAKE UP STORIES, summarize solely based on the text that is provided to you."),
-            ('user', 'Please summarize the chunk: {document}')
-        ]
-        
         print("Summarizing...")
-        
-        map_chain_prompt_template = ChatPromptTemplate.from_messages(map_chain_template)
-        map_chain = map_chain_prompt_template | llm | StrOutputParser()
-        
-        summaries = [f"SUMMARY OF {d['start']}s to {d['end']}s\n{map_chain.invoke(d['text'])}" for d in summarization_data_time_wise]
+
+        # Every interval summary is streamed (in order) as soon as it is ready, the agent answers once all are done
+        writer = get_event_writer()
+
+        def emit(i: int, interval: dict):
+            writer({'interval_summary': {'index': i, 'count': count, **interval}})
+
+        ranges = pyramid.intervals(time_in_sec)
+        count = len(ranges)
+        intervals = pyramid.summarize_intervals(time_in_sec, on_summary=emit if writer else None)
+        summaries = [f"SUMMARY OF {d['start']}s to {d['end']}s\n{d['summary']}" for d in intervals]
+
+        # Chunks longer than the requested time can't be split: say so instead of silently returning longer segments
+        chunk_times = [timeline.ends[first] - timeline.starts[first] for first, last in ranges if last - first == 1]
+        if chunk_times and max(chunk_times) > time_in_sec:
+            summaries.insert(0, f"NOTE: The transcript is split into chunks of up to {max(chunk_times):g}s, "
+                                f"so some segments are longer than the requested {time_in_sec}s.")
         
         return summaries
     
-    @tool(name_or_callable='Question_Answering', description='Use this to find and answer questions about the content of the YouTube videos')
-    def qna_rag(query: str) -> str:
+    @tool(name_or_callable='Question_Answering', description='Use this to find and answer questions about the content of the YouTube videos. Set broad=True for broad questions (overview, main topics, key takeaways), keep it False for specific questions.')
+    @stage('tool:Question_Answering')
+    def qna_rag(query: str, broad: bool = False) -> str:
         """
         Finds and provides information about the content of a YouTube video based on a query.
         
         Args:
         query: The search term for the desired YouTube video.
+        broad: Whether the query is about a broad topic of the video (also searches the coarse-grained index).
 
         Returns:
             Text response(s) containing the video information along with timestamp(s) about the query.
         """
-        vector_store = load_vector_store(vector_db_path)
-        
-        retriever = vector_store.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={"k": 3, "score_threshold": 0.1}
-        )
-        
-        docs = retriever.invoke(query)
+        docs = search_vector_stores(vector_db_path, query, k=3, score_threshold=0.1, broad=broad)
         
         if not docs:
             return "No relevant informations can be found!"
@@ -218,12 +267,78 @@ def create_agent(data: list[dict], vector_db_path: str, summarization_group_time
         
         return "\n\n".join(context)
 
-    # Creating the graph
-    global llm
-    llm = llm.bind_tools([get_time_related_info, summarize_video, summarize_video_per_given_time, qna_rag])
+    return [get_time_related_info, summarize_video, summarize_video_per_given_time, qna_rag]
+
+
+def create_library_tools(video_ids: list[str] | None = None, k: int = 5) -> list[BaseTool]:
+    """
+    Creates the tools of an agent answering questions across the ingested videos (library index).
+
+    Args
+        video_ids: Only search these videos (e.g. a channel or a playlist), all the ingested videos if not given
+        k: Number of chunks returned per search
+    """
+    @tool(name_or_callable='Library_Question_Answering', description='Use this to find and answer questions across all the ingested YouTube videos (a channel, a playlist or the whole library).')
+    @stage('tool:Library_Question_Answering')
+    def library_qna(query: str) -> str:
+        """
+        Finds information about a query in the ingested YouTube videos.
+
+        Args:
+        query: The search term for the desired information.
+
+        Returns:
+            Text chunks of the most relevant videos, with their video id and timestamps.
+        """
+        results = search_library(query, k=k, video_ids=video_ids)
+
+        if not results:
+            return "No relevant informations can be found!"
+
+        context = [f"VIDEO {r['video_id']} FROM: {r['start']}s to {r['end']}s\n{r['text']}" for r in results]
+
+        return "\n\n".join(context)
+
+    return [library_qna]
+
+
+def create_agent(data: list[dict] | TimelineIndex, vector_db_path: str, summarization_group_time: int | float = 180,
+                 map_max_concurrency: int = DEFAULT_MAX_CONCURRENCY, reduce_token_budget: int = DEFAULT_REDUCE_TOKEN_BUDGET,
+                 reduce_fan_in: int = DEFAULT_REDUCE_FAN_IN, tools: list[BaseTool] | None = None,
+                 tool_output_max_tokens: int = DEFAULT_TOOL_OUTPUT_MAX_TOKENS, video_id: str | None = None,
+                 summary_base_window: int | float = DEFAULT_BASE_WINDOW, summarization_token_budget: int | None = None,
+                 summary_background_fill: bool = False):
+    """
+    Creates the AI YouTube Video agent.
+    
+    Args
+        data: Transcription data (list of 'start', 'end', 'text' dictionaries or a `TimelineIndex`)
+        vector_db_path: Vector database path
+        summarization_group_time: Time limit for each summarization chunk
+        map_max_concurrency: Maximum number of parallel LLM calls during the summarization map and reduce phases
+        reduce_token_budget: Maximum number of input tokens of a single reduce call
+        reduce_fan_in: Maximum number of summaries combined by a single reduce call
+        tools: Tools already created by `create_tools` for this video (created if not given)
+        tool_output_max_tokens: Tool outputs the agent has already answered from are replaced by a short reference above this size
+        video_id: Video id, to reuse the summary pyramid saved in the video store
+        summary_base_window: Seconds covered by a leaf of the summary pyramid
+        summarization_token_budget: Packs the summarization chunks by tokens instead of by time (optional)
+        summary_background_fill: Builds the whole summary pyramid in the background after the first interval summaries
+    """
+    if tools is None:
+        tools = create_tools(data, vector_db_path, summarization_group_time=summarization_group_time,
+                             map_max_concurrency=map_max_concurrency, reduce_token_budget=reduce_token_budget,
+                             reduce_fan_in=reduce_fan_in, video_id=video_id, summary_base_window=summary_base_window,
+                             summarization_token_budget=summarization_token_budget,
+                             summary_background_fill=summary_background_fill)
+
+    # The summarization tools keep using the plain chat model (without bound tools)
+    agent_llm = get_chat_model().bind_tools(tools)
     
     def llm_node(state: AgentState) -> AgentState:
-        result = llm.invoke(state['messages'])
+        with stage('planner'):
+            # Earlier steps of the turn only keep a reference to their (large) tool outputs
+            result = agent_llm.invoke(compact_tool_messages(state['messages'], max_tokens=tool_output_max_tokens))
         return {'messages': [result]}
     
     def should_call_tools(state: AgentState) -> str:
@@ -235,7 +350,7 @@ def create_agent(data: list[dict], vector_db_path: str, summarization_group_time
     graph = StateGraph(AgentState)
     
     graph.add_node('llm_node', llm_node)
-    graph.add_node('tools_node', ToolNode(tools = [get_time_related_info, summarize_video, summarize_video_per_given_time, qna_rag]))
+    graph.add_node('tools_node', ToolNode(tools = tools))
     
     graph.add_edge(START, 'llm_node')
     graph.add_conditional_edges(
@@ -250,4 +365,61 @@ def create_agent(data: list[dict], vector_db_path: str, summarization_group_time
     
     app = graph.compile()
     
-    return app
\ No newline at end of file
+    return app
+
+
+def stream_agent(agent, messages: list[BaseMessage]) -> Iterator[tuple[str, Any]]:
+    """
+    Runs the agent, yielding its output as it is produced:
+
+    - `('token', text)`: text generated by the agent LLM (the answer, token by token)
+    - `('interval_summary', {'index', 'count', 'start', 'end', 'summary'})`: a summary of
+      `Youtube_Video_Summarizer_Per_Given_Time_Chunk`, in chronological order, as soon as it is ready
+    - `('messages', messages)`: last, every message of the turn (same as `agent.invoke(...)['messages']`)
+    """
+    state = None
+    for mode, chunk in agent.stream({'messages': messages}, stream_mode=['messages', 'custom', 'values']):
+        if mode == 'messages':
+            message, metadata = chunk
+            # Tokens of the LLM calls made inside the tools (summaries) are not part of the answer
+            # (models that don't stream send the whole message at once)
+            if metadata.get('langgraph_node') == 'llm_node' and isinstance(message, AIMessage):
+                text = get_message_text(message)
+                if text:
+                    yield 'token', text
+        elif mode == 'custom':
+            for kind, event in chunk.items():
+                yield kind, event
+        else:
+            state = chunk
+    yield 'messages', state['messages']
+
+
+def get_message_text(message: BaseMessage) -> str:
+    """
+    Returns the text of an AI message (some providers return a list of content blocks).
+    """
+    if isinstance(message.content, list):
+        block = message.content[0] if message.content else {}
+        if isinstance(block, str):
+            return block
+        return block.get('text') or block.get('message') or ''
+    return message.content
+
+
+def get_turn_sources(messages: list[BaseMessage]) -> list[str] | None:
+    """
+    Returns the time ranges (e.g. '120.0s to 240.0s') returned by the tools during the last turn,
+    or None if no tool was called (small talk, follow-ups answered from the history).
+    """
+    turn_start = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+    tool_messages = [m for m in messages[turn_start:] if isinstance(m, ToolMessage)]
+    if not tool_messages:
+        return None
+
+    sources = []
+    for m in tool_messages:
+        for source in get_sources(str(m.content)):
+            if source not in sources:
+                sources.append(source)
+    return sources
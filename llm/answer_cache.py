@@ -0,0 +1,209 @@
+import re
+import time
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from llm.cache import open_sqlite
+
+# Defaults (change as needed)
+DEFAULT_SIMILARITY_THRESHOLD = 0.95  # Cosine similarity above which two questions are considered the same
+DEFAULT_MAX_ENTRIES_PER_VIDEO = 500
+
+# Numbers and timestamps of a question (e.g. 3:20, 1.5, 200): questions only match if they have the same ones
+NUMBER_PATTERN = re.compile(r"\d+(?:[:.,]\d+)*")
+
+
+def get_numbers(question: str) -> str:
+    """
+    Returns the numbers and timestamps of the question, in order (e.g. '3:20 5' for
+    "What happens at 3:20 in part 5?"), which must match exactly for a cache hit.
+    """
+    return " ".join(NUMBER_PATTERN.findall(question))
+
+
+class SemanticAnswerCache:
+    """
+    Persistent cache of answered questions, namespaced per video.
+
+    A new question is compared with the previously answered questions of the
+    same video that were asked with the same chat history (`context`, e.g.
+    `ChatContext.key()`: a follow-up only means the same thing after the same
+    turns) and that have the same numbers and timestamps (`get_numbers`). If
+    one of them is within the similarity threshold, its stored answer and
+    sources are returned and the agent graph is not run.
+
+    Questions are only embedded when there is something to compare them with:
+    a lookup without any candidate costs no embedding call, and a stored
+    question is embedded by the first lookup that needs it (through the query
+    embedding LRU of the embedding model, so a question that was looked up
+    first costs a single call).
+
+    The question vectors of every (video, context, numbers) namespace are kept
+    in memory as one normalized matrix, so a lookup is a single matrix-vector
+    product. Each video keeps at most `max_entries_per_video` answers (least
+    recently used are evicted).
+    """
+
+    def __init__(self, database_path: str, embedding: Embeddings,
+                 similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 max_entries_per_video: int = DEFAULT_MAX_ENTRIES_PER_VIDEO):
+        """
+        Args:
+            database_path: Path of the SQLite file.
+            embedding: Embedding model used for the questions.
+            similarity_threshold: Minimum cosine similarity for a cache hit.
+            max_entries_per_video: Maximum number of answers stored per video.
+        """
+        self.database_path = database_path
+        self.embedding = embedding
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_video = max_entries_per_video
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (video_id, context, numbers) -> (version, entry ids, normalized question matrix)
+        self._matrices: dict[tuple[str, str, str], tuple[tuple, list[int], np.ndarray]] = {}
+
+        with self._connection() as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(answer_cache)")}
+            if columns and 'context' not in columns:
+                # Answers cached without their chat history can't be told apart: start over
+                conn.execute("DROP TABLE answer_cache")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS answer_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    video_id TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    numbers TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    vector BLOB,
+                    answer TEXT NOT NULL,
+                    sources TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("DROP INDEX IF EXISTS answer_cache_video_id")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS answer_cache_key ON answer_cache (video_id, context, numbers)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = open_sqlite(self.database_path)
+            self._local.conn = conn
+        return conn
+
+    def _get_matrix(self, key: tuple[str, str, str]) -> tuple[list[int], np.ndarray]:
+        # Reload only when the stored answers of the namespace changed (possibly in another process)
+        conn = self._connection()
+        where = "WHERE video_id = ? AND context = ? AND numbers = ?"
+        version = conn.execute(
+            f"SELECT COUNT(*), COALESCE(MAX(id), 0), COUNT(vector) FROM answer_cache {where}", key).fetchone()
+        if not version[0]:
+            return [], np.empty((0, 0), dtype=np.float32)
+
+        cached = self._matrices.get(key)
+        if cached is None or cached[0] != version:
+            # Questions stored since the last lookup are embedded now (once, the vectors are saved)
+            pending = conn.execute(f"SELECT id, question FROM answer_cache {where} AND vector IS NULL", key).fetchall()
+            if pending:
+                vectors = [self._normalize(self.embedding.embed_query(question)).tobytes() for _, question in pending]
+                with conn:
+                    conn.executemany("UPDATE answer_cache SET vector = ? WHERE id = ?",
+                                     [(vector, entry_id) for vector, (entry_id, _) in zip(vectors, pending)])
+
+            rows = conn.execute(
+                f"SELECT id, vector FROM answer_cache {where} AND vector IS NOT NULL ORDER BY id", key).fetchall()
+            ids = [row[0] for row in rows]
+            matrix = np.array([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else np.empty((0, 0), dtype=np.float32)
+            version = conn.execute(
+                f"SELECT COUNT(*), COALESCE(MAX(id), 0), COUNT(vector) FROM answer_cache {where}", key).fetchone()
+            cached = (version, ids, matrix)
+            self._matrices[key] = cached
+
+        return cached[1], cached[2]
+
+    @staticmethod
+    def _normalize(vector: list[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, video_id: str, question: str, context: str = "") -> dict | None:
+        """
+        Returns the cached answer of the most similar previously answered question of the video,
+        asked after the same chat history.
+
+        Args:
+            video_id: Namespace of the question.
+            question: The new question.
+            context: Key of the chat history the question is asked after ('' for the first turn).
+
+        Returns:
+            A dictionary with 'question', 'answer', 'sources' and 'similarity' keys, or None on a miss.
+        """
+        ids, matrix = self._get_matrix((video_id, context, get_numbers(question)))
+
+        best = None
+        if len(ids):
+            query_vector = self._normalize(self.embedding.embed_query(question))
+            if matrix.shape[1] == query_vector.shape[0]:
+                similarities = matrix @ query_vector
+                best = int(np.argmax(similarities))
+
+        if best is None or similarities[best] < self.similarity_threshold:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        conn = self._connection()
+        with conn:
+            conn.execute("UPDATE answer_cache SET last_used = ? WHERE id = ?", (time.time(), ids[best]))
+        row = conn.execute(
+            "SELECT question, answer, sources FROM answer_cache WHERE id = ?", (ids[best],)).fetchone()
+        if row is None:
+            # Evicted by another process in the meantime
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return {
+            'question': row[0],
+            'answer': row[1],
+            'sources': row[2].split("\n") if row[2] else [],
+            'similarity': float(similarities[best])
+        }
+
+    def store(self, video_id: str, question: str, answer: str, sources: list[str], context: str = ""):
+        """
+        Stores an answered question (and its sources, e.g. timestamp ranges) of the video, asked
+        after the chat history `context` (its vector is computed by the first lookup that needs it).
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO answer_cache (video_id, context, numbers, question, answer, sources, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (video_id, context, get_numbers(question), question, answer, "\n".join(sources), time.time())
+            )
+            # Keep only the most recently used answers of the video
+            conn.execute("""
+                DELETE FROM answer_cache WHERE video_id = ? AND id NOT IN (
+                    SELECT id FROM answer_cache WHERE video_id = ? ORDER BY last_used DESC LIMIT ?
+                )
+            """, (video_id, video_id, self.max_entries_per_video))
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters of this process.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
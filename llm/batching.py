@@ -0,0 +1,110 @@
+import time
+import random
+from typing import Any, Callable, Iterable, Iterator
+from langchain_core.runnables import Runnable
+from llm.instrumentation import get_callback_handler, get_metrics
+from llm.providers import get_retryable_errors
+
+# Defaults (change as needed)
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 6
+
+
+def with_backoff(runnable: Runnable, max_retries: int = DEFAULT_MAX_RETRIES) -> Runnable:
+    """
+    Wraps a runnable so that rate-limit and transient errors are retried
+    with exponential backoff and jitter instead of failing the whole run
+    (the retries are counted by the instrumentation callbacks).
+
+    Args:
+        runnable: Any LangChain runnable (e.g. `prompt | llm | parser`).
+        max_retries: Maximum number of attempts per input.
+
+    Returns:
+        The retrying runnable.
+    """
+    return runnable.with_retry(
+        retry_if_exception_type=get_retryable_errors(),
+        wait_exponential_jitter=True,
+        stop_after_attempt=max_retries
+    ).with_config(callbacks=[get_callback_handler()])
+
+
+def batch_invoke(runnable: Runnable, inputs: list, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_retries: int = DEFAULT_MAX_RETRIES) -> list:
+    """
+    Invokes `runnable` on every input concurrently, with at most `max_concurrency`
+    calls in flight at once. Each call is retried with backoff on rate limits.
+
+    The outputs are returned in the same order as `inputs`, regardless of the
+    order in which the calls complete.
+
+    Args:
+        runnable: Any LangChain runnable.
+        inputs: Inputs to invoke the runnable with.
+        max_concurrency: Maximum number of parallel calls.
+        max_retries: Maximum number of attempts per input.
+
+    Returns:
+        List of outputs, one per input (in input order).
+    """
+    if not inputs:
+        return []
+
+    return with_backoff(runnable, max_retries).batch(
+        inputs,
+        config={'max_concurrency': max_concurrency}
+    )
+
+
+def iter_batch_invoke(runnable: Runnable, inputs: list, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                      max_retries: int = DEFAULT_MAX_RETRIES) -> Iterator[tuple[int, Any]]:
+    """
+    Same calls as `batch_invoke`, but yields every `(index, output)` pair as soon
+    as its call completes (completion order, see `iter_in_order` to restore the input order).
+    """
+    if not inputs:
+        return
+
+    yield from with_backoff(runnable, max_retries).batch_as_completed(
+        inputs,
+        config={'max_concurrency': max_concurrency}
+    )
+
+
+def iter_in_order(pairs: Iterable[tuple[int, Any]]) -> Iterator[tuple[int, Any]]:
+    """
+    Reorder buffer: yields `(index, item)` pairs received in any order by increasing
+    index (0, 1, 2, ...), each one as soon as every smaller index has been released.
+    """
+    pending = {}
+    next_index = 0
+    for index, item in pairs:
+        pending[index] = item
+        while next_index in pending:
+            yield next_index, pending.pop(next_index)
+            next_index += 1
+
+
+def retry_call(fn: Callable, *args: Any, max_retries: int = DEFAULT_MAX_RETRIES, **kwargs: Any) -> Any:
+    """
+    Calls `fn(*args, **kwargs)`, retrying rate-limit and transient errors with
+    exponential backoff and jitter (for clients that are not LangChain runnables,
+    e.g. embedding models).
+
+    Args:
+        fn: Function to call.
+        max_retries: Maximum number of attempts.
+
+    Returns:
+        The return value of `fn`.
+    """
+    retryable_errors = get_retryable_errors()
+    for attempt in range(max_retries):
+        try:
+            return fn(*args, **kwargs)
+        except retryable_errors:
+            if attempt == max_retries - 1:
+                raise
+            get_metrics().record_retry()
+            time.sleep(min(60, 2 ** attempt) + random.uniform(0, 1))
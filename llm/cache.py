@@ -0,0 +1,211 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Optional
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps, loads
+
+# Defaults (change as needed)
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60  # 30 days
+DEFAULT_MAX_SIZE_BYTES = 512 * 1024 * 1024  # 512 MB
+EVICTION_INTERVAL = 100  # Run eviction once every N writes (per process)
+ACCESS_TOUCH_INTERVAL = 60 * 60  # Refresh the LRU timestamp of an entry at most once an hour
+
+
+def open_sqlite(database_path: str) -> sqlite3.Connection:
+    """
+    Opens a connection to a cache database that several threads and processes share
+    (WAL journal, 30 seconds busy timeout). Parent folders are created as needed.
+    """
+    if os.path.dirname(database_path):
+        os.makedirs(os.path.dirname(database_path), exist_ok=True)
+
+    conn = sqlite3.connect(database_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    Persistent, content-addressed LLM response cache.
+
+    Every response is stored under the SHA-256 of the model configuration
+    (`llm_string`: model, deployment, temperature, bound tools, ...) and the
+    fully rendered prompt (prompt template + input). Identical calls made
+    from any chain, in any session, are served from disk.
+
+    The database runs in WAL mode with a busy timeout, so several processes
+    can share one cache file. Entries expire after `ttl_seconds`, and the
+    least recently used entries are evicted once the cache grows past
+    `max_size_bytes`.
+    """
+
+    def __init__(self, database_path: str, ttl_seconds: int | float | None = DEFAULT_TTL_SECONDS,
+                 max_size_bytes: int | None = DEFAULT_MAX_SIZE_BYTES, bypass: bool = False):
+        """
+        Args:
+            database_path: Path of the SQLite file (parent folders are created).
+            ttl_seconds: Entries older than this are ignored and evicted (None to disable).
+            max_size_bytes: Size ceiling of the stored responses (None to disable).
+            bypass: If True, lookups always miss (responses are still written).
+        """
+        self.database_path = database_path
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        self.bypass = bypass
+
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_accessed_at ON llm_cache (accessed_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread (the map phase calls the cache from a thread pool)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = open_sqlite(self.database_path)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode('utf-8')).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self.bypass:
+            return None
+
+        key = self._key(prompt, llm_string)
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, created_at, accessed_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+
+        now = time.time()
+        if row is None or (self.ttl_seconds is not None and now - row[1] > self.ttl_seconds):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if now - row[2] > ACCESS_TOUCH_INTERVAL:
+            with conn:
+                conn.execute(
+                    "UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+
+        with self._lock:
+            self.hits += 1
+        return loads(row[0])
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        value = dumps(list(return_val))
+        now = time.time()
+
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self._key(prompt, llm_string), value, len(value), now, now)
+            )
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % EVICTION_INTERVAL == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Removes expired entries, then the least recently used ones until the
+        cache fits in `max_size_bytes`.
+
+        Returns:
+            Number of removed entries.
+        """
+        conn = self._connection()
+        removed = 0
+        with conn:
+            if self.ttl_seconds is not None:
+                removed += conn.execute(
+                    "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)).rowcount
+
+            if self.max_size_bytes is not None:
+                total = conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+                excess = total - self.max_size_bytes
+                if excess > 0:
+                    keys = []
+                    for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at"):
+                        keys.append((key,))
+                        excess -= size
+                        if excess <= 0:
+                            break
+                    conn.executemany(
+                        "DELETE FROM llm_cache WHERE key = ?", keys)
+                    removed += len(keys)
+        return removed
+
+    def clear(self, **kwargs: Any) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters of this process along with the size of the cache.
+        """
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        lookups = self.hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'size_bytes': size
+        }
+
+
+def init_llm_cache(database_path: str, ttl_seconds: int | float | None = DEFAULT_TTL_SECONDS,
+                   max_size_bytes: int | None = DEFAULT_MAX_SIZE_BYTES, bypass: bool | None = None) -> SQLiteLLMCache:
+    """
+    Installs the persistent cache as the global LangChain LLM cache, so every
+    chat model call (map/reduce chains, translator, agent planner) goes through it.
+
+    The cache can be bypassed with `bypass=True` or by setting the
+    `LLM_CACHE_BYPASS=1` environment variable.
+
+    Args:
+        database_path: Path of the SQLite file.
+        ttl_seconds: Time to live of an entry, in seconds.
+        max_size_bytes: Size ceiling of the cache, in bytes.
+        bypass: Skip cache lookups (defaults to the `LLM_CACHE_BYPASS` environment variable).
+
+    Returns:
+        The installed cache (use `cache.stats()` for hit/miss counters).
+    """
+    if bypass is None:
+        bypass = os.environ.get('LLM_CACHE_BYPASS', '').lower() in ('1', 'true', 'yes')
+
+    cache = SQLiteLLMCache(database_path, ttl_seconds=ttl_seconds,
+                           max_size_bytes=max_size_bytes, bypass=bypass)
+    set_llm_cache(cache)
+
+    return cache
@@ -0,0 +1,191 @@
+import re
+import hashlib
+from typing import Callable
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage, ToolMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from llm.providers import get_chat_model
+from llm.batching import with_backoff
+from llm.instrumentation import stage
+
+# Defaults (change as needed)
+DEFAULT_TOKEN_BUDGET = 4000  # Tokens of past turns (and their summary) sent with every message
+DEFAULT_KEEP_TURNS = 2  # Most recent turns that are never compacted
+DEFAULT_TOOL_OUTPUT_MAX_TOKENS = 300  # Tool outputs already used by the model above this are replaced by a reference
+COMPACTION_TARGET = 0.6  # A compaction frees the history down to this share of the budget
+SUMMARY_SHARE = 0.25  # Share of the budget the summary of the compacted turns may take
+EXCERPT_CHARS = 300  # Characters kept from each side of a compacted turn, without summarization
+
+# Time ranges in the tool outputs ('FROM: 120.0s to 240.0s', 'SUMMARY OF 0s to 120s', 'VIDEO <id> FROM: ...', ...)
+SOURCE_PATTERN = re.compile(r"(?:VIDEO ([\w-]+) )?(?:FROM:?|SUMMARY OF) ([\d.]+)s to ([\d.]+)s?")
+
+SUMMARY_CHAIN_TEMPLATE = [
+    ('system', "You keep a running summary of a conversation between a user and an AI assistant about a YouTube video. Update the summary with the new turns. Keep the facts, timestamps and user preferences that later questions may refer to, drop small talk. DON'T HALUCINATE. Answer with the updated summary only, in at most {max_words} words."),
+    ('human', "Current summary:\n{summary}\n\nNew turns:\n{turns}")
+]
+
+
+def get_sources(text: str) -> list[str]:
+    """
+    Returns the distinct time ranges (e.g. '120.0s to 240.0s', prefixed by the video id
+    for the library results) mentioned in a tool output, in order.
+    """
+    sources = []
+    for video_id, start, end in SOURCE_PATTERN.findall(text):
+        source = f"{video_id} {start}s to {end}s" if video_id else f"{start}s to {end}s"
+        if source not in sources:
+            sources.append(source)
+    return sources
+
+
+def compact_tool_messages(messages: list[BaseMessage], max_tokens: int = DEFAULT_TOOL_OUTPUT_MAX_TOKENS,
+                          count_tokens: Callable[[str], int] | None = None) -> list[BaseMessage]:
+    """
+    Returns the messages with the large tool outputs the model has already answered
+    (tool messages followed by an AI message) replaced by a compact reference: tool
+    name, size and the time ranges it covered. The outputs of the last step are kept whole.
+
+    Args:
+        messages: Messages of the agent state.
+        max_tokens: Tool outputs above this size are replaced.
+        count_tokens: Token counter (the chat model's by default).
+
+    Returns:
+        A new list (the agent state itself is not modified).
+    """
+    last_answered = max((i for i, m in enumerate(messages) if isinstance(m, AIMessage)), default=-1)
+    count_tokens = count_tokens or get_chat_model().get_num_tokens
+
+    compacted = []
+    for i, m in enumerate(messages):
+        if isinstance(m, ToolMessage) and i < last_answered:
+            content = str(m.content)
+            tokens = count_tokens(content)
+            if tokens > max_tokens:
+                sources = get_sources(content)
+                covering = f" covering {', '.join(sources[:8])}" if sources else ""
+                m = ToolMessage(
+                    content=f"[Output of {m.name or 'the tool'} ({tokens} tokens){covering}, already used above. "
+                            "Call the tool again if its full text is needed.]",
+                    tool_call_id=m.tool_call_id, name=m.name)
+        compacted.append(m)
+    return compacted
+
+
+@stage('compact')
+def summarize_turns(summary: str, turns: list[tuple[str, str]], max_words: int) -> str:
+    """
+    Folds conversation turns (question, answer) into the running summary with one LLM call.
+    """
+    summary_chain = with_backoff(ChatPromptTemplate.from_messages(
+        SUMMARY_CHAIN_TEMPLATE) | get_chat_model() | StrOutputParser())
+
+    return summary_chain.invoke({
+        'summary': summary or "(empty)",
+        'turns': "\n\n".join(f"User: {question}\nAI: {answer}" for question, answer in turns),
+        'max_words': max_words
+    })
+
+
+class ChatContext:
+    """
+    Chat history of one conversation, kept within a token budget.
+
+    Every prompt starts with the same system message (an unchanged prefix,
+    so the provider can serve it from its prompt cache), then the summary of
+    the compacted turns, the recent turns and the new message. Once the
+    history goes over the budget, `compact` folds the oldest turns into the
+    summary (one LLM call over the evicted turns only), or keeps a short
+    excerpt of them when summarization is off. It frees the history down to
+    `COMPACTION_TARGET` of the budget, so the prompt prefix then stays the
+    same for several turns and the prompt size stays flat over long sessions.
+    """
+
+    def __init__(self, system_prompt: str, token_budget: int = DEFAULT_TOKEN_BUDGET, keep_turns: int = DEFAULT_KEEP_TURNS,
+                 summarize: bool = True, count_tokens: Callable[[str], int] | None = None):
+        """
+        Args:
+            system_prompt: System prompt of the agent.
+            token_budget: Maximum tokens of the past turns and their summary.
+            keep_turns: Number of most recent turns that are never compacted.
+            summarize: Summarize the compacted turns with the LLM (else keep an excerpt of each).
+            count_tokens: Token counter (the chat model's by default).
+        """
+        self.system_message = SystemMessage(content=system_prompt)
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summarize = summarize
+        self.count_tokens = count_tokens or get_chat_model().get_num_tokens
+
+        self.summary = ""
+        self.summary_tokens = 0
+        self.compactions = 0
+        # (question, answer, tokens) of the turns that are sent whole
+        self.turns: list[tuple[str, str, int]] = []
+
+    def add_turn(self, question: str, answer: str):
+        self.turns.append((question, answer, self.count_tokens(question) + self.count_tokens(answer)))
+
+    def tokens(self) -> int:
+        return self.summary_tokens + sum(tokens for _, _, tokens in self.turns)
+
+    def key(self) -> str:
+        """
+        Returns a hash of the history sent with the next turn ('' without history), so that answers
+        cached after a conversation are only reused after the same conversation (see `SemanticAnswerCache`).
+        """
+        if not self.summary and not self.turns:
+            return ""
+        history = [self.summary] + [part for question, answer, _ in self.turns for part in (question, answer)]
+        return hashlib.sha256("\x00".join(history).encode('utf-8')).hexdigest()
+
+    def needs_compaction(self) -> bool:
+        return self.tokens() > self.token_budget and len(self.turns) > self.keep_turns
+
+    def compact(self) -> bool:
+        """
+        Folds the oldest turns into the summary if the history is over the budget.
+
+        Returns:
+            Whether turns were compacted.
+        """
+        if not self.needs_compaction():
+            return False
+
+        target = int(self.token_budget * COMPACTION_TARGET)
+        total = self.tokens()
+        evicted = []
+        while len(self.turns) > self.keep_turns and total > target:
+            question, answer, tokens = self.turns.pop(0)
+            evicted.append((question, answer))
+            total -= tokens
+
+        summary_budget = int(self.token_budget * SUMMARY_SHARE)
+        if self.summarize:
+            # ~0.75 words per token
+            summary = summarize_turns(self.summary, evicted, max_words=int(summary_budget * 0.75))
+        else:
+            excerpts = [f"User: {question[:EXCERPT_CHARS]}\nAI: {answer[:EXCERPT_CHARS]}" for question, answer in evicted]
+            summary = "\n\n".join(([self.summary] if self.summary else []) + excerpts)
+
+        # The oldest part of the summary goes first if it grows past its share
+        summary_tokens = self.count_tokens(summary)
+        while summary_tokens > summary_budget and "\n\n" in summary:
+            summary = summary.split("\n\n", 1)[1]
+            summary_tokens = self.count_tokens(summary)
+
+        self.summary, self.summary_tokens = summary, summary_tokens
+        self.compactions += 1
+        return True
+
+    def messages(self, question: str) -> list[BaseMessage]:
+        """
+        Returns the prompt of the next turn: system prompt, summary of the earlier turns, recent turns and `question`.
+        """
+        messages = [self.system_message]
+        if self.summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}"))
+        for past_question, answer, _ in self.turns:
+            messages += [HumanMessage(content=past_question), AIMessage(content=answer)]
+        messages.append(HumanMessage(content=question))
+        return messages
@@ -0,0 +1,173 @@
+import hashlib
+import threading
+from contextvars import copy_context
+from collections import OrderedDict
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from llm.cache import open_sqlite
+from llm.batching import retry_call, DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_RETRIES
+from llm.instrumentation import get_metrics
+
+# Defaults (change as needed)
+DEFAULT_EMBEDDING_BATCH_SIZE = 256  # Texts per embedding request
+SQLITE_MAX_PARAMS = 500  # Keys per `IN (...)` lookup query
+DEFAULT_QUERY_CACHE_SIZE = 1024  # Query embeddings kept in memory (LRU)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embedding model wrapper with a persistent, content-addressed cache.
+
+    Document embeddings are stored in SQLite under (namespace, SHA-256 of the
+    text), where the namespace identifies the embedding model/deployment.
+    Only the texts that were never embedded before are sent to the underlying
+    model, in batches of `batch_size` texts with at most `max_concurrency`
+    requests in flight, each retried with backoff on rate limits. Rebuilding
+    an index from already seen texts therefore makes zero embedding calls.
+
+    Query embeddings are kept in an in-memory LRU cache, so a question that
+    is asked (or searched by the agent) again is embedded only once.
+    """
+
+    def __init__(self, underlying: Embeddings, database_path: str, namespace: str,
+                 batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_retries: int = DEFAULT_MAX_RETRIES, query_cache_size: int = DEFAULT_QUERY_CACHE_SIZE):
+        """
+        Args:
+            underlying: The embedding model that computes missing embeddings.
+            database_path: Path of the SQLite cache file.
+            namespace: Name of the embedding model/deployment (embeddings of different models never mix).
+            batch_size: Number of texts per embedding request.
+            max_concurrency: Maximum number of parallel embedding requests.
+            max_retries: Maximum number of attempts per request.
+            query_cache_size: Number of query embeddings kept in memory.
+        """
+        self.underlying = underlying
+        self.database_path = database_path
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.query_cache_size = query_cache_size
+
+        self.hits = 0
+        self.misses = 0
+        self.embedding_calls = 0
+        self.query_hits = 0
+        self.query_misses = 0
+        self._query_cache: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    namespace TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (namespace, text_hash)
+                )
+            """)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = open_sqlite(self.database_path)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _lookup(self, hashes: list[str]) -> dict[str, list[float]]:
+        found = {}
+        conn = self._connection()
+        for i in range(0, len(hashes), SQLITE_MAX_PARAMS):
+            batch = hashes[i:i + SQLITE_MAX_PARAMS]
+            rows = conn.execute(
+                f"SELECT text_hash, vector FROM embedding_cache WHERE namespace = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                (self.namespace, *batch)
+            )
+            for text_hash, vector in rows:
+                found[text_hash] = array('f', vector).tolist()
+        return found
+
+    def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            self.embedding_calls += 1
+        vectors = retry_call(self.underlying.embed_documents, texts, max_retries=self.max_retries)
+        get_metrics().record_embedding_call(texts)
+        return vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        hashes = [self._hash(text) for text in texts]
+        vectors = self._lookup(list(set(hashes)))
+
+        # Unique texts that were never embedded (in first-seen order)
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+
+        if missing:
+            missing_hashes = list(missing)
+            missing_texts = list(missing.values())
+            batches = [missing_texts[i:i + self.batch_size]
+                       for i in range(0, len(missing_texts), self.batch_size)]
+
+            # Each request runs in a copy of the caller's context (the calls are counted under its stage)
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+                futures = [executor.submit(copy_context().run, self._embed_batch, batch) for batch in batches]
+                new_vectors = [vector for future in futures for vector in future.result()]
+
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embedding_cache (namespace, text_hash, vector) VALUES (?, ?, ?)",
+                    [(self.namespace, text_hash, array('f', vector).tobytes())
+                     for text_hash, vector in zip(missing_hashes, new_vectors)]
+                )
+            vectors.update(zip(missing_hashes, new_vectors))
+
+        return [vectors[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        with self._lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+                self.query_hits += 1
+                return vector
+            self.query_misses += 1
+
+        vector = retry_call(self.underlying.embed_query, text, max_retries=self.max_retries)
+        get_metrics().record_embedding_call([text])
+
+        with self._lock:
+            self._query_cache[text] = vector
+            if len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+
+        return vector
+
+    def stats(self) -> dict:
+        """
+        Returns the document and query embedding cache counters of this process.
+        """
+        lookups = self.hits + self.misses
+        query_lookups = self.query_hits + self.query_misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'embedding_calls': self.embedding_calls,
+            'query_hits': self.query_hits,
+            'query_misses': self.query_misses,
+            'query_hit_rate': self.query_hits / query_lookups if query_lookups else 0.0
+        }
@@ -0,0 +1,265 @@
+import os
+import re
+import json
+import math
+import time
+import uuid
+import zlib
+import random
+import threading
+from typing import Any, Iterator
+from pydantic import PrivateAttr
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from lexical_index import tokenize
+from llm.providers import ProviderRateLimitError
+
+TIMESTAMP_PATTERN = re.compile(r"\b(\d{1,2}):(\d{2})\b")
+DURATION_PATTERN = re.compile(r"\b(\d+)\s*-?\s*(min|minute|minutes|sec|second|seconds|s)\b", re.IGNORECASE)
+
+
+def create_fake_chat_model() -> 'FakeChatModel':
+    """
+    Returns the fake chat model, configured by the environment: `FAKE_LLM_LATENCY` (seconds per call),
+    `FAKE_LLM_TOKENS_PER_SECOND` (output throughput, 0 for instant) and `FAKE_LLM_FAILURE_RATE` (0 to 1).
+    """
+    return FakeChatModel(latency=float(os.environ.get('FAKE_LLM_LATENCY', 0)),
+                         tokens_per_second=float(os.environ.get('FAKE_LLM_TOKENS_PER_SECOND', 0)),
+                         failure_rate=float(os.environ.get('FAKE_LLM_FAILURE_RATE', 0)))
+
+
+def create_fake_embeddings() -> 'FakeEmbeddings':
+    """
+    Returns the fake embedding model, configured by the environment: `FAKE_EMBEDDING_LATENCY`
+    (seconds per call) and `FAKE_EMBEDDING_FAILURE_RATE` (0 to 1).
+    """
+    return FakeEmbeddings(latency=float(os.environ.get('FAKE_EMBEDDING_LATENCY', 0)),
+                          failure_rate=float(os.environ.get('FAKE_EMBEDDING_FAILURE_RATE', 0)))
+
+
+def count_tokens(text: str) -> int:
+    # ~4 characters per token (no tokenizer download)
+    return max(1, len(text) // 4)
+
+
+def rate_limit_error() -> Exception:
+    """
+    Returns the error raised by a throttled provider call (retried like a real 429 by `llm.batching`).
+    """
+    return ProviderRateLimitError("Simulated rate limit (fake backend).")
+
+
+class FakeUsage:
+    """
+    Thread-safe counters of the calls made to a fake model (read them with `snapshot`).
+    """
+
+    def __init__(self, seed: int = 0):
+        self._counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def add(self, **counts: int):
+        with self._lock:
+            for name, value in counts.items():
+                self._counts[name] = self._counts.get(name, 0) + value
+
+    def fails(self, failure_rate: float) -> bool:
+        """
+        Draws whether the current call fails (reproducible for a given seed and call order).
+        """
+        if not failure_rate:
+            return False
+        with self._lock:
+            return self._random.random() < failure_rate
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic offline chat model, for load tests and development without API keys.
+
+    - Prompts with <SEG_X> markers (translation) are echoed unchanged.
+    - Other prompts (summaries) are answered with their first `summary_words` words.
+    - With bound tools, a user message is answered by a tool call chosen from
+      its wording (summary, summary per interval, timestamp, otherwise Q&A),
+      and the tool results are then turned into the final answer.
+
+    Every call sleeps `latency` seconds plus the output tokens divided by
+    `tokens_per_second`, and fails with a rate-limit error with probability
+    `failure_rate`. Calls, failures and tokens are counted in `usage`.
+    When streamed, the answer comes word by word at `tokens_per_second`.
+    """
+
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    failure_rate: float = 0.0
+    seed: int = 0
+    summary_words: int = 60
+    _usage: FakeUsage = PrivateAttr(default=None)
+
+    def model_post_init(self, context: Any):
+        super().model_post_init(context)
+        self._usage = FakeUsage(self.seed)
+
+    @property
+    def usage(self) -> FakeUsage:
+        return self._usage
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake-chat'
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {'summary_words': self.summary_words}
+
+    def bind_tools(self, tools: list, **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def get_num_tokens(self, text: str) -> int:
+        return count_tokens(text)
+
+    def _truncate(self, text: str) -> str:
+        return " ".join(text.split()[:self.summary_words])
+
+    @staticmethod
+    def _choose_tool(text: str, tool_names: set[str]) -> tuple[str, dict] | None:
+        lowered = text.lower()
+        duration = DURATION_PATTERN.search(text)
+        timestamp = TIMESTAMP_PATTERN.search(text)
+
+        if 'summar' in lowered and duration:
+            seconds = int(duration.group(1)) * (60 if duration.group(2).lower().startswith('m') else 1)
+            choice = ('Youtube_Video_Summarizer_Per_Given_Time_Chunk', {'time_in_sec': seconds})
+        elif 'summar' in lowered:
+            choice = ('Youtube_Video_Summarizer', {})
+        elif timestamp:
+            choice = ('Get_Time_Related_Information',
+                      {'time_in_sec': int(timestamp.group(1)) * 60 + int(timestamp.group(2))})
+        else:
+            choice = ('Question_Answering', {'query': text})
+
+        return choice if choice[0] in tool_names else None
+
+    def _respond(self, messages: list[BaseMessage], tools: list[dict] | None) -> tuple[AIMessage, int]:
+        # Latency and failures of the call, then the message and its input tokens
+        input_tokens = sum(count_tokens(m.content if isinstance(m.content, str) else str(m.content)) for m in messages)
+        if self.latency:
+            time.sleep(self.latency)
+        if self._usage.fails(self.failure_rate):
+            self._usage.add(calls=1, failures=1, input_tokens=input_tokens)
+            raise rate_limit_error()
+
+        last = messages[-1]
+        text = last.content if isinstance(last.content, str) else str(last.content)
+        tool_call = None
+
+        if tools and isinstance(last, HumanMessage):
+            tool_call = self._choose_tool(text, {t['function']['name'] for t in tools})
+
+        if tool_call:
+            name, args = tool_call
+            message = AIMessage(content='', tool_calls=[
+                {'name': name, 'args': args, 'id': f"call_{uuid.uuid4().hex[:12]}", 'type': 'tool_call'}])
+        elif isinstance(last, ToolMessage):
+            # Answer from every tool result of the turn
+            results = []
+            for m in reversed(messages):
+                if not isinstance(m, ToolMessage):
+                    break
+                results.append(str(m.content))
+            message = AIMessage(content=self._truncate(" ".join(reversed(results))))
+        elif '<SEG_' in text:
+            message = AIMessage(content=text)
+        else:
+            message = AIMessage(content=self._truncate(text))
+
+        return message, input_tokens
+
+    def _usage_metadata(self, input_tokens: int, output_tokens: int) -> dict:
+        self._usage.add(calls=1, input_tokens=input_tokens, output_tokens=output_tokens)
+        # Reported like the real providers (read by the instrumentation callbacks)
+        return {'input_tokens': input_tokens, 'output_tokens': output_tokens, 'total_tokens': input_tokens + output_tokens}
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None,
+                  tools: list[dict] | None = None, **kwargs: Any) -> ChatResult:
+        message, input_tokens = self._respond(messages, tools)
+
+        output_tokens = count_tokens(message.content) if message.content else 0
+        if self.tokens_per_second:
+            time.sleep(output_tokens / self.tokens_per_second)
+        message.usage_metadata = self._usage_metadata(input_tokens, output_tokens)
+
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None,
+                tools: list[dict] | None = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        message, input_tokens = self._respond(messages, tools)
+
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content='', tool_call_chunks=[
+                {'name': call['name'], 'args': json.dumps(call['args']), 'id': call['id'], 'index': i}
+                for i, call in enumerate(message.tool_calls)]))
+
+        output_tokens = count_tokens(message.content) if message.content else 0
+        for word in filter(None, re.findall(r"\S*\s*", message.content)):
+            if self.tokens_per_second:
+                time.sleep(output_tokens / self.tokens_per_second * len(word) / len(message.content))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content='', usage_metadata=self._usage_metadata(input_tokens, output_tokens)))
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic offline embedding model: hashed bag of words (without stop
+    words), L2-normalized. Texts sharing words are close, so retrieval behaves
+    plausibly in load tests. Calls, failures, texts and tokens are counted in `usage`.
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        """
+        Args:
+            size: Dimension of the vectors.
+            latency: Simulated latency of every call, in seconds.
+            failure_rate: Probability that a call fails with a rate-limit error.
+            seed: Seed of the failure draws.
+        """
+        self.size = size
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.usage = FakeUsage(seed)
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.size
+        for token in tokenize(text):
+            token_hash = zlib.crc32(token.encode('utf-8'))
+            vector[token_hash % self.size] += 1.0 if token_hash & 0x80000000 else -1.0
+
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _call(self, texts: list[str]):
+        tokens = sum(count_tokens(text) for text in texts)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.usage.fails(self.failure_rate):
+            self.usage.add(calls=1, failures=1)
+            raise rate_limit_error()
+        self.usage.add(calls=1, texts=len(texts), input_tokens=tokens)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self._call(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self._call([text])
+        return self._embed(text)
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import threading
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Any, Iterator
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from config import METRICS_LOG_PATH, LLM_PROMPT_PRICE_PER_MILLION, LLM_COMPLETION_PRICE_PER_MILLION, EMBEDDING_PRICE_PER_MILLION
+
+# Counters kept per stage
+COUNTERS = ('runs', 'seconds', 'llm_calls', 'llm_cached_calls', 'llm_errors', 'retries', 'prompt_tokens',
+            'completion_tokens', 'embedding_calls', 'embedding_texts', 'embedding_tokens', 'cost_usd')
+
+# Stage of the calls that run outside of any `stage` block
+OTHER_STAGE = 'other'
+
+PROMETHEUS_PREFIX = 'youtube_insight'
+PROMETHEUS_HELP = {
+    'runs': "Finished runs of the stage.",
+    'seconds': "Wall time spent in the stage.",
+    'llm_calls': "LLM calls (including cached responses).",
+    'llm_cached_calls': "LLM calls served by the response cache.",
+    'llm_errors': "LLM calls that raised an error.",
+    'retries': "Retried LLM / embedding calls.",
+    'prompt_tokens': "Prompt tokens sent to the LLM.",
+    'completion_tokens': "Completion tokens generated by the LLM.",
+    'embedding_calls': "Embedding requests.",
+    'embedding_texts': "Texts sent to the embedding model.",
+    'embedding_tokens': "Estimated tokens sent to the embedding model.",
+    'cost_usd': "Estimated cost in USD.",
+}
+
+
+class StageRun:
+    """
+    One run of a stage: its labels, start time and the counters of the calls made while it runs
+    (including the calls of nested stages).
+    """
+
+    def __init__(self, name: str, labels: dict, parent: 'StageRun | None'):
+        self.name = name
+        self.labels = labels
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.counts: dict[str, float] = {}
+
+
+class Metrics:
+    """
+    Process-wide, thread-safe counters of the work done per stage (fetch, group,
+    translate, embed, map, reduce, tool calls, planner turns).
+
+    Code runs a stage inside `stage(name)`. The LLM and embedding calls made
+    while it runs (from any thread started with a copy of the context, like
+    LangChain batches) are counted under the innermost stage, so the totals
+    per stage add up without double counting. Every finished stage run is
+    also appended to a JSON Lines log, with the calls of its nested stages.
+    """
+
+    def __init__(self, log_path: str | None = METRICS_LOG_PATH, prompt_price: float = LLM_PROMPT_PRICE_PER_MILLION,
+                 completion_price: float = LLM_COMPLETION_PRICE_PER_MILLION,
+                 embedding_price: float = EMBEDDING_PRICE_PER_MILLION):
+        """
+        Args:
+            log_path: JSON Lines file receiving one record per finished stage run (None to disable).
+            prompt_price: USD per million prompt tokens.
+            completion_price: USD per million completion tokens.
+            embedding_price: USD per million embedding tokens.
+        """
+        self.log_path = log_path
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self.embedding_price = embedding_price
+
+        self._totals: dict[str, dict[str, float]] = {}
+        self._current: ContextVar[StageRun | None] = ContextVar('instrumentation_stage', default=None)
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    def _add(self, stage_name: str | None, counts: dict[str, float], stage_run: StageRun | None = None):
+        with self._lock:
+            totals = self._totals.setdefault(stage_name or OTHER_STAGE, dict.fromkeys(COUNTERS, 0))
+            for name, value in counts.items():
+                totals[name] += value
+
+            # Runs of the enclosing stages include the calls of their nested stages
+            while stage_run is not None:
+                for name, value in counts.items():
+                    stage_run.counts[name] = stage_run.counts.get(name, 0) + value
+                stage_run = stage_run.parent
+
+    def _add_call(self, counts: dict[str, float]):
+        stage_run = self._current.get()
+        self._add(stage_run.name if stage_run else None, counts, stage_run)
+
+    def record_llm_call(self, prompt_tokens: int, completion_tokens: int, cached: bool = False):
+        if cached:
+            self._add_call({'llm_calls': 1, 'llm_cached_calls': 1})
+            return
+        cost = (prompt_tokens * self.prompt_price + completion_tokens * self.completion_price) / 1e6
+        self._add_call({'llm_calls': 1, 'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                        'cost_usd': cost})
+
+    def record_llm_error(self):
+        self._add_call({'llm_errors': 1})
+
+    def record_retry(self):
+        self._add_call({'retries': 1})
+
+    def record_embedding_call(self, texts: list[str]):
+        # ~4 characters per token (the embedding APIs don't report usage through LangChain)
+        tokens = sum(max(1, len(text) // 4) for text in texts)
+        self._add_call({'embedding_calls': 1, 'embedding_texts': len(texts), 'embedding_tokens': tokens,
+                        'cost_usd': tokens * self.embedding_price / 1e6})
+
+    @contextmanager
+    def stage(self, name: str, **labels: Any) -> Iterator[StageRun]:
+        """
+        Times a run of the stage `name` and counts the calls made inside it.
+        Also usable as a decorator. `labels` (e.g. a video id) are only written to the JSON log.
+        """
+        stage_run = StageRun(name, labels, self._current.get())
+        token = self._current.set(stage_run)
+        try:
+            yield stage_run
+        finally:
+            self._current.reset(token)
+            seconds = time.perf_counter() - stage_run.start
+            self._add(name, {'runs': 1, 'seconds': seconds})
+            self._log(stage_run, seconds)
+
+    def _log(self, stage_run: StageRun, seconds: float):
+        if not self.log_path:
+            return
+
+        record = {'time': time.time(), 'stage': stage_run.name, **stage_run.labels, 'seconds': round(seconds, 6),
+                  **{name: stage_run.counts.get(name, 0) for name in COUNTERS[2:]}}
+        with self._log_lock:
+            if os.path.dirname(self.log_path):
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """
+        Returns the totals per stage (calls made outside of any stage are under `other`).
+        """
+        with self._lock:
+            return {stage_name: dict(counts) for stage_name, counts in self._totals.items()}
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the totals in the Prometheus text exposition format (one counter per metric, labelled by stage).
+        """
+        totals = self.snapshot()
+        lines = []
+        for name in COUNTERS:
+            metric = f"{PROMETHEUS_PREFIX}_stage_{name}_total"
+            lines.append(f"# HELP {metric} {PROMETHEUS_HELP[name]}")
+            lines.append(f"# TYPE {metric} counter")
+            for stage_name, counts in sorted(totals.items()):
+                label = stage_name.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                lines.append(f'{metric}{{stage="{label}"}} {counts[name]:.10g}')
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentationHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler feeding `Metrics`: LLM calls, tokens (from the
+    usage reported by the model), errors and retries.
+
+    It is attached to the chat model itself, so every chain and the agent
+    graph report their LLM calls without passing callbacks around, and to
+    the retrying chains (`llm.batching.with_backoff`), which tag the run of
+    every new attempt with `retry:attempt:<n>`.
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def on_chain_start(self, serialized: dict, inputs: Any, *, run_id: UUID, tags: list[str] | None = None,
+                       **kwargs: Any):
+        if any(tag.startswith('retry:attempt:') for tag in tags or ()):
+            self.metrics.record_retry()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        prompt_tokens = completion_tokens = 0
+        cached = False
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+                if usage:
+                    prompt_tokens += usage.get('input_tokens', 0)
+                    completion_tokens += usage.get('output_tokens', 0)
+                    # Responses replayed from the LLM cache are marked with a zero cost
+                    cached = cached or usage.get('total_cost') == 0
+
+        if not prompt_tokens and not completion_tokens:
+            token_usage = (response.llm_output or {}).get('token_usage') or {}
+            prompt_tokens = token_usage.get('prompt_tokens', 0)
+            completion_tokens = token_usage.get('completion_tokens', 0)
+
+        self.metrics.record_llm_call(prompt_tokens, completion_tokens, cached=cached)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self.metrics.record_llm_error()
+
+
+_metrics = None
+_handler = None
+_instrumentation_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """
+    Returns the process-wide metrics (logging to `config.METRICS_LOG_PATH`), created on first use.
+    """
+    global _metrics
+    with _instrumentation_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+def get_callback_handler() -> InstrumentationHandler:
+    """
+    Returns the callback handler attached to the chat model and the retrying chains (one per process).
+    """
+    global _handler
+    metrics = get_metrics()
+    with _instrumentation_lock:
+        if _handler is None:
+            _handler = InstrumentationHandler(metrics)
+        return _handler
+
+
+def stage(name: str, **labels: Any):
+    """
+    `with stage('translate'):` (or `@stage('map')`) times the block and counts its LLM / embedding calls.
+    """
+    return get_metrics().stage(name, **labels)
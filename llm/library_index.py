@@ -0,0 +1,398 @@
+import os
+import time
+import threading
+import numpy as np
+from typing import Iterable, Iterator
+from contextlib import contextmanager
+from config import (LIBRARY_INDEX_PATH, LIBRARY_INDEX_GRANULARITY, LIBRARY_HNSW_THRESHOLD,
+                    LIBRARY_EXACT_SEARCH_MAX_CHUNKS)
+from timeline import TimelineIndex
+from llm.cache import open_sqlite
+from llm.providers import get_embeddings
+from llm.instrumentation import stage
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lock between processes, only one of them may add videos at a time
+    fcntl = None
+
+# Defaults (change as needed)
+DEFAULT_HNSW_THRESHOLD = 50_000  # Vectors above which searches go through the HNSW graph
+DEFAULT_EXACT_SEARCH_MAX_CHUNKS = 20_000  # Filtered searches over at most this many chunks are exact
+HNSW_M = 32  # Neighbors per node of the graph
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 96  # Candidates explored per search (recall vs. latency)
+SNAPSHOT_GROWTH = 0.1  # The graph is saved again once it grew by this share since the last save
+BUILD_BATCH_SIZE = 65_536  # Vectors added to the graph at once when it is (re)built
+
+VECTORS_FILE = 'vectors.f32'
+GRAPH_FILE = 'hnsw.faiss'
+METADATA_FILE = 'library.sqlite'
+LOCK_FILE = 'library.lock'
+
+
+def normalize(vectors) -> np.ndarray:
+    """
+    Returns the vectors as a float32 matrix of unit rows (inner product = cosine similarity).
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype='float32'))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class LibraryIndex:
+    """
+    One vector index over the chunks of every ingested video, to answer
+    questions across a channel, a playlist or the whole library.
+
+    Vectors are appended to a flat float32 file and their metadata (video id,
+    start / end time, text) to SQLite, under the same sequential ids, so adding
+    a video only writes its own chunks (no rebuild). Below `hnsw_threshold`
+    vectors, searches are exact (one matrix product over the memory-mapped
+    file). Past it, an HNSW graph is built once and then grows with every added
+    video, so query latency stays roughly flat as the library grows; the graph
+    is saved again after every `SNAPSHOT_GROWTH` growth (and by `save`), and
+    the vectors added since the last save are re-added on load.
+
+    Searches restricted to some videos read their id ranges from SQLite; small
+    selections are searched exactly over their own vectors (cost independent
+    of the library size), larger ones through the graph with an id filter.
+
+    Several processes can add videos to the same index (e.g. the HTTP service
+    and a batch ingestion): writes hold a file lock, and catch up with the
+    videos added by the other processes before appending.
+    """
+
+    def __init__(self, path: str, hnsw_threshold: int = DEFAULT_HNSW_THRESHOLD,
+                 exact_search_max_chunks: int = DEFAULT_EXACT_SEARCH_MAX_CHUNKS):
+        """
+        Args:
+            path: Folder of the index files (created if needed).
+            hnsw_threshold: Number of vectors above which the HNSW graph is used.
+            exact_search_max_chunks: Filtered searches over at most this many chunks are exact.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.hnsw_threshold = hnsw_threshold
+        self.exact_search_max_chunks = exact_search_max_chunks
+        self._local = threading.local()
+        self._lock = threading.RLock()
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    video_id TEXT NOT NULL,
+                    start REAL NOT NULL,
+                    end REAL NOT NULL,
+                    text TEXT NOT NULL
+                )
+            """)
+            # The chunks of a video have consecutive ids: [first_id, first_id + count)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    first_id INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    added_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+        self._vectors = None
+        self._graph = None
+        self._graph_saved = 0
+        with self._write_lock():
+            self._load_meta()
+            self.ntotal = self._recover()
+            self._load_graph()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = open_sqlite(os.path.join(self.path, METADATA_FILE))
+            self._local.conn = conn
+        return conn
+
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, VECTORS_FILE)
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        """
+        Holds the index files for writing, in this process and across processes.
+        """
+        with self._lock, open(os.path.join(self.path, LOCK_FILE), 'a') as lock_file:
+            if fcntl is not None:
+                # Released when the file is closed
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _load_meta(self):
+        meta = dict(self._connection().execute("SELECT key, value FROM meta").fetchall())
+        self.dim = int(meta['dim']) if 'dim' in meta else None
+        self.namespace = meta.get('namespace')
+
+    def _refresh(self):
+        """
+        Catches up with the videos added by other processes (under the write lock).
+        """
+        self._load_meta()
+        self.ntotal = self._recover()
+        if self._graph is None:
+            # Built (and saved) by another process
+            self._load_graph()
+        elif self._graph.ntotal < self.ntotal:
+            self._add_to_graph(self._get_vectors()[self._graph.ntotal:])
+
+    def _recover(self) -> int:
+        """
+        Drops the vectors / metadata of an add that was interrupted, and returns the number of vectors.
+        """
+        count = self._connection().execute("SELECT COALESCE(MAX(id) + 1, 0) FROM chunks").fetchone()[0]
+        if self.dim is None:
+            return 0
+
+        row_size = self.dim * 4
+        stored = os.path.getsize(self._vectors_path()) // row_size if os.path.exists(self._vectors_path()) else 0
+        if stored < count:
+            # Vectors are written before their metadata: only a lost file gets here. The videos
+            # whose vectors are incomplete are dropped whole (chunks and remaining vectors)
+            with self._connection() as conn:
+                conn.execute("DELETE FROM videos WHERE first_id + count > ?", (stored,))
+                count = conn.execute("SELECT COALESCE(MAX(first_id + count), 0) FROM videos").fetchone()[0]
+                conn.execute("DELETE FROM chunks WHERE id >= ?", (count,))
+        if os.path.exists(self._vectors_path()) and os.path.getsize(self._vectors_path()) != count * row_size:
+            with open(self._vectors_path(), 'r+b') as f:
+                f.truncate(count * row_size)
+        return count
+
+    def _load_graph(self):
+        graph_path = os.path.join(self.path, GRAPH_FILE)
+        if os.path.exists(graph_path):
+            import faiss
+            graph = faiss.read_index(graph_path)
+            if graph.ntotal <= self.ntotal:
+                self._graph, self._graph_saved = graph, graph.ntotal
+                # Vectors added since the last save
+                self._add_to_graph(self._get_vectors()[graph.ntotal:])
+                return
+        if self.ntotal >= self.hnsw_threshold:
+            self._build_graph()
+
+    def _get_vectors(self) -> np.ndarray:
+        if self._vectors is None or len(self._vectors) != self.ntotal:
+            if not self.ntotal:
+                return np.empty((0, self.dim or 0), dtype='float32')
+            self._vectors = np.memmap(self._vectors_path(), dtype='float32', mode='r', shape=(self.ntotal, self.dim))
+        return self._vectors
+
+    def _add_to_graph(self, vectors: np.ndarray):
+        for i in range(0, len(vectors), BUILD_BATCH_SIZE):
+            self._graph.add(np.ascontiguousarray(vectors[i:i + BUILD_BATCH_SIZE]))
+
+    def _build_graph(self):
+        import faiss
+        print(f"Library index: building the HNSW graph of {self.ntotal} vectors...")
+        self._graph = faiss.IndexHNSWFlat(self.dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        self._graph.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        self._add_to_graph(self._get_vectors())
+        self._save()
+
+    def _save(self):
+        if self._graph is None or self._graph.ntotal == self._graph_saved:
+            return
+        import faiss
+        graph_path = os.path.join(self.path, GRAPH_FILE)
+        faiss.write_index(self._graph, graph_path + '.tmp')
+        os.replace(graph_path + '.tmp', graph_path)
+        self._graph_saved = self._graph.ntotal
+
+    def save(self):
+        """
+        Saves the HNSW graph (if any). The vectors and metadata are saved by every `add`.
+        """
+        with self._write_lock():
+            self._save()
+
+    def __len__(self) -> int:
+        return self.ntotal
+
+    def has(self, video_id: str) -> bool:
+        return self._connection().execute("SELECT 1 FROM videos WHERE video_id = ?", (video_id,)).fetchone() is not None
+
+    def add(self, video_id: str, chunks: list[dict], vectors, namespace: str | None = None) -> int:
+        """
+        Adds the chunks of a video ('start', 'end' and 'text' dictionaries) with their embeddings.
+
+        Args:
+            video_id: Video id (a video already in the index is skipped).
+            chunks: Chunks of the video.
+            vectors: One embedding per chunk.
+            namespace: Embedding model of the vectors (vectors of different models never mix).
+
+        Returns:
+            The number of chunks added.
+
+        Raises:
+            ValueError: If the vectors don't match the model or the dimension of the index.
+        """
+        if not chunks:
+            return 0
+        vectors = normalize(vectors)
+
+        with self._write_lock():
+            # Ids continue from the vectors on disk, whichever process wrote them
+            self._refresh()
+            if self.has(video_id):
+                return 0
+
+            if self.dim is None:
+                self.dim, self.namespace = vectors.shape[1], namespace
+                with self._connection() as conn:
+                    conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                     [('dim', str(self.dim))] + ([('namespace', namespace)] if namespace else []))
+            if vectors.shape != (len(chunks), self.dim):
+                raise ValueError(f"Expected {len(chunks)} vectors of dimension {self.dim}, got {vectors.shape}.")
+            if namespace and self.namespace and namespace != self.namespace:
+                raise ValueError(f"The library index was built with the '{self.namespace}' embeddings, not '{namespace}'.")
+
+            # Vectors first: an add interrupted before its metadata is committed is dropped on load
+            first_id = self.ntotal
+            with open(self._vectors_path(), 'ab') as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            with self._connection() as conn:
+                conn.executemany("INSERT INTO chunks (id, video_id, start, end, text) VALUES (?, ?, ?, ?, ?)",
+                                 [(first_id + i, video_id, c['start'], c['end'], c['text']) for i, c in enumerate(chunks)])
+                conn.execute("INSERT INTO videos (video_id, first_id, count, added_at) VALUES (?, ?, ?, ?)",
+                             (video_id, first_id, len(chunks), time.time()))
+            self.ntotal += len(chunks)
+
+            if self._graph is not None:
+                self._add_to_graph(vectors)
+                if self._graph.ntotal - self._graph_saved >= SNAPSHOT_GROWTH * max(1, self._graph_saved):
+                    self._save()
+            elif self.ntotal >= self.hnsw_threshold:
+                self._build_graph()
+
+        return len(chunks)
+
+    def add_video(self, video_id: str, timeline: TimelineIndex, granularity: int | float = LIBRARY_INDEX_GRANULARITY) -> int:
+        """
+        Adds a video from its English timeline, grouped into `granularity` chunks. Their
+        embeddings come from the embedding cache when the video store was built with the same chunks.
+
+        Returns:
+            The number of chunks added (0 if the video was already in the index).
+        """
+        if self.has(video_id):
+            return 0
+        with stage('library', video_id=video_id):
+            chunks = timeline.grouped(granularity)
+            embeddings = get_embeddings()
+            vectors = embeddings.embed_documents(chunks.texts())
+            return self.add(video_id, chunks.to_records(), vectors, namespace=getattr(embeddings, 'namespace', None))
+
+    def _ids_of(self, video_ids: Iterable[str]) -> np.ndarray:
+        video_ids = list(video_ids)
+        ranges = []
+        conn = self._connection()
+        # Bounded number of SQL variables per query
+        for i in range(0, len(video_ids), 500):
+            part = video_ids[i:i + 500]
+            ranges += conn.execute(f"SELECT first_id, count FROM videos WHERE video_id IN ({', '.join('?' * len(part))})",
+                                   part).fetchall()
+        ranges = [(first_id, count) for first_id, count in ranges if first_id + count <= self.ntotal]
+        if not ranges:
+            return np.empty(0, dtype='int64')
+        return np.concatenate([np.arange(first_id, first_id + count, dtype='int64') for first_id, count in ranges])
+
+    @staticmethod
+    def _exact_search(vectors: np.ndarray, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        scores = vectors @ query
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return scores[top], top
+
+    def search(self, query_vector, k: int = 5, video_ids: Iterable[str] | None = None) -> list[dict]:
+        """
+        Returns the `k` chunks most similar to the query (best first), as
+        `{'video_id', 'start', 'end', 'text', 'score'}` dictionaries (score: cosine similarity).
+
+        Args:
+            query_vector: Embedding of the query.
+            k: Number of chunks to return.
+            video_ids: Only search these videos (e.g. the videos of a channel or a playlist).
+        """
+        query = normalize(query_vector)[0]
+
+        with self._lock:
+            if not self.ntotal:
+                return []
+
+            if video_ids is not None:
+                ids = self._ids_of(video_ids)
+                if not len(ids):
+                    return []
+                if self._graph is None or len(ids) <= self.exact_search_max_chunks:
+                    scores, positions = self._exact_search(self._get_vectors()[ids], query, k)
+                    ids = ids[positions]
+                else:
+                    import faiss
+                    params = faiss.SearchParametersHNSW(sel=faiss.IDSelectorBatch(ids), efSearch=max(HNSW_EF_SEARCH, k))
+                    scores, ids = self._graph.search(query[None, :], k, params=params)
+                    scores, ids = scores[0], ids[0]
+            elif self._graph is not None:
+                import faiss
+                params = faiss.SearchParametersHNSW(efSearch=max(HNSW_EF_SEARCH, k))
+                scores, ids = self._graph.search(query[None, :], k, params=params)
+                scores, ids = scores[0], ids[0]
+            else:
+                scores, ids = self._exact_search(self._get_vectors(), query, k)
+
+        found = [(int(i), float(score)) for i, score in zip(ids, scores) if i >= 0]
+        if not found:
+            return []
+        rows = self._connection().execute(
+            f"SELECT id, video_id, start, end, text FROM chunks WHERE id IN ({', '.join('?' * len(found))})",
+            [i for i, _ in found]).fetchall()
+        chunks = {row[0]: row[1:] for row in rows}
+
+        return [{'video_id': chunks[i][0], 'start': chunks[i][1], 'end': chunks[i][2], 'text': chunks[i][3],
+                 'score': score} for i, score in found if i in chunks]
+
+    def stats(self) -> dict:
+        videos = self._connection().execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+        return {'videos': videos, 'vectors': self.ntotal, 'dim': self.dim, 'hnsw': self._graph is not None}
+
+
+def search_library(query: str, k: int = 5, video_ids: Iterable[str] | None = None) -> list[dict]:
+    """
+    Embeds the query and searches the library index (see `LibraryIndex.search`).
+    """
+    index = get_library_index()
+    if not len(index):
+        return []
+    return index.search(get_embeddings().embed_query(query), k=k, video_ids=video_ids)
+
+
+_library_index = None
+_library_index_lock = threading.Lock()
+
+
+def get_library_index() -> LibraryIndex:
+    """
+    Returns the process-wide library index (`config.LIBRARY_INDEX_PATH`), opened on first use.
+    """
+    global _library_index
+    with _library_index_lock:
+        if _library_index is None:
+            _library_index = LibraryIndex(LIBRARY_INDEX_PATH, hnsw_threshold=LIBRARY_HNSW_THRESHOLD,
+                                          exact_search_max_chunks=LIBRARY_EXACT_SEARCH_MAX_CHUNKS)
+        return _library_index
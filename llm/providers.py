@@ -0,0 +1,169 @@
+import os
+import threading
+from typing import TYPE_CHECKING
+from dotenv import load_dotenv
+from config import (LLM_PROVIDER, GEMINI_CHAT_MODEL, GEMINI_EMBEDDING_MODEL, EMBEDDING_CACHE_PATH, HTTP_MAX_CONNECTIONS,
+                    HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+from llm.instrumentation import get_callback_handler
+
+if TYPE_CHECKING:
+    import httpx
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from llm.embedding_cache import CachedEmbeddings
+
+load_dotenv()
+
+PROVIDERS = ('azure', 'gemini', 'fake')
+
+# name -> client, built on first use and shared by the whole process
+_clients: dict[str, object] = {}
+_clients_lock = threading.RLock()
+
+
+class ProviderRateLimitError(Exception):
+    """
+    Throttled call of a client without its own error types (the fake models), retried like a 429.
+    """
+
+
+def get_provider() -> str:
+    """
+    Returns the configured model provider (`LLM_PROVIDER` environment variable, else `config.LLM_PROVIDER`).
+
+    Raises:
+        ValueError: If the provider is unknown.
+    """
+    provider = os.environ.get('LLM_PROVIDER', LLM_PROVIDER).lower()
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider '{provider}', expected one of {', '.join(PROVIDERS)}.")
+    return provider
+
+
+def _get_or_create(name: str, factory):
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = factory()
+        return client
+
+
+def get_http_client() -> 'httpx.Client':
+    """
+    Returns the HTTP client shared by the Azure model clients: one keep-alive connection
+    pool (bounded), so requests reuse connections instead of opening new ones.
+    The Gemini clients don't accept an HTTP client: each keeps its own channel.
+    """
+    def create():
+        import httpx
+        return httpx.Client(
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        )
+    return _get_or_create('http', create)
+
+
+def _create_chat_model() -> 'BaseChatModel':
+    provider = get_provider()
+    # Every call of the model is counted (calls, tokens, errors), whichever chain makes it
+    callbacks = [get_callback_handler()]
+
+    if provider == 'fake':
+        from llm.fake import create_fake_chat_model
+        chat_model = create_fake_chat_model()
+        chat_model.callbacks = callbacks
+        return chat_model
+
+    if provider == 'gemini':
+        # No HTTP client can be passed (Google client library): its own channel is reused by every call
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=GEMINI_CHAT_MODEL, temperature=0.2, callbacks=callbacks)
+
+    from langchain_openai import AzureChatOpenAI
+    return AzureChatOpenAI(
+        api_key=os.environ["AZURE_OPENAI_GPT4O_API_KEY"],
+        azure_deployment=os.environ["AZURE_OPENAI_GPT4O_DEPLOYMENT_NAME"],
+        azure_endpoint=os.environ["AZURE_OPENAI_GPT4O_ENDPOINT"],
+        api_version=os.environ["AZURE_OPENAI_GPT4O_API_VERSION"],
+        http_client=get_http_client(),
+        callbacks=callbacks
+    )
+
+
+def _create_embeddings() -> 'CachedEmbeddings':
+    from llm.embedding_cache import CachedEmbeddings
+    provider = get_provider()
+
+    if provider == 'fake':
+        from llm.fake import create_fake_embeddings
+        base_embedding, namespace = create_fake_embeddings(), 'fake'
+    elif provider == 'gemini':
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        base_embedding, namespace = GoogleGenerativeAIEmbeddings(model=GEMINI_EMBEDDING_MODEL), GEMINI_EMBEDDING_MODEL
+    else:
+        from langchain_openai import AzureOpenAIEmbeddings
+        base_embedding = AzureOpenAIEmbeddings(
+            api_key=os.environ["AZURE_OPENAI_EMBEDDINGS_ADA_API_KEY"],
+            api_version=os.environ["AZURE_OPENAI_API_EMBEDDINGS_ADA_VERSION"],
+            azure_deployment=os.environ["AZURE_OPENAI_EMBEDDINGS_ADA_DEPLOYEMENT_NAME"],
+            azure_endpoint=os.environ["AZURE_OPENAI_API_EMBEDDINGS_ADA_ENDPOINT"],
+            http_client=get_http_client()
+        )
+        namespace = os.environ["AZURE_OPENAI_EMBEDDINGS_ADA_DEPLOYEMENT_NAME"]
+
+    # Persistent embedding cache: already seen texts are never embedded again
+    return CachedEmbeddings(base_embedding, database_path=EMBEDDING_CACHE_PATH, namespace=namespace)
+
+
+def get_chat_model() -> 'BaseChatModel':
+    """
+    Returns the chat model of the configured provider, built on first use and shared by the process.
+    """
+    return _get_or_create('chat', _create_chat_model)
+
+
+def get_embeddings() -> 'CachedEmbeddings':
+    """
+    Returns the embedding model of the configured provider (behind the persistent
+    embedding cache), built on first use and shared by the process.
+    """
+    return _get_or_create('embeddings', _create_embeddings)
+
+
+def _create_retryable_errors() -> tuple[type[Exception], ...]:
+    provider = get_provider()
+    errors = (ProviderRateLimitError,)
+
+    if provider == 'azure':
+        from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+        errors += (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+    elif provider == 'gemini':
+        from google.genai.errors import ServerError
+        errors += (ServerError,)
+        try:
+            # Raised for throttled calls by recent versions of the Gemini integration
+            from langchain_core.exceptions import ModelRateLimitError
+            errors += (ModelRateLimitError,)
+        except ImportError:
+            pass
+    return errors
+
+
+def get_retryable_errors() -> tuple[type[Exception], ...]:
+    """
+    Returns the errors worth retrying with the configured provider: throttling (429) and
+    transient network / server failures. Its client library is only imported on first use.
+    """
+    return _get_or_create('retryable_errors', _create_retryable_errors)
+
+
+def set_clients(chat_model: 'BaseChatModel | None' = None, embeddings: 'CachedEmbeddings | None' = None):
+    """
+    Replaces the shared chat and/or embedding model (e.g. offline fakes in the benchmarks).
+    """
+    with _clients_lock:
+        if chat_model is not None:
+            _clients['chat'] = chat_model
+        if embeddings is not None:
+            _clients['embeddings'] = embeddings
@@ -0,0 +1,336 @@
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Callable, Iterable, Iterator
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from timeline import TimelineIndex
+from store import VideoStore
+from llm.summarizer import map_summarize, REDUCE_CHAIN_TEMPLATE, INTERVAL_MAP_CHAIN_TEMPLATE
+from llm.batching import batch_invoke, iter_batch_invoke, iter_in_order, DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_RETRIES
+from llm.providers import get_chat_model
+from llm.instrumentation import stage
+
+# Defaults (change as needed)
+DEFAULT_BASE_WINDOW = 60  # Seconds covered by a leaf of the pyramid
+
+Node = tuple[int, int]  # (level, position): covers leaves [position * 2**level, (position + 1) * 2**level)
+ChunkRange = tuple[int, int]  # [first, last) chunk indexes, saved next to the nodes as (-(last - first), first)
+Piece = tuple[str, tuple[int, int]]  # ('node', node) or ('chunks', (first, last)): consecutive part of an interval
+
+
+def summarize_leaves(texts: list[str], max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                     max_retries: int = DEFAULT_MAX_RETRIES) -> list[str]:
+    """
+    Summarizes the texts of pyramid leaves (one summary per text, in the same order).
+    """
+    # Leaves are shown as they are when an interval is a single base window
+    return map_summarize(get_chat_model(), texts, template=INTERVAL_MAP_CHAIN_TEMPLATE,
+                         max_concurrency=max_concurrency, max_retries=max_retries)
+
+
+class SummaryPyramid:
+    """
+    Hierarchy of summaries of a video (a binary segment tree), built once and
+    persisted, from which summaries of any interval are assembled.
+
+    The leaves summarize aligned base windows (`[k * base_window, (k + 1) * base_window)`,
+    each holding the chunks that start in it), and every node above summarizes
+    its two children. An interval (cut exactly like `TimelineIndex.grouped`) is
+    split into the few nodes that exactly cover its whole base windows (at most
+    ~2 log2(interval / base window) of them) and the chunks at its edges that
+    only fill part of a base window.
+
+    Once its nodes exist, an interval summary is the node summaries themselves,
+    labelled with their time ranges: only the edge chunks need an LLM call.
+    Intervals whose nodes are missing are summarized directly from their text,
+    so the first request on a video costs one call per interval and streams its
+    first summary after about one call; the pyramid can then be filled in the
+    background (or at ingestion, see `build`) for the next requests. Nodes are
+    saved as soon as a level is done, and the summaries of chunk ranges (edges,
+    intervals summarized directly) are saved too, so asking for the same
+    intervals again costs no call at all.
+    """
+
+    def __init__(self, timeline: TimelineIndex, base_window: int | float = DEFAULT_BASE_WINDOW,
+                 video_id: str | None = None, store: VideoStore | None = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, max_retries: int = DEFAULT_MAX_RETRIES,
+                 background_fill: bool = False):
+        """
+        Args:
+            timeline: English chunks of the video.
+            base_window: Seconds covered by a leaf.
+            video_id: Id of the video in the store (the summaries are only kept in memory without it).
+            store: Store persisting the summaries.
+            max_concurrency: Maximum number of parallel LLM calls.
+            max_retries: Maximum number of attempts per call.
+            background_fill: Whether to build the whole pyramid in a background thread after
+                             a request that had to summarize intervals directly.
+        """
+        self.timeline = timeline
+        self.base_window = base_window
+        self.video_id = video_id
+        self.store = store if video_id else None
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.background_fill = background_fill
+
+        # Chunks of every leaf, as [first, last) chunk indexes
+        count = int(timeline.starts[-1] // base_window) + 1 if len(timeline) else 0
+        bounds = [bisect_left(timeline.starts, k * base_window) for k in range(count)] + [len(timeline)]
+        self.leaves = list(zip(bounds, bounds[1:]))
+        self.height = max(0, count - 1).bit_length()
+        self._leaf_firsts = bounds[:-1]
+        self._leaf_lasts = bounds[1:]
+
+        saved = self.store.load_summaries(video_id, base_window) if self.store else {}
+        self._summaries: dict[Node, str] = {node: summary for node, summary in saved.items() if node[0] >= 0}
+        self._range_summaries: dict[ChunkRange, str] = {(position, position - level): summary
+                                                        for (level, position), summary in saved.items() if level < 0}
+        self._lock = threading.Lock()
+        self._fill_lock = threading.Lock()
+        self._fill_thread = None
+
+    def __len__(self) -> int:
+        """
+        Number of nodes already summarized.
+        """
+        return len(self._summaries)
+
+    def _children(self, node: Node) -> list[Node]:
+        level, position = node
+        return [(level - 1, child) for child in (2 * position, 2 * position + 1)
+                if child << (level - 1) < len(self.leaves)]
+
+    @staticmethod
+    def cover(first_leaf: int, last_leaf: int) -> list[Node]:
+        """
+        Returns the nodes that exactly cover leaves `first_leaf` to `last_leaf` (exclusive), in order.
+        """
+        nodes = []
+        while first_leaf < last_leaf:
+            level = 0
+            while first_leaf % (2 << level) == 0 and first_leaf + (2 << level) <= last_leaf:
+                level += 1
+            nodes.append((level, first_leaf >> level))
+            first_leaf += 1 << level
+        return nodes
+
+    def intervals(self, time_in_sec: int | float) -> list[tuple[int, int]]:
+        """
+        Returns the chunk ranges `[first, last)` of the `time_in_sec` intervals: the same
+        windows as `timeline.grouped(time_in_sec)` (an interval can't be shorter than a chunk).
+        """
+        return self.timeline.group_bounds(time_in_sec)
+
+    def pieces(self, first: int, last: int) -> list[Piece]:
+        """
+        Splits chunks `first` to `last` (exclusive) into the nodes covering the base windows
+        entirely inside the range, and the chunks before / after them, in order.
+        """
+        # Leaves whose chunks all lie within the range
+        first_leaf = bisect_left(self._leaf_firsts, first)
+        last_leaf = bisect_right(self._leaf_lasts, last)
+        if first_leaf >= last_leaf:
+            return [('chunks', (first, last))]
+
+        pieces = []
+        if self.leaves[first_leaf][0] > first:
+            pieces.append(('chunks', (first, self.leaves[first_leaf][0])))
+        pieces += [('node', node) for node in self.cover(first_leaf, last_leaf)]
+        if self.leaves[last_leaf - 1][1] < last:
+            pieces.append(('chunks', (self.leaves[last_leaf - 1][1], last)))
+        return pieces
+
+    def node_range(self, node: Node) -> ChunkRange:
+        """
+        Returns the `[first, last)` chunk indexes of the leaves below `node`.
+        """
+        level, position = node
+        first_leaf = position << level
+        last_leaf = min((position + 1) << level, len(self.leaves))
+        return self.leaves[first_leaf][0], self.leaves[last_leaf - 1][1]
+
+    def _label(self, first: int, last: int, summary: str) -> str:
+        return f"FROM {self.timeline.starts[first]}s to {self.timeline.ends[last - 1]}s: {summary}"
+
+    def _build(self, nodes: Iterable[Node]) -> Iterator[int]:
+        """
+        Summarizes the missing nodes among `nodes` (and the missing nodes below them), lowest level
+        first, yielding the number of nodes summarized after every level.
+        """
+        missing: dict[int, set[int]] = {}
+        stack = [node for node in nodes if node not in self._summaries]
+        while stack:
+            node = stack.pop()
+            level, position = node
+            if node in self._summaries or position in missing.get(level, ()):
+                continue
+            missing.setdefault(level, set()).add(position)
+            if level:
+                stack.extend(self._children(node))
+
+        llm = get_chat_model()
+        reduce_chain = ChatPromptTemplate.from_messages(REDUCE_CHAIN_TEMPLATE) | llm | StrOutputParser()
+
+        for level in sorted(missing):
+            positions = sorted(missing[level])
+            summaries = {}
+            if level == 0:
+                texts = {}
+                for position in positions:
+                    first, last = self.leaves[position]
+                    texts[position] = self.timeline.text_between(first, last - 1) if last > first else ''
+                # Windows without speech need no call
+                to_summarize = [position for position in positions if texts[position]]
+                summaries = dict.fromkeys(positions, '')
+                outputs = summarize_leaves([texts[position] for position in to_summarize],
+                                           max_concurrency=self.max_concurrency, max_retries=self.max_retries)
+                summaries.update(zip(to_summarize, outputs))
+            else:
+                to_reduce = []
+                for position in positions:
+                    children = [self._summaries[child] for child in self._children((level, position))]
+                    children = [summary for summary in children if summary]
+                    # A single (or no) summary below is reused as it is
+                    if len(children) < 2:
+                        summaries[position] = children[0] if children else ''
+                    else:
+                        to_reduce.append((position, "\n".join(children)))
+                outputs = batch_invoke(reduce_chain, [document for _, document in to_reduce],
+                                       max_concurrency=self.max_concurrency, max_retries=self.max_retries)
+                summaries.update(zip((position for position, _ in to_reduce), outputs))
+
+            built = {(level, position): summary for position, summary in summaries.items()}
+            self._summaries.update(built)
+            # Saved level by level: an interrupted build resumes from the last finished level
+            if self.store:
+                self.store.save_summaries(self.video_id, self.base_window, built)
+            yield len(built)
+
+    def add_leaves(self, summaries: dict[int, str]):
+        """
+        Adds leaf summaries made elsewhere with `summarize_leaves`, by leaf position
+        (e.g. by the ingestion pipeline while the video is translated).
+        """
+        built = {(0, position): summary for position, summary in summaries.items() if position < len(self.leaves)}
+        with self._lock:
+            self._summaries.update(built)
+            if self.store:
+                self.store.save_summaries(self.video_id, self.base_window, built)
+
+    def build(self) -> int:
+        """
+        Summarizes every node up to the root (e.g. at ingestion).
+
+        Returns:
+            The number of nodes summarized now (0 if the pyramid was complete).
+        """
+        if not self.leaves:
+            return 0
+        with self._lock, stage('pyramid', video_id=self.video_id):
+            return sum(self._build([(self.height, 0)]))
+
+    def _fill(self):
+        try:
+            self.build()
+        except Exception as e:
+            # Only a cache for the next requests: they summarize their intervals directly meanwhile
+            print(f"Summary pyramid not built: {type(e).__name__}: {e}")
+
+    def fill_in_background(self) -> threading.Thread | None:
+        """
+        Builds the whole pyramid in a background thread (unless one is already running).
+
+        Returns:
+            The thread building the pyramid, or None if it is complete.
+        """
+        with self._fill_lock:
+            if self.summary() is not None or not self.leaves:
+                return None
+            if self._fill_thread is None or not self._fill_thread.is_alive():
+                self._fill_thread = threading.Thread(target=self._fill, name='pyramid-fill', daemon=True)
+                self._fill_thread.start()
+            return self._fill_thread
+
+    def summary(self) -> str | None:
+        """
+        Returns the summary of the whole video (root of the pyramid), or None if the pyramid is not built.
+        """
+        return self._summaries.get((self.height, 0)) if self.leaves else None
+
+    def summarize_intervals(self, time_in_sec: int | float,
+                            on_summary: Callable[[int, dict], None] | None = None) -> list[dict]:
+        """
+        Returns one summary per `time_in_sec` interval, in chronological order, as
+        `{'start', 'end', 'summary'}` dictionaries.
+
+        Intervals whose nodes are all summarized are made of the node summaries and
+        of summaries of their edge chunks (one call per edge, none once it is saved),
+        each labelled with its time range; the others are summarized from their text
+        (one call, none once it is saved). Calls start in chronological order and run in parallel.
+
+        Args:
+            time_in_sec: Length of the intervals, in seconds.
+            on_summary: Called with `(index, summary)` for every interval, in order, as soon as
+                        it and the intervals before it are summarized.
+        """
+        ranges = self.intervals(time_in_sec)
+
+        # Parts of every interval: (chunk range, summary or None until it is summarized)
+        parts: list[list[list]] = []
+        calls: list[tuple[int, int, ChunkRange]] = []  # (interval index, part index, chunk range)
+        missing_nodes = False
+        for i, (first, last) in enumerate(ranges):
+            pieces = self.pieces(first, last)
+            nodes = [piece for kind, piece in pieces if kind == 'node']
+            if (first, last) in self._range_summaries or not nodes or any(node not in self._summaries for node in nodes):
+                # Shorter than a base window (no node), not built yet, or summarized before
+                missing_nodes = missing_nodes or (first, last) not in self._range_summaries and bool(nodes)
+                pieces = [('chunks', (first, last))]
+
+            parts.append([])
+            for kind, piece in pieces:
+                if kind == 'node':
+                    parts[i].append([self.node_range(piece), self._summaries[piece]])
+                else:
+                    parts[i].append([piece, self._range_summaries.get(piece)])
+                    if parts[i][-1][1] is None:
+                        calls.append((i, len(parts[i]) - 1, piece))
+
+        llm = get_chat_model()
+        map_chain = ChatPromptTemplate.from_messages(INTERVAL_MAP_CHAIN_TEMPLATE) | llm | StrOutputParser()
+
+        def assemble(i: int) -> str:
+            done = [(chunks, summary) for chunks, summary in parts[i] if summary]
+            if len(parts[i]) == 1:
+                return done[0][1] if done else ''
+            return "\n".join(self._label(first, last, summary) for (first, last), summary in done)
+
+        def completed() -> Iterator[tuple[int, str]]:
+            pending = [sum(1 for _, summary in interval if summary is None) for interval in parts]
+            yield from ((i, assemble(i)) for i in range(len(ranges)) if not pending[i])
+            for j, summary in iter_batch_invoke(map_chain, [self.timeline.text_between(first, last - 1)
+                                                            for _, _, (first, last) in calls],
+                                                max_concurrency=self.max_concurrency, max_retries=self.max_retries):
+                i, part, chunks = calls[j]
+                parts[i][part][1] = self._range_summaries[chunks] = summary
+                pending[i] -= 1
+                if not pending[i]:
+                    yield i, assemble(i)
+
+        intervals = []
+        with stage('pyramid', video_id=self.video_id):
+            for i, summary in iter_in_order(completed()):
+                first, last = ranges[i]
+                interval = {'start': self.timeline.starts[first], 'end': self.timeline.ends[last - 1], 'summary': summary}
+                intervals.append(interval)
+                if on_summary:
+                    on_summary(i, interval)
+
+        if self.store and calls:
+            self.store.save_summaries(self.video_id, self.base_window,
+                                      {(first - last, first): self._range_summaries[(first, last)]
+                                       for _, _, (first, last) in calls})
+        if self.background_fill and missing_nodes:
+            self.fill_in_background()
+        return intervals
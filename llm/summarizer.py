@@ -0,0 +1,119 @@
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from llm.batching import batch_invoke, DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_RETRIES
+from llm.instrumentation import stage
+
+# Tree reduce defaults (change as needed)
+DEFAULT_REDUCE_TOKEN_BUDGET = 6000  # Maximum input tokens of a single reduce call
+DEFAULT_REDUCE_FAN_IN = 8  # Maximum number of summaries combined by a single reduce call
+
+# Map prompt for whole-video summaries (the outputs are re-summarized later)
+MAP_CHAIN_TEMPLATE = [
+    ('system', "You are a helpful AI assistant. Your job is to efficiently summarize the ducument chunk that is passed to you by the user. DON'T HALUCINATE, DON'T MAKE UP STORIES, summarize solely based on the text that is provided to you. DON'T LOSE MUCH INFORMATION, as these summaries will be re-summarized again, combined."),
+    ('user', 'Please summarize the chunk: {document}')
+]
+
+# Map prompt for per-interval summaries and summary pyramid leaves (the outputs are shown as they are)
+INTERVAL_MAP_CHAIN_TEMPLATE = [
+    ('system', "You are a helpful AI assistant. Your job is to efficiently summarize the ducument chunk that is passed to you by the user. DON'T HALUCINATE, DON'T MAKE UP STORIES, summarize solely based on the text that is provided to you."),
+    ('user', 'Please summarize the chunk: {document}')
+]
+
+REDUCE_CHAIN_TEMPLATE = [
+    ('system', "You are a helpful AI assistant. Your job is to efficiently summarize the summaries (basically you need to provide summary of the summaries) that is passed to you by the user. DON'T HALUCINATE, DON'T MAKE UP STORIES, summarize solely based on the text that is provided to you!. DON'T LOSE MUCH INFORMATION, summarize efficienly."),
+    ('user', 'Please summarize the summaries : {document}')
+]
+
+
+@stage('map')
+def map_summarize(llm: BaseChatModel, texts: list[str], template: list[tuple] = MAP_CHAIN_TEMPLATE,
+                  max_concurrency: int = DEFAULT_MAX_CONCURRENCY, max_retries: int = DEFAULT_MAX_RETRIES) -> list[str]:
+    """
+    Map phase of the map-reduce summarization.
+
+    Summarizes every text chunk concurrently (bounded by `max_concurrency`),
+    backing off on rate limits. The wall-clock time depends on the slowest
+    batch of calls rather than on the sum of all calls.
+
+    Args:
+        llm: Chat model used for summarization.
+        texts: Text chunks, in chronological order.
+        template: Chat prompt messages with a `{document}` placeholder.
+        max_concurrency: Maximum number of parallel LLM calls.
+        max_retries: Maximum number of attempts per chunk.
+
+    Returns:
+        One summary per chunk, in the same order as `texts`.
+    """
+    map_chain = ChatPromptTemplate.from_messages(
+        template) | llm | StrOutputParser()
+
+    return batch_invoke(map_chain, texts, max_concurrency=max_concurrency, max_retries=max_retries)
+
+
+def get_reduce_batches(summaries: list[str], token_counts: list[int], token_budget: int, fan_in: int) -> list[list[str]]:
+    """
+    Greedily packs consecutive summaries into batches of at most `fan_in`
+    summaries and `token_budget` tokens. A summary that alone exceeds the budget
+    gets a batch of its own.
+
+    If no two summaries fit together, adjacent pairs are merged anyway, so
+    every reduce level is guaranteed to shrink the number of summaries.
+    """
+    batches = []
+    curr_batch = []
+    curr_tokens = 0
+    for summary, tokens in zip(summaries, token_counts):
+        if curr_batch and (len(curr_batch) >= fan_in or curr_tokens + tokens > token_budget):
+            batches.append(curr_batch)
+            curr_batch = []
+            curr_tokens = 0
+        curr_batch.append(summary)
+        curr_tokens += tokens
+    batches.append(curr_batch)
+
+    if len(summaries) > 1 and len(batches) == len(summaries):
+        batches = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+
+    return batches
+
+
+@stage('reduce')
+def reduce_summarize(llm: BaseChatModel, summaries: list[str], token_budget: int = DEFAULT_REDUCE_TOKEN_BUDGET,
+                     fan_in: int = DEFAULT_REDUCE_FAN_IN, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                     max_retries: int = DEFAULT_MAX_RETRIES) -> str:
+    """
+    Reduce phase of the map-reduce summarization, done as a tree reduce.
+
+    The summaries are packed into token-budgeted batches (see `get_reduce_batches`),
+    every batch is reduced in parallel, and the process repeats on the outputs
+    until a single summary remains. Reduce calls stay within the token budget
+    whenever possible, and the number of sequential levels grows
+    logarithmically (base `fan_in`) with the length of the video.
+
+    Args:
+        llm: Chat model used for summarization.
+        summaries: Map phase outputs, in chronological order.
+        token_budget: Maximum number of input tokens per reduce call.
+        fan_in: Maximum number of summaries combined by a single reduce call (>= 2).
+        max_concurrency: Maximum number of parallel LLM calls per level.
+        max_retries: Maximum number of attempts per call.
+
+    Returns:
+        The final summary.
+    """
+    if fan_in < 2:
+        raise ValueError("Reduce fan-in must be at least 2!")
+
+    reduce_chain = ChatPromptTemplate.from_messages(
+        REDUCE_CHAIN_TEMPLATE) | llm | StrOutputParser()
+
+    while True:
+        token_counts = [llm.get_num_tokens(summary) for summary in summaries]
+        batches = get_reduce_batches(summaries, token_counts, token_budget, fan_in)
+
+        summaries = batch_invoke(reduce_chain, ["\n".join(batch) for batch in batches],
+                                 max_concurrency=max_concurrency, max_retries=max_retries)
+        if len(summaries) == 1:
+            return summaries[0]
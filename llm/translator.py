@@ -1,27 +1,145 @@
-from dotenv import load_dotenv
 import os
-# from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import AzureChatOpenAI
+import json
+from typing import Callable
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable, RunnableLambda
 from utils import parse_segments
+from timeline import TimelineIndex
+from llm.providers import get_chat_model
+from llm.batching import with_backoff, DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_RETRIES
 
-load_dotenv()
+# Attempts for a single segment that the model keeps dropping, before giving up on it (until the next run)
+MAX_SEGMENT_REPAIR_ATTEMPTS = 3
 
-# llm = ChatGoogleGenerativeAI(
-#     model="gemini-2.5-flash-lite",
-#     temperature=0.2
-# )
-llm = AzureChatOpenAI(
-    api_key=os.environ["AZURE_OPENAI_GPT4O_API_KEY"],
-    azure_deployment=os.environ["AZURE_OPENAI_GPT4O_DEPLOYMENT_NAME"],
-    azure_endpoint=os.environ["AZURE_OPENAI_GPT4O_ENDPOINT"],
-    api_version=os.environ["AZURE_OPENAI_GPT4O_API_VERSION"]
-)
 
-def translate_to_english(chunks: list[dict], from_lang: str, max_duration: int | float) -> list[dict]:
+def request_segments(translator_chain: Runnable, segments: list[dict], from_lang: str) -> dict[int, str]:
+    """
+    Sends the given segments to the translator as one block, and returns the
+    translations of the requested segments that came back well-formed.
+    """
+    block_text = ""
+    for w in segments:
+        block_text += f"<SEG_{w['seg_id']}> {w['text']}\n"
+
+    output = translator_chain.invoke({
+        'from_lang': from_lang,
+        'text_block': block_text
+    })
+
+    expected_ids = {w['seg_id'] for w in segments}
+    return {seg_id: text for seg_id, text in parse_segments(output).items() if seg_id in expected_ids and text}
+
+
+def repair_segments(translator_chain: Runnable, segments: list[dict], from_lang: str,
+                    attempts_left: int = MAX_SEGMENT_REPAIR_ATTEMPTS) -> dict[int, str]:
+    """
+    Re-requests only the segments whose markers were dropped, merged or duplicated.
+
+    Whatever is still missing after a re-request is split in halves and repaired
+    recursively, so the retry cost is proportional to the number of damaged
+    segments. A single segment that keeps failing is left out (it keeps its
+    original text in the output of `translate_to_english`, and is retried by the next run).
+    """
+    repaired = request_segments(translator_chain, segments, from_lang)
+    missing = [w for w in segments if w['seg_id'] not in repaired]
+
+    if len(missing) > 1:
+        mid = len(missing) // 2
+        repaired.update(repair_segments(translator_chain, missing[:mid], from_lang, attempts_left))
+        repaired.update(repair_segments(translator_chain, missing[mid:], from_lang, attempts_left))
+    elif missing and attempts_left > 1:
+        repaired.update(repair_segments(translator_chain, missing, from_lang, attempts_left - 1))
+    elif missing:
+        print(f"Could not translate <SEG_{missing[0]['seg_id']}>, keeping the original text for now.")
+
+    return repaired
+
+
+def translate_block(translator_chain: Runnable, block: list[dict], from_lang: str) -> dict[int, str]:
+    """
+    Translates one block, and repairs the segments that came back missing or malformed
+    (the block itself is never sent again in full).
+    """
+    translated = request_segments(translator_chain, block, from_lang)
+    missing = [w for w in block if w['seg_id'] not in translated]
+
+    if missing:
+        print(f"Repairing {len(missing)}/{len(block)} segment(s)...")
+        if len(missing) == len(block) and len(block) > 1:
+            # Nothing usable came back: retry the two halves instead of the whole block
+            mid = len(block) // 2
+            translated.update(repair_segments(translator_chain, block[:mid], from_lang))
+            translated.update(repair_segments(translator_chain, block[mid:], from_lang))
+        else:
+            translated.update(repair_segments(translator_chain, missing, from_lang))
+
+    return translated
+
+
+def load_translation_journal(journal_path: str) -> dict[int, str]:
+    """
+    Loads the segments translated by a previous (possibly interrupted) run.
+
+    The journal is a JSON Lines file with one line per translated block:
+    `{"block": <index>, "segments": {"<seg_id>": "<translated text>", ...}}`.
+    A truncated last line (e.g. the process was killed while writing) is ignored.
+
+    Args:
+        journal_path: Path of the journal file.
+
+    Returns:
+        Mapping of SEG id to translated text (empty if there is no journal).
+    """
+    translated_segments = {}
+    if not os.path.exists(journal_path):
+        return translated_segments
+
+    with open(journal_path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            translated_segments.update(
+                {int(seg_id): text for seg_id, text in entry['segments'].items()})
+
+    return translated_segments
+
+
+def translate_to_english(chunks: list[dict], from_lang: str, max_duration: int | float | None,
+                         journal_path: str | None = None, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                         max_retries: int = DEFAULT_MAX_RETRIES, on_block: Callable[[int, list[dict]], None] | None = None,
+                         max_tokens: int | None = None) -> list[dict]:
     """
     Translate each chunk to English while preserving time alignment and SEG markers.
+
+    The chunks are merged into blocks of ~`max_duration` seconds (or packed into blocks
+    of at most `max_tokens` tokens of the chat model), and the blocks are
+    translated concurrently (at most `max_concurrency` calls in flight). When a
+    `journal_path` is given, every finished block is appended to that journal as
+    soon as it completes, and a rerun only translates the blocks that are still missing.
+    `on_block` receives every translated block as soon as it is available (blocks
+    restored from the journal first, then in completion order), so the next
+    ingestion stages can start before the whole transcript is translated.
+
+    Args:
+        chunks: List of dictionaries with 'start', 'end' and 'text' keys.
+        from_lang: Language code of the transcription.
+        max_duration: Maximum duration (in seconds) of a translation block (None: no time limit, with `max_tokens`).
+        journal_path: Optional per-video journal file, used to resume interrupted runs.
+        max_concurrency: Maximum number of parallel translation calls.
+        max_retries: Maximum number of attempts per block.
+        on_block: Optional callback, called with the block index and the translated chunks of the block.
+        max_tokens: Optional token budget of a block (chunks are never split, so timestamps are kept).
+
+    Returns:
+        The translated chunks (same 'start' and 'end' as the input chunks). Segments the model
+        kept dropping have their original text and `'untranslated': True`; they are not journaled,
+        so a rerun with the same journal only sends their blocks again.
+
+    Raises:
+        RuntimeError: If some blocks still fail after retrying (the finished ones are kept in the journal).
     """
 
     translator_prompt_template = ChatPromptTemplate.from_messages([
@@ -44,58 +162,77 @@ def translate_to_english(chunks: list[dict], from_lang: str, max_duration: int |
          """)
     ])
 
-    translator_chain = translator_prompt_template | llm | StrOutputParser()
-    translated_output = []
-    translated_segments = {}
+    llm = get_chat_model()
+    translator_chain = with_backoff(
+        translator_prompt_template | llm | StrOutputParser(), max_retries)
+    translated_segments = load_translation_journal(journal_path) if journal_path else {}
 
     # Assign SEG IDs
     for i, chunk in enumerate(chunks):
         chunk["seg_id"] = i + 1  # <SEG_1>, <SEG_2>, ...
 
-    # Merge into (e.g. ~3-minute) blocks
-    blocks = []
-    curr_block = [{
-        'start': chunks[0]['start'],
-        'end': chunks[0]['end'],
-        'text': chunks[0]['text'],
-        'seg_id': chunks[0]['seg_id'],
-    }]  # list of dicts
-    for chunk in chunks[1:]:
-        if chunk['start'] - curr_block[0]['start'] <= max_duration:
-            curr_block.append(chunk)
-            # update end of first chunk to last chunk
-            curr_block[0]['end'] = chunk['end']
-        else:
-            blocks.append(curr_block)
-            curr_block = [{
-                'start': chunk['start'],
-                'end': chunk['end'],
-                'text': chunk['text'],
-                'seg_id': chunk['seg_id'],
-            }]
-    blocks.append(curr_block)
+    # Merge into (e.g. ~3-minute, or token-budgeted) blocks
+    timeline = TimelineIndex.from_records(chunks)
+    blocks = [chunks[first:last]
+              for first, last in timeline.group_bounds(max_duration, max_tokens, llm.get_num_tokens)]
+
+    # Skip the blocks already translated by a previous run
+    pending_blocks = [(i, block) for i, block in enumerate(blocks)
+                      if any(w['seg_id'] not in translated_segments for w in block)]
+    if len(pending_blocks) < len(blocks):
+        print(f"Resuming translation: {len(blocks) - len(pending_blocks)}/{len(blocks)} blocks already translated.")
+
+    def get_translated_chunks(block: list[dict]) -> list[dict]:
+        translated_chunks = []
+        for chunk in block:
+            if chunk["seg_id"] in translated_segments:
+                translated_chunks.append({"start": chunk["start"], "end": chunk["end"],
+                                          "text": translated_segments[chunk["seg_id"]]})
+            else:
+                translated_chunks.append({"start": chunk["start"], "end": chunk["end"], "text": chunk["text"],
+                                          "untranslated": True})
+        return translated_chunks
+
+    if on_block:
+        pending_indices = {i for i, _ in pending_blocks}
+        for i, block in enumerate(blocks):
+            if i not in pending_indices:
+                on_block(i, get_translated_chunks(block))
+
+    block_translator = RunnableLambda(
+        lambda block: translate_block(translator_chain, block, from_lang))
 
     print('Translation started...')
-    for block in blocks:
-        block_text = ""
-        for w in block:
-            block_text += f"<SEG_{w['seg_id']}> {w['text']}\n"
+    journal = open(journal_path, 'a') if journal_path else None
+    failed_blocks = 0
+    try:
+        for idx, parsed in block_translator.batch_as_completed([block for _, block in pending_blocks],
+                                                               config={'max_concurrency': max_concurrency},
+                                                               return_exceptions=True):
+            if isinstance(parsed, Exception):
+                print(f"Translation of block {pending_blocks[idx][0]} failed: {parsed}")
+                failed_blocks += 1
+                continue
+
+            translated_segments.update(parsed)
+
+            if journal:
+                journal.write(json.dumps(
+                    {'block': pending_blocks[idx][0], 'segments': parsed}) + "\n")
+                journal.flush()
 
-        output = translator_chain.invoke({
-            'from_lang': from_lang,
-            'text_block': block_text
-        })
+            if on_block:
+                on_block(pending_blocks[idx][0], get_translated_chunks(pending_blocks[idx][1]))
+    finally:
+        if journal:
+            journal.close()
 
-        parsed = parse_segments(output)
-        translated_segments.update(parsed)
+    if failed_blocks:
+        raise RuntimeError(
+            f"Translation failed for {failed_blocks}/{len(blocks)} blocks. Run again to translate only the missing blocks.")
 
     # Reconstruct output
-    for chunk in chunks:
-        translated_output.append({
-            "start": chunk["start"],
-            "end": chunk["end"],
-            "text": translated_segments[chunk["seg_id"]]
-        })
+    translated_output = get_translated_chunks(chunks)
 
     print('Translation success')
     return translated_output
@@ -1,75 +1,217 @@
 import os
-import copy
-from dotenv import load_dotenv
-from utils import get_grouped_data
-from langchain_openai import AzureOpenAIEmbeddings
-# from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
+import shutil
+import threading
+from typing import Sequence, TYPE_CHECKING
+from collections import OrderedDict
+from timeline import TimelineIndex
+from lexical_index import BM25Index, tokenize
 from langchain_core.documents import Document
+from llm.providers import get_embeddings
 
-load_dotenv()
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
 
-# embedding = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
-embedding = AzureOpenAIEmbeddings(
-    api_key=os.environ["AZURE_OPENAI_EMBEDDINGS_ADA_API_KEY"],
-    api_version=os.environ["AZURE_OPENAI_API_EMBEDDINGS_ADA_VERSION"],
-    azure_deployment=os.environ["AZURE_OPENAI_EMBEDDINGS_ADA_DEPLOYEMENT_NAME"],
-    azure_endpoint=os.environ["AZURE_OPENAI_API_EMBEDDINGS_ADA_ENDPOINT"]
-)
+# In-process cache of loaded vector stores (change as needed)
+VECTOR_STORE_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # ~1 GB of vectors and texts
 
+# (kind, path) -> (mtime, loaded object, estimated size in bytes), least recently used first
+_store_cache: OrderedDict[tuple[str, str], tuple[float, object, int]] = OrderedDict()
+_store_cache_lock = threading.Lock()
 
-def create_vector_store(data: list[dict], max_duration: int | float, vector_db_path: str):
+# BM25 index saved next to every FAISS index
+LEXICAL_INDEX_FILE = 'bm25.pkl'
+
+# A lexical match is "strong" when the best chunk contains every query term (at least
+# LEXICAL_FAST_PATH_MIN_TERMS of them), scores at least LEXICAL_FAST_PATH_MIN_SCORE and
+# at least LEXICAL_FAST_PATH_MARGIN times the runner-up (skips the query embedding)
+LEXICAL_FAST_PATH_MARGIN = 1.5
+LEXICAL_FAST_PATH_MIN_TERMS = 2
+LEXICAL_FAST_PATH_MIN_SCORE = 5.0
+
+# Minimum BM25 score of a lexically retrieved document (weaker ones are not fused with the semantic ranking)
+LEXICAL_SCORE_THRESHOLD = 1.0
+
+# Reciprocal rank fusion constant (higher values flatten the rank contributions)
+RRF_K = 60
+
+
+def get_vector_store_mtime(vector_db_path: str) -> float:
+    """
+    Returns the latest modification time of the files of a persisted vector store.
+    """
+    with os.scandir(vector_db_path) as entries:
+        return max((entry.stat().st_mtime for entry in entries if entry.is_file()),
+                   default=os.path.getmtime(vector_db_path))
+
+
+def estimate_vector_store_size(store: 'FAISS') -> int:
+    """
+    Rough memory footprint (in bytes) of a loaded FAISS store: float32 vectors plus document texts.
+    """
+    vectors_size = store.index.ntotal * store.index.d * 4
+    texts_size = sum(len(doc.page_content)
+                     for doc in store.docstore._dict.values())
+    return vectors_size + texts_size
+
+
+def invalidate_vector_store(vector_db_path: str):
+    """
+    Drops a vector store (and its lexical index) from the in-process cache (e.g. after it has been rewritten).
+    """
+    with _store_cache_lock:
+        for kind in ('faiss', 'bm25'):
+            _store_cache.pop((kind, os.path.abspath(vector_db_path)), None)
+
+
+def load_cached(vector_db_path: str, kind: str, loader, size_fn, use_cache: bool = True):
+    """
+    Loads `kind` ('faiss' or 'bm25') from `vector_db_path` with `loader`, through the process-wide LRU cache.
+    """
+    key = (kind, os.path.abspath(vector_db_path))
+    mtime = get_vector_store_mtime(vector_db_path)
+
+    if use_cache:
+        with _store_cache_lock:
+            cached = _store_cache.get(key)
+            if cached is not None and cached[0] == mtime:
+                _store_cache.move_to_end(key)
+                return cached[1]
+
+    loaded = loader()
+
+    if use_cache:
+        with _store_cache_lock:
+            _store_cache[key] = (mtime, loaded, size_fn(loaded))
+            _store_cache.move_to_end(key)
+
+            # Evict least recently used entries (always keep the one just loaded)
+            total_size = sum(size for _, _, size in _store_cache.values())
+            while total_size > VECTOR_STORE_CACHE_MAX_BYTES and len(_store_cache) > 1:
+                _, (_, _, size) = _store_cache.popitem(last=False)
+                total_size -= size
+
+    return loaded
+
+
+def get_granularity_path(vector_db_path: str, granularity: int | float) -> str:
+    """
+    Returns the folder of the index built with the given chunk duration (e.g. `db/faiss_db/<id>/120s`).
+    """
+    return os.path.join(vector_db_path, f"{granularity:g}s")
+
+
+def get_missing_granularities(vector_db_path: str, granularities: Sequence[int | float]) -> list[int | float]:
     """
-    Creates a persistent vector database from time-based, segmented transcription data.
+    Returns the granularities (sorted) whose index is not built yet (none if a legacy single index exists).
+    """
+    if os.path.exists(os.path.join(vector_db_path, 'index.faiss')):
+        return []
+    return [g for g in sorted(set(granularities))
+            if not os.path.exists(get_granularity_path(vector_db_path, g))]
+
+
+def create_vector_store(data: list[dict] | TimelineIndex, granularities: Sequence[int | float], vector_db_path: str) -> bool:
+    """
+    Creates persistent vector databases from time-based, segmented transcription data.
 
     The function intelligently **merges adjacent segments** of `data` (which have 'start', 
     'end', and 'text') to form larger, contextually coherent chunks, ensuring 
-    that the *resulting chunk duration* does not exceed `max_duration` (in seconds).
-    It then embeds the text of these new chunks and saves the vector index to 
-    `vector_db_path` for efficient semantic search.
+    that the *resulting chunk duration* does not exceed the given duration (in seconds).
+    One index is built per duration in `granularities` (e.g. 60s / 120s / 600s),
+    in a single pass: the chunks of every granularity are embedded together, so
+    texts that coincide across granularities are embedded only once. Each index
+    is saved to `vector_db_path/<duration>s` for efficient semantic search,
+    along with a local BM25 index of the same chunks for lexical search.
 
     Args:
-        data: List of dictionaries; each must contain 'start', 'end', and 'text' 
-              keys representing a small segment.
-        max_duration: The maximum allowed duration (in seconds) for a merged 
-                      segment (chunk) to retain context while ensuring search 
-                      relevance.
-        vector_db_path: File path to save the resulting vector database.
-    """
-    if (os.path.exists(vector_db_path)):
+        data: List of dictionaries (or a `TimelineIndex`); each must contain 'start',
+              'end', and 'text' keys representing a small segment.
+        granularities: The maximum allowed durations (in seconds) for a merged 
+                       segment (chunk), one index per duration.
+        vector_db_path: Folder path to save the resulting vector databases.
+
+    Returns:
+        False if every index already existed, True if some were built.
+    """
+    missing_granularities = get_missing_granularities(vector_db_path, granularities)
+    if not missing_granularities:
         print("Vector DB already exists!")
-        return
+        return False
 
-    processed_data = copy.deepcopy(data)
+    timeline = data if isinstance(data, TimelineIndex) else TimelineIndex.from_records(data)
 
     print("Creating vector store...")
-    rag_data = get_grouped_data(processed_data, max_duration)
+    rag_documents = {}
+    for granularity in missing_granularities:
+        rag_data = timeline.grouped(granularity)
+        rag_documents[granularity] = [Document(d['text'], metadata={
+            'start_time': d['start'], 'end_time': d['end'], 'granularity': granularity}) for d in rag_data]
 
-    rag_documents = [Document(d['text'], metadata={
-                              'start_time': d['start'], 'end_time': d['end']}) for d in rag_data]
+    from langchain_community.vectorstores import FAISS
+    embedding = get_embeddings()
 
-    store = FAISS.from_documents(
-        documents=rag_documents,
-        embedding=embedding
-    )
-    store.save_local(vector_db_path)
+    # One embedding pass over every granularity (duplicate texts are embedded once)
+    all_texts = [doc.page_content for docs in rag_documents.values() for doc in docs]
+    all_vectors = iter(embedding.embed_documents(all_texts))
+
+    for granularity, documents in rag_documents.items():
+        store = FAISS.from_embeddings(
+            text_embeddings=[(doc.page_content, next(all_vectors)) for doc in documents],
+            embedding=embedding,
+            metadatas=[doc.metadata for doc in documents]
+        )
+        granularity_path = get_granularity_path(vector_db_path, granularity)
+        store.save_local(granularity_path)
+        BM25Index.from_texts([doc.page_content for doc in documents]).save(
+            os.path.join(granularity_path, LEXICAL_INDEX_FILE))
+        invalidate_vector_store(granularity_path)
+        print(f"{granularity:g}s index: {len(documents)} documents")
 
     print("Vector store created succesfully!")
-    print("First document info: ")
-    print(f"Size: {len(rag_documents[0].page_content)}")
-    print(f"Start: {rag_documents[0].metadata['start_time']}")
-    print(f"End: {rag_documents[0].metadata['end_time']}")
+    print(f"Embedding cache: {embedding.stats()}")
+    return True
+
+
+def replace_vector_store(data: list[dict] | TimelineIndex, granularities: Sequence[int | float], vector_db_path: str):
+    """
+    Rebuilds the vector databases of `create_vector_store` (e.g. from a corrected translation).
+
+    The new indexes are built in a sibling folder and renamed into place once complete,
+    so searches keep reading the previous indexes while the new ones are embedded.
+    """
+    build_path = vector_db_path + '.new'
+    previous_path = vector_db_path + '.old'
+    # Leftovers of an interrupted rebuild
+    for path in (build_path, previous_path):
+        shutil.rmtree(path, ignore_errors=True)
+
+    create_vector_store(data, granularities, build_path)
+    if os.path.exists(vector_db_path):
+        os.rename(vector_db_path, previous_path)
+    os.rename(build_path, vector_db_path)
+    shutil.rmtree(previous_path, ignore_errors=True)
+
+    # Cached per index folder (and at the root for a legacy single index)
+    for granularity in granularities:
+        invalidate_vector_store(get_granularity_path(vector_db_path, granularity))
+    invalidate_vector_store(vector_db_path)
 
 
-def load_vector_store(vector_db_path: str) -> FAISS:
+def load_vector_store(vector_db_path: str, use_cache: bool = True) -> 'FAISS':
     """
     Loads a persisted FAISS vector index from the local path.
 
     Checks if the `vector_db_path` exists, then loads the FAISS index 
     using the provided embedding function, enabling deserialization.
 
+    Loaded stores are kept in a process-wide LRU cache keyed by path and
+    modification time, so repeated questions (and several chat sessions in
+    one process) reuse the deserialized index. The least recently used stores
+    are evicted once the cache exceeds `VECTOR_STORE_CACHE_MAX_BYTES`.
+
     Args:
         vector_db_path: Folder path where the FAISS store files are saved.
+        use_cache: Reuse an already loaded store if its files did not change.
 
     Returns:
         The loaded FAISS vector store instance.
@@ -80,10 +222,168 @@ def load_vector_store(vector_db_path: str) -> FAISS:
     if not os.path.exists(vector_db_path):
         raise ValueError("Vector db is not present!")
 
-    vector_store = FAISS.load_local(
-        folder_path=vector_db_path,
-        embeddings=embedding,
-        allow_dangerous_deserialization=True
+    from langchain_community.vectorstores import FAISS
+
+    return load_cached(
+        vector_db_path, 'faiss',
+        loader=lambda: FAISS.load_local(
+            folder_path=vector_db_path,
+            embeddings=get_embeddings(),
+            allow_dangerous_deserialization=True
+        ),
+        size_fn=estimate_vector_store_size,
+        use_cache=use_cache
+    )
+
+
+def load_lexical_index(vector_db_path: str, use_cache: bool = True) -> BM25Index | None:
+    """
+    Loads the BM25 index saved next to a FAISS index (through the same LRU cache).
+
+    Returns:
+        The lexical index, or None if the vector store was created without one.
+    """
+    lexical_index_path = os.path.join(vector_db_path, LEXICAL_INDEX_FILE)
+    if not os.path.exists(lexical_index_path):
+        return None
+
+    return load_cached(
+        vector_db_path, 'bm25',
+        loader=lambda: BM25Index.load(lexical_index_path),
+        size_fn=lambda index: index.estimate_size(),
+        use_cache=use_cache
     )
 
-    return vector_store
+
+def get_vector_store_paths(vector_db_path: str) -> list[str]:
+    """
+    Returns the folders of every granularity of a video's vector database, from the finest to the coarsest.
+
+    A database created before multi-granularity indexes existed (a single
+    index directly under `vector_db_path`) is returned as a single folder.
+
+    Raises:
+        ValueError: If the directory at `vector_db_path` is not found.
+    """
+    if not os.path.exists(vector_db_path):
+        raise ValueError("Vector db is not present!")
+
+    if os.path.exists(os.path.join(vector_db_path, 'index.faiss')):
+        return [vector_db_path]
+
+    granularities = sorted(float(name[:-1]) for name in os.listdir(vector_db_path)
+                           if name.endswith('s') and os.path.exists(os.path.join(vector_db_path, name, 'index.faiss')))
+    if not granularities:
+        raise ValueError("Vector db is not present!")
+
+    return [get_granularity_path(vector_db_path, g) for g in granularities]
+
+
+def load_vector_stores(vector_db_path: str) -> list['FAISS']:
+    """
+    Loads every granularity of a video's vector database, from the finest to the coarsest.
+
+    Args:
+        vector_db_path: Folder path where the vector databases are saved.
+
+    Returns:
+        The loaded FAISS stores, finest granularity first.
+
+    Raises:
+        ValueError: If the directory at `vector_db_path` is not found.
+    """
+    return [load_vector_store(path) for path in get_vector_store_paths(vector_db_path)]
+
+
+def search_vector_store(store: 'FAISS', query_vector: list[float], k: int, score_threshold: float) -> list[Document]:
+    """
+    Similarity search with an already embedded query, keeping documents whose relevance is above the threshold.
+    """
+    relevance_score_fn = store._select_relevance_score_fn()
+    docs_and_scores = store.similarity_search_with_score_by_vector(query_vector, k=k)
+    return [doc for doc, score in docs_and_scores if relevance_score_fn(score) >= score_threshold]
+
+
+def search_lexical_index(store: 'FAISS', lexical_index: BM25Index, query: str, k: int,
+                         score_threshold: float = LEXICAL_SCORE_THRESHOLD) -> tuple[list[Document], bool]:
+    """
+    BM25 search over the documents of a FAISS store (no embedding call).
+
+    Returns:
+        The retrieved documents whose BM25 score is above the threshold (best first),
+        and whether the best match is strong enough to answer without a semantic search.
+    """
+    top, matched_terms = lexical_index.search(query, k)
+    docs = [store.docstore.search(store.index_to_docstore_id[doc_id])
+            for doc_id, score in top if score >= score_threshold]
+
+    query_terms = len(set(tokenize(query)))
+    is_strong = (bool(top) and query_terms >= LEXICAL_FAST_PATH_MIN_TERMS and matched_terms[0] == query_terms
+                 and top[0][1] >= LEXICAL_FAST_PATH_MIN_SCORE
+                 and (len(top) == 1 or top[0][1] >= LEXICAL_FAST_PATH_MARGIN * top[1][1]))
+
+    return docs, is_strong
+
+
+def fuse_rankings(rankings: list[list[Document]], k: int) -> list[Document]:
+    """
+    Merges several rankings of the same index with reciprocal rank fusion.
+    """
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = (doc.metadata['start_time'], doc.metadata['end_time'])
+            scores[key] = scores.get(key, 0.0) + 1 / (RRF_K + rank + 1)
+            docs.setdefault(key, doc)
+
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+
+def search_vector_stores(vector_db_path: str, query: str, k: int = 3, score_threshold: float = 0.1,
+                         broad: bool = False) -> list[Document]:
+    """
+    Hybrid (BM25 + FAISS) search over a video's multi-granularity vector database.
+
+    The finest index is searched first, for tight timestamps. Its BM25 ranking
+    is computed locally; when the best lexical match is strong (several rare
+    query terms, e.g. exact names, numbers, codes, all in one chunk), it is
+    returned without embedding the query at all. Otherwise the BM25 hits above
+    `LEXICAL_SCORE_THRESHOLD` and the FAISS ranking are merged with reciprocal rank fusion.
+
+    For broad questions, the best semantic matches of the coarsest index are added
+    in front; if the fine index has no relevant match, the coarser indexes are
+    tried in order. The query is embedded at most once for all indexes.
+
+    Args:
+        vector_db_path: Folder path where the vector databases are saved.
+        query: The question.
+        k: Number of documents to retrieve per index.
+        score_threshold: Minimum relevance score of a semantically retrieved document.
+        broad: Whether the question is about a broad topic (overview, main ideas, ...).
+
+    Returns:
+        The retrieved documents.
+    """
+    paths = get_vector_store_paths(vector_db_path)
+    fine_store = load_vector_store(paths[0])
+    fine_lexical_index = load_lexical_index(paths[0])
+
+    lexical_docs = []
+    if fine_lexical_index is not None:
+        lexical_docs, is_strong = search_lexical_index(fine_store, fine_lexical_index, query, k)
+        if is_strong and not broad:
+            return lexical_docs
+
+    query_vector = get_embeddings().embed_query(query)
+
+    docs = fuse_rankings([search_vector_store(fine_store, query_vector, k, score_threshold), lexical_docs], k)
+    if broad and len(paths) > 1:
+        docs = search_vector_store(load_vector_store(paths[-1]), query_vector, k, score_threshold) + docs
+    elif not docs:
+        for path in paths[1:]:
+            docs = search_vector_store(load_vector_store(path), query_vector, k, score_threshold)
+            if docs:
+                break
+
+    return docs
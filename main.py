@@ -1,59 +1,159 @@
 import os
-import json
-from requests import Session
+import argparse
+import threading
+from typing import TYPE_CHECKING
 from warnings import filterwarnings
-from youtube_transcript_api import YouTubeTranscriptApi
-from utils import extract_video_id, get_grouped_transcriptions, get_grouped_data
-from llm.translator import translate_to_english
-from llm.agents import create_agent
-from llm.vector_store import create_vector_store
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from config import (VECTOR_DB_PATH, LLM_CACHE_PATH, ANSWER_CACHE_PATH, SUMMARIZATION_TIME_DURATION,
+                    SUMMARIZATION_MAX_CONCURRENCY, ANSWER_CACHE_SIMILARITY_THRESHOLD, SUMMARIZATION_REDUCE_TOKEN_BUDGET,
+                    SUMMARIZATION_REDUCE_FAN_IN, INGEST_FETCH_WORKERS, INGEST_TRANSLATE_WORKERS, INGEST_EMBED_WORKERS,
+                    SUMMARY_PYRAMID_AT_INGESTION, SERVER_HOST, SERVER_PORT, TRANSCRIPTION_DIR, TRANSLATION_DIR,
+                    TRANSCRIBED_TEXT_TIME_DURATION, CHAT_HISTORY_TOKEN_BUDGET, CHAT_HISTORY_KEEP_TURNS,
+                    CHAT_HISTORY_SUMMARIZE, CHAT_TOOL_OUTPUT_MAX_TOKENS, SUMMARY_PYRAMID_BASE_WINDOW,
+                    SUMMARIZATION_TOKEN_BUDGET, SUMMARY_PYRAMID_BACKGROUND_FILL, validate_config)
+from utils import extract_video_id
+
+# The ingestion, agent and model modules are imported by the commands using them (LangChain,
+# LangGraph and the provider SDKs take seconds to import, e.g. for `migrate`)
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
 
 filterwarnings('ignore')
 
-languages = [
-    'en',       # English
-    'hi',       # Hindi
-    'es',       # Spanish
-    'fr',       # French
-    'de',       # German
-    'pt',       # Portuguese
-    'ru',       # Russian
-    'ar',       # Arabic
-    'ja',       # Japanese
-    'ko',       # Korean
-    'zh-Hans',  # Chinese Simplified
-    'zh-Hant',  # Chinese Traditional
-    'id',       # Indonesian
-    'it',       # Italian
-    'bn',       # Bengali
-]
-
-# Directory paths
-TRANSLATION_DIR = 'translations'
-TRANSCRIPTION_DIR = 'transcriptions'
-VECTOR_DB_PATH = os.path.join('db', 'faiss_db')
-
-# Per chunk time durations (in seconds, change as needed)
-TRANSCRIBED_TEXT_TIME_DURATION = 60  # ~1 minute per chunk
-TRANSLATION_TIME_DURATION = 120  # ~2 minutes per chunk
-VECTOR_STORE_TIME_DURATION = 120  # ~2 minutes per chunk
-SUMMARIZATION_TIME_DURATION = 120  # ~2 minutes per chunk
+
+def run_batch_ingestion(args: argparse.Namespace):
+    """
+    Headless mode: ingests every video listed in the input file, then exits.
+    """
+    from ingest import ingest_batch, read_video_ids
+    from fetcher import get_fetcher
+    from llm.cache import init_llm_cache
+
+    validate_config()
+    init_llm_cache(LLM_CACHE_PATH)
+
+    video_ids = read_video_ids(args.input)
+    print(f"Ingesting {len(video_ids)} videos...")
+
+    records = ingest_batch(video_ids, report_path=args.report, fetch_workers=args.fetch_workers,
+                           translate_workers=args.translate_workers, embed_workers=args.embed_workers,
+                           summarize=args.summarize)
+
+    counts = {}
+    for record in records:
+        counts[record['status']] = counts.get(record['status'], 0) + 1
+    print(f"Ingestion finished: {counts}. Report: {args.report}")
+    print(f"Fetcher: {get_fetcher().stats()}")
+    print_stage_metrics()
+
+
+def format_time(seconds: int | float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def print_stage_metrics():
+    """
+    Prints the time, LLM / embedding calls, tokens and estimated cost of every stage so far.
+    """
+    from llm.instrumentation import get_metrics
+    for stage_name, counts in sorted(get_metrics().snapshot().items()):
+        print(f"{stage_name:<50} {counts['runs']:>5} runs {counts['seconds']:>9.1f}s "
+              f"{counts['llm_calls']:>5} LLM calls ({counts['llm_cached_calls']} cached, {counts['retries']} retries) "
+              f"{counts['prompt_tokens'] + counts['completion_tokens']:>8} tokens "
+              f"{counts['embedding_calls']:>4} embedding calls ${counts['cost_usd']:.4f}")
+
+
+def print_agent_answer(agent, messages: list['BaseMessage']) -> list['BaseMessage']:
+    """
+    Runs one turn of the agent, printing the answer while it is generated and
+    interval summaries as soon as they are ready. Returns the messages of the run.
+    """
+    from llm.agents import stream_agent, get_message_text
+
+    result = []
+    streaming = False
+    for kind, value in stream_agent(agent, messages):
+        if kind == 'token':
+            print(value if streaming else f"AI: {value}", end="", flush=True)
+            streaming = True
+        elif kind == 'interval_summary':
+            if streaming:
+                print()
+                streaming = False
+            print(f"[{format_time(value['start'])} - {format_time(value['end'])}] {value['summary']}\n", flush=True)
+        elif kind == 'messages':
+            result = value
+
+    if streaming:
+        print()
+    else:
+        print(f"AI: {get_message_text(result[-1])}")
+    return result
+
+
+def run_library_chat(args: argparse.Namespace):
+    """
+    Chat across the ingested videos (library index), optionally restricted to the videos of the input file.
+    """
+    from ingest import read_video_ids
+    from llm.agents import create_agent, create_library_tools, get_message_text, LIBRARY_SYSTEM_PROMPT
+    from llm.library_index import get_library_index
+    from llm.context import ChatContext
+    from llm.cache import init_llm_cache
+
+    validate_config()
+    init_llm_cache(LLM_CACHE_PATH)
+
+    video_ids = read_video_ids(args.input) if args.input else None
+    print(f"Library: {get_library_index().stats()}")
+
+    agent = create_agent(data=None, vector_db_path=None, tools=create_library_tools(video_ids, k=args.k),
+                         tool_output_max_tokens=CHAT_TOOL_OUTPUT_MAX_TOKENS)
+    chat_context = ChatContext(LIBRARY_SYSTEM_PROMPT, token_budget=CHAT_HISTORY_TOKEN_BUDGET,
+                               keep_turns=CHAT_HISTORY_KEEP_TURNS, summarize=CHAT_HISTORY_SUMMARIZE)
+
+    while True:
+        user_input = input("User: ")
+
+        if user_input in ['bye', 'exit']:
+            print_stage_metrics()
+            print("Thank you!\nExitting...")
+            break
+
+        messages = print_agent_answer(agent, chat_context.messages(user_input))
+        chat_context.add_turn(user_input, get_message_text(messages[-1]))
+
+        if chat_context.needs_compaction():
+            chat_context.compact()
+
+
+def run_migration(args: argparse.Namespace):
+    """
+    Imports the per-video JSON files of previous versions into the video store.
+    """
+    from store import get_video_store
+    counts = get_video_store().migrate_json(TRANSCRIPTION_DIR, TRANSLATION_DIR, TRANSCRIBED_TEXT_TIME_DURATION,
+                                            remove=args.remove)
+    print(f"Imported {counts['transcriptions']} transcriptions and {counts['translations']} translations.")
 
 
 def main():
+    from ingest import ingest_video
+    from fetcher import get_fetcher
+    from llm.agents import create_agent, get_message_text, get_turn_sources, SYSTEM_PROMPT
+    from llm.context import ChatContext
+    from llm.providers import get_embeddings
+    from llm.cache import init_llm_cache
+    from llm.answer_cache import SemanticAnswerCache
 
-    if TRANSLATION_TIME_DURATION < TRANSCRIBED_TEXT_TIME_DURATION:
-        raise ValueError(
-            "Translation chunk time duration can't be lesser than transcribed text time duration!")
+    validate_config()
 
-    if VECTOR_STORE_TIME_DURATION < TRANSCRIBED_TEXT_TIME_DURATION:
-        raise ValueError(
-            "Vector store chunk time duration can't be lesser than transcribed text time duration!")
+    # Persistent LLM response cache (shared across sessions and processes)
+    llm_cache = init_llm_cache(LLM_CACHE_PATH)
 
-    if SUMMARIZATION_TIME_DURATION < TRANSCRIBED_TEXT_TIME_DURATION:
-        raise ValueError(
-            "Summarization chunk time duration can't be lesser than transcribed text time duration!")
+    # Answers of previous (near-duplicate) questions, per video
+    answer_cache = SemanticAnswerCache(
+        ANSWER_CACHE_PATH, get_embeddings(), similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD)
 
     # video_id = extract_video_id("https://www.youtube.com/watch?v=pi9-m8RNqJo")
     # video_id = extract_video_id("https://www.youtube.com/watch?v=JjRiW_HpMoM")
@@ -61,124 +161,113 @@ def main():
     video_url = input("Enter the YouTube video URL: ")
     video_id = extract_video_id(video_url)
 
-    file_name = f"{video_id}.json"
     print(f"Video id: {video_id}")
 
-    # TO AVOID SSL Errors (OPTIONAL)
-    # session = Session()
-    # session.verify = False
-    # ytt_api = YouTubeTranscriptApi(http_client=session)
-    ytt_api = YouTubeTranscriptApi()
-
-    # Get transcriptions
-    transcription_file_path = os.path.join(TRANSCRIPTION_DIR, file_name)
-    if (os.path.exists(transcription_file_path)):
-        print('Transcription already exists.')
-        with open(transcription_file_path, 'r') as f:
-            transcripted_data = json.load(f)
-    else:
-        print("Transcription started...")
-        try:
-            res = ytt_api.fetch(video_id, languages=languages)
-        except Exception as e:
-            print(f"Error during transcription: {e}\
-                  \nIt can be due to the invalid video id or network issues.")
-            return
-
-        result_dict = res.to_raw_data()
-        transcripted_data = {
-            'language': res.language,
-            'language_code': res.language_code,
-            'data': result_dict
-        }
-        print("Transcription done.")
-        with open(file=transcription_file_path, mode='w') as f:
-            json.dump(transcripted_data, f, indent=5)
-
-    transcription_lang = transcripted_data['language']
-    print(f"Transcription Language: {transcription_lang}")
-
-    # Merge the transcriptions into specified time chunks
-    processed_output = get_grouped_transcriptions(
-        transcriptions=transcripted_data['data'], time=TRANSCRIBED_TEXT_TIME_DURATION)
-
-    translated_output = []
-
-    # Translate the transcriptions, if not in english
-    if 'english' not in transcription_lang.lower():
-        translation_file_path = os.path.join(TRANSLATION_DIR, file_name)
-        if (os.path.exists(translation_file_path)):
-            print('Translation already exists.')
-            with open(translation_file_path, 'r') as f:
-                translated_output = json.load(f)
-        else:
-            translated_output = translate_to_english(
-                chunks=processed_output, from_lang=transcripted_data['language_code'], max_duration=TRANSLATION_TIME_DURATION)
-            with open(file=translation_file_path, mode='w') as f:
-                json.dump(translated_output, f, indent=5)
-
-    if translated_output:
-        processed_output = translated_output
-
-    # Create vector store for RAG
-    create_vector_store(processed_output, max_duration=VECTOR_STORE_TIME_DURATION,
-                        vector_db_path=os.path.join(VECTOR_DB_PATH, video_id))
+    # Fetch -> group -> translate -> embed, pipelined (saved work is reused)
+    try:
+        timeline, _ = ingest_video(video_id, get_fetcher(), summarize=SUMMARY_PYRAMID_AT_INGESTION)
+    except Exception as e:
+        print(f"Error during ingestion: {e}\
+              \nIt can be due to the invalid video id or network issues.")
+        return
 
     # Create agent
-    agent = create_agent(data=processed_output, summarization_group_time=SUMMARIZATION_TIME_DURATION,
-                         vector_db_path=os.path.join(VECTOR_DB_PATH, video_id))
-
-    chat_history = []
-
-    system_prompt = """
-    You are a helpful AI assistant who excels in youtube video summarizing, getting particular information from the video, answering user queries efficiently. Based on the tools and knowledge uyou have please address the user queries correctly.
-    
-    DO NOT ASK FOR LINKS, only answer based on the information you have.
-    
-    Correctly call the tools with the specific input types by seeing the method signature and docstring. Summarize the result correctly to the user.
-    
-    1. When calling the 'Get_Time_Related_Information', more focus on the current time frame, than the previous and next contexts (if present). 
-    
-    2. When user asks about summarizing the video, call the 'Youtube_Video_Summarizer' tool.
-    
-    3. When the user asks about summarizing the video per given time frame, call the 'Youtube_Video_Summarizer_Per_Given_Time_Chunk' tool. When giving the answer, convert seconds to minutes format. For example 80s means 1:20 minute.
-    
-    4. When using 'Question_Answering', attach the timestamps in minutes form, after the response of the user query. TRY TO APPROXIMATE, the timestamp range (NARROW DOWN based on where you are finding the answer, for example, if you get the answer in the middle of the timestamp range (e.g, 150s to 250s), narrow down it to (175s to 225s). Example: For an initial range of 150s to 250s where the answer is central, provide a narrowed range like 175s to 225s, which translates to (Starts at 2:55 - Ends at 3:45) in the final output 
-    e.g, 
-    <RESPONSE>
-    source: [1:20 to 1:45, 2:30 to 2:50]    
-    
-    DO NOT HALUCINATE. If you don't know the answer, simply say Sorry I couldn't find the answer of your query, do not make things by your own!
-    """
-
-    chat_history.append(SystemMessage(content=system_prompt))
+    agent = create_agent(data=timeline, summarization_group_time=SUMMARIZATION_TIME_DURATION,
+                         vector_db_path=os.path.join(VECTOR_DB_PATH, video_id),
+                         map_max_concurrency=SUMMARIZATION_MAX_CONCURRENCY,
+                         reduce_token_budget=SUMMARIZATION_REDUCE_TOKEN_BUDGET,
+                         reduce_fan_in=SUMMARIZATION_REDUCE_FAN_IN,
+                         tool_output_max_tokens=CHAT_TOOL_OUTPUT_MAX_TOKENS,
+                         video_id=video_id, summary_base_window=SUMMARY_PYRAMID_BASE_WINDOW,
+                         summarization_token_budget=SUMMARIZATION_TOKEN_BUDGET,
+                         summary_background_fill=SUMMARY_PYRAMID_BACKGROUND_FILL)
+
+    # History within a token budget (older turns are summarized)
+    chat_context = ChatContext(SYSTEM_PROMPT, token_budget=CHAT_HISTORY_TOKEN_BUDGET,
+                               keep_turns=CHAT_HISTORY_KEEP_TURNS, summarize=CHAT_HISTORY_SUMMARIZE)
+    compaction = None
 
     # Start chatting with the agent
     while True:
         user_input = input("User: ")
 
         if user_input in ['bye', 'exit']:
+            print(f"LLM cache: {llm_cache.stats()}")
+            print(f"Answer cache: {answer_cache.stats()}")
+            print(f"Embedding cache: {get_embeddings().stats()}")
+            print_stage_metrics()
             print("Thank you!\nExitting...")
             break
 
-        chat_history.append(HumanMessage(content=user_input))
+        # Older turns are compacted while the user types (the next prompt needs them)
+        if compaction is not None:
+            compaction.join()
 
-        result = agent.invoke(
-            {'messages': chat_history}
-        )
+        # Answers depend on the conversation before the question (e.g. "What happens next?")
+        context_key = chat_context.key()
+        cached = answer_cache.lookup(video_id, user_input, context=context_key)
+        if cached:
+            print(f"AI: {cached['answer']}")
+            if cached['sources']:
+                print(f"(Cached answer, sources: {', '.join(cached['sources'])})")
+            chat_context.add_turn(user_input, cached['answer'])
+            continue
 
-        last_message = result['messages'][-1]
+        messages = print_agent_answer(agent, chat_context.messages(user_input))
+        last_message = messages[-1]
 
-        if isinstance(last_message.content, list):
-            if last_message.content[0]['text']:
-                print(f"AI: {last_message.content[0]['text']}")
-            elif last_message.content[0]['message']:
-                print(f"AI: {last_message.content[0]['message']}")
-        else:
-            print(f"AI: {last_message.content}")
+        chat_context.add_turn(user_input, get_message_text(last_message))
 
-        chat_history.append(last_message)
+        # Only answers grounded on the video (a tool was called) are reused later
+        sources = get_turn_sources(messages)
+        if sources is not None and isinstance(last_message.content, str):
+            answer_cache.store(video_id, user_input, last_message.content, sources, context=context_key)
+
+        if chat_context.needs_compaction():
+            compaction = threading.Thread(target=chat_context.compact, daemon=True)
+            compaction.start()
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(
+        description="YouTube video summarizer. Without a command, starts the interactive chat.")
+    subparsers = parser.add_subparsers(dest='command')
+
+    ingest_parser = subparsers.add_parser(
+        'ingest', help="Ingest many videos in parallel, without interaction (fetch, translate, embed)")
+    ingest_parser.add_argument(
+        'input', help="Text file with one YouTube URL or video id per line, or JSON Lines with a 'url' or 'video_id' key")
+    ingest_parser.add_argument('--report', default='ingest_report.jsonl',
+                               help="JSON Lines file receiving one status record per video")
+    ingest_parser.add_argument('--fetch-workers', type=int, default=INGEST_FETCH_WORKERS)
+    ingest_parser.add_argument('--translate-workers', type=int, default=INGEST_TRANSLATE_WORKERS)
+    ingest_parser.add_argument('--embed-workers', type=int, default=INGEST_EMBED_WORKERS)
+    ingest_parser.add_argument('--summarize', action='store_true', default=SUMMARY_PYRAMID_AT_INGESTION,
+                               help="Also build the summary pyramid while ingesting (extra LLM calls, fast summaries later)")
+
+    serve_parser = subparsers.add_parser(
+        'serve', help="Run the HTTP service (ingest, summaries, timestamp lookup and chat for many users)")
+    serve_parser.add_argument('--host', default=SERVER_HOST)
+    serve_parser.add_argument('--port', type=int, default=SERVER_PORT)
+
+    library_parser = subparsers.add_parser(
+        'library', help="Chat across all the ingested videos (e.g. a channel or a playlist)")
+    library_parser.add_argument('--input', help="Only search the videos of this file (same format as 'ingest')")
+    library_parser.add_argument('-k', type=int, default=5, help="Chunks returned per search")
+
+    migrate_parser = subparsers.add_parser(
+        'migrate', help="Import the transcription / translation JSON files of previous versions into the video store")
+    migrate_parser.add_argument('--remove', action='store_true', help="Delete the JSON files once imported")
+
+    args = parser.parse_args()
+    if args.command == 'ingest':
+        run_batch_ingestion(args)
+    elif args.command == 'library':
+        run_library_chat(args)
+    elif args.command == 'migrate':
+        run_migration(args)
+    elif args.command == 'serve':
+        from server import run_server
+        run_server(host=args.host, port=args.port)
+    else:
+        main()
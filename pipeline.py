@@ -0,0 +1,226 @@
+import queue
+import threading
+from functools import partial
+from typing import Callable, Iterable, Iterator, Sequence
+from utils import GroupedChunk, iter_grouped
+
+# Defaults (change as needed)
+DEFAULT_QUEUE_SIZE = 32  # Items buffered between two stages (back-pressure on the faster stage)
+DEFAULT_BATCH_SIZE = 64  # Chunk texts per embedding / leaf summary call
+
+_END = object()
+
+
+def iter_queue(q: queue.Queue) -> Iterator:
+    """
+    Yields the items put on the queue until the end marker.
+    """
+    while (item := q.get()) is not _END:
+        yield item
+
+
+def iter_batches(q: queue.Queue, batch_size: int) -> Iterator[list]:
+    """
+    Yields the items put on the queue in batches: waits for one item, then takes
+    whatever else is already queued (at most `batch_size` items per batch).
+    """
+    while (item := q.get()) is not _END:
+        batch = [item]
+        while len(batch) < batch_size:
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                break
+            if item is _END:
+                q.put(_END)  # Seen again by the outer loop (and by a consumer draining the queue after an error)
+                break
+            batch.append(item)
+        yield batch
+
+
+def iter_aligned(data: Iterable[dict], window: int | float) -> Iterator[GroupedChunk]:
+    """
+    Streams the segments grouped into aligned windows `[k * window, (k + 1) * window)`
+    (each holding the segments that start in it, like the leaves of `llm.pyramid.SummaryPyramid`).
+    Windows without segments are skipped.
+    """
+    position = start = end = None
+    texts = []
+    for d in data:
+        if texts and d['start'] // window != position:
+            yield GroupedChunk(start, end, " ".join(texts))
+            texts = []
+        if not texts:
+            position, start = d['start'] // window, d['start']
+        texts.append(d['text'])
+        end = d['end']
+
+    if texts:
+        yield GroupedChunk(start, end, " ".join(texts))
+
+
+class IngestionPipeline:
+    """
+    Streaming ingestion: translated blocks -> grouping -> embedding (and leaf summaries).
+
+    Blocks are submitted as soon as they are translated, in any order. A
+    reorder stage releases the chunks in chronological order to one grouping
+    stage per vector store granularity (and one for the summary pyramid
+    leaves), which emit every window as soon as it is closed. The windows
+    are then embedded (and summarized) in small batches while the translation
+    is still running.
+    Every stage runs in its own thread and the stages are connected by bounded
+    queues, so the total time is close to the slowest stage instead of the sum
+    of all stages.
+
+    Embeddings go through the persistent cache, so building the vector
+    store afterwards only reads them. Leaf summaries are kept in `summaries`,
+    to be added to the pyramid once the translation is saved.
+    """
+
+    def __init__(self, embed_documents: Callable[[list[str]], list], granularities: Sequence[int | float],
+                 summarize: Callable[[list[str]], list[str]] | None = None, summary_window: int | float | None = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Args:
+            embed_documents: Embeds a batch of chunk texts (e.g. `CachedEmbeddings.embed_documents`).
+            granularities: Durations (in seconds) of the vector store windows.
+            summarize: Optional leaf summary step, called with a batch of leaf texts
+                       (e.g. `llm.pyramid.summarize_leaves`).
+            summary_window: Base window (in seconds) of the summary pyramid (required with `summarize`).
+            queue_size: Maximum number of items buffered between two stages.
+            batch_size: Maximum number of texts per `embed_documents` / `summarize` call.
+        """
+        if summarize is not None and summary_window is None:
+            raise ValueError("summary_window is required to summarize the pyramid leaves.")
+
+        self.embed_documents = embed_documents
+        self.summarize = summarize
+        self.summary_window = summary_window
+        self.batch_size = batch_size
+
+        self.embedded = 0
+        # Leaf position -> summary
+        self.summaries: dict[int, str] = {}
+        self._errors: list[Exception] = []
+        self._closed = False
+        self._next_block = 0
+        self._pending_blocks: dict[int, list[dict]] = {}
+
+        self._blocks = queue.Queue(maxsize=queue_size)
+        self._chunk_queues = [queue.Queue(maxsize=queue_size) for _ in granularities]
+        self._embed_queue = queue.Queue(maxsize=queue_size)
+        groupers = [partial(iter_grouped, time=time) for time in granularities]
+        names = [f'pipeline-group-{time:g}s' for time in granularities]
+        outputs = [self._embed_queue] * len(granularities)
+
+        self._summary_queue = None
+        if summarize is not None:
+            self._summary_queue = queue.Queue(maxsize=queue_size)
+            self._chunk_queues.append(queue.Queue(maxsize=queue_size))
+            groupers.append(partial(iter_aligned, window=summary_window))
+            names.append('pipeline-group-leaves')
+            outputs.append(self._summary_queue)
+
+        self._embed_groupers_left = len(granularities)
+        self._groupers_lock = threading.Lock()
+
+        self._threads = [threading.Thread(target=self._reorder, name='pipeline-reorder', daemon=True)]
+        self._threads += [threading.Thread(target=self._group, args=(chunks, group, output), name=name, daemon=True)
+                          for chunks, group, output, name in zip(self._chunk_queues, groupers, outputs, names)]
+        self._threads.append(threading.Thread(target=self._consume, args=(self._embed_queue, self._embed),
+                                              name='pipeline-embed', daemon=True))
+        if self._summary_queue is not None:
+            self._threads.append(threading.Thread(target=self._consume, args=(self._summary_queue, self._summarize),
+                                                  name='pipeline-summarize', daemon=True))
+
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, block_index: int, chunks: list[dict]):
+        """
+        Feeds one translated block (blocks are numbered from 0, and can be submitted in any order).
+        Blocks when the pipeline is saturated.
+        """
+        self._blocks.put((block_index, chunks))
+
+    def close(self) -> dict[str, int]:
+        """
+        Signals that every block was submitted and waits for the pipeline to drain
+        (calling it again only reports the result again).
+
+        Returns:
+            The number of windows embedded and of leaves summarized.
+
+        Raises:
+            The first error raised by a stage.
+        """
+        if not self._closed:
+            self._closed = True
+            self._blocks.put(_END)
+            for thread in self._threads:
+                thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+        return {'embedded': self.embedded, 'summarized': len(self.summaries)}
+
+    def _reorder(self):
+        try:
+            for block_index, chunks in iter_queue(self._blocks):
+                self._pending_blocks[block_index] = chunks
+                # Release the blocks that are now contiguous with the already released ones
+                while self._next_block in self._pending_blocks:
+                    for chunk in self._pending_blocks.pop(self._next_block):
+                        for chunk_queue in self._chunk_queues:
+                            chunk_queue.put(chunk)
+                    self._next_block += 1
+        except Exception as e:
+            self._errors.append(e)
+            for _ in iter_queue(self._blocks):
+                pass
+        else:
+            if self._pending_blocks:
+                self._errors.append(RuntimeError(f"Block {self._next_block} was never submitted."))
+        finally:
+            for chunk_queue in self._chunk_queues:
+                chunk_queue.put(_END)
+
+    def _group(self, chunks: queue.Queue, group: Callable[[Iterator[dict]], Iterator[GroupedChunk]], output: queue.Queue):
+        try:
+            for window in group(iter_queue(chunks)):
+                output.put(window)
+        except Exception as e:
+            self._errors.append(e)
+            for _ in iter_queue(chunks):
+                pass
+        finally:
+            if output is self._summary_queue:
+                output.put(_END)
+            else:
+                # The embedding queue is shared by the granularities, it ends with the last of them
+                with self._groupers_lock:
+                    self._embed_groupers_left -= 1
+                    last = self._embed_groupers_left == 0
+                if last:
+                    output.put(_END)
+
+    def _consume(self, q: queue.Queue, step: Callable[[list[GroupedChunk]], None]):
+        try:
+            for batch in iter_batches(q, self.batch_size):
+                step(batch)
+        except Exception as e:
+            self._errors.append(e)
+            for _ in iter_queue(q):
+                pass
+
+    def _embed(self, windows: list[GroupedChunk]):
+        self.embed_documents([window.text for window in windows])
+        self.embedded += len(windows)
+
+    def _summarize(self, windows: list[GroupedChunk]):
+        # Windows without speech need no call
+        to_summarize = [window for window in windows if window.text]
+        summaries = self.summarize([window.text for window in to_summarize]) if to_summarize else []
+        for window, summary in zip(to_summarize, summaries):
+            self.summaries[int(window.start // self.summary_window)] = summary
@@ -0,0 +1,543 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from functools import partial
+from typing import AsyncIterator
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from config import (VECTOR_DB_PATH, TRANSCRIBED_TEXT_TIME_DURATION, LLM_CACHE_PATH, ANSWER_CACHE_PATH, VECTOR_STORE_TIME_DURATIONS,
+                    SUMMARIZATION_TIME_DURATION, SUMMARIZATION_MAX_CONCURRENCY, SUMMARIZATION_REDUCE_TOKEN_BUDGET,
+                    SUMMARIZATION_REDUCE_FAN_IN, ANSWER_CACHE_SIMILARITY_THRESHOLD, SUMMARY_PYRAMID_AT_INGESTION,
+                    INGEST_FETCH_WORKERS, INGEST_TRANSLATE_WORKERS, INGEST_EMBED_WORKERS, SERVER_HOST, SERVER_PORT,
+                    SERVER_WORKERS, SERVER_MAX_VIDEOS, SERVER_MAX_SESSIONS, SERVER_MAX_JOBS, METRICS_PROMETHEUS_ENDPOINT,
+                    CHAT_HISTORY_TOKEN_BUDGET, CHAT_HISTORY_KEEP_TURNS, CHAT_HISTORY_SUMMARIZE,
+                    CHAT_TOOL_OUTPUT_MAX_TOKENS, SUMMARY_PYRAMID_BASE_WINDOW, SUMMARIZATION_TOKEN_BUDGET,
+                    SUMMARY_PYRAMID_BACKGROUND_FILL, validate_config)
+from utils import extract_video_id
+from timeline import TimelineIndex
+from store import get_video_store
+from ingest import ingest_video, VIDEO_ID_PATTERN
+from fetcher import get_fetcher
+from llm.agents import (create_tools, create_agent, stream_agent, get_message_text, get_turn_sources, get_time_related_info_text,
+                        SYSTEM_PROMPT)
+from llm.vector_store import get_missing_granularities
+from llm.library_index import get_library_index, search_library
+from llm.context import ChatContext
+from llm.providers import get_embeddings
+from llm.cache import init_llm_cache
+from llm.instrumentation import get_metrics
+from llm.answer_cache import SemanticAnswerCache
+
+
+class VideoService:
+    """
+    State shared by every request of the server.
+
+    The model clients, the LLM / embedding / answer caches and the loaded
+    vector stores are process-wide. The tools and the compiled agent of a
+    video are built once and kept for the next requests (LRU), and every chat
+    session keeps its own history. Blocking work (LLM calls, searches,
+    ingestion) runs in a thread pool, so the event loop keeps serving requests.
+    Ingestion only runs in background jobs (one per video at a time): the
+    requests on a video only read what is saved, and are rejected while the
+    video is being ingested.
+    """
+
+    def __init__(self, workers: int = SERVER_WORKERS, max_videos: int = SERVER_MAX_VIDEOS,
+                 max_sessions: int = SERVER_MAX_SESSIONS, max_jobs: int = SERVER_MAX_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='server')
+        self.max_videos = max_videos
+        self.max_sessions = max_sessions
+        self.max_jobs = max_jobs
+
+        self.llm_cache = init_llm_cache(LLM_CACHE_PATH)
+        self.answer_cache = SemanticAnswerCache(
+            ANSWER_CACHE_PATH, get_embeddings(), similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD)
+        self.fetcher = get_fetcher()
+        self.stage_limits = {
+            'fetch': threading.BoundedSemaphore(INGEST_FETCH_WORKERS),
+            'translate': threading.BoundedSemaphore(INGEST_TRANSLATE_WORKERS),
+            'embed': threading.BoundedSemaphore(INGEST_EMBED_WORKERS)
+        }
+
+        # job_id -> job, oldest first (finished jobs are dropped beyond `max_jobs`)
+        self.jobs: OrderedDict[str, dict] = OrderedDict()
+        # video_id -> its queued or running job
+        self._active_jobs: dict[str, dict] = {}
+        self._tasks: set[asyncio.Task] = set()
+        # video_id -> {'timeline', 'tools' (by name), 'agent' (compiled on the first chat)}, least recently used first
+        self._videos: OrderedDict[str, dict] = OrderedDict()
+        self._video_locks: dict[str, asyncio.Lock] = {}
+        # session_id -> {'video_id', 'context' (`ChatContext`), 'lock'}, least recently used first
+        self._sessions: OrderedDict[str, dict] = OrderedDict()
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Runs a blocking function in the thread pool.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    async def iterate(self, fn, *args, **kwargs) -> AsyncIterator:
+        """
+        Runs a blocking generator function in the thread pool, yielding its items as they are produced.
+        The generator stops at its next item if the consumer stops early (e.g. the client disconnected).
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        done = object()
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                for item in fn(*args, **kwargs):
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(items.put_nowait, (item, None))
+            except Exception as e:
+                loop.call_soon_threadsafe(items.put_nowait, (done, e))
+            else:
+                loop.call_soon_threadsafe(items.put_nowait, (done, None))
+
+        loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                item, error = await items.get()
+                if item is done:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            stopped.set()
+
+    def is_ingested(self, video_id: str) -> bool:
+        return not get_missing_granularities(os.path.join(VECTOR_DB_PATH, video_id), VECTOR_STORE_TIME_DURATIONS)
+
+    def check_ingested(self, video_id: str):
+        """
+        Raises:
+            web.HTTPConflict: If the video is being ingested.
+            web.HTTPNotFound: If the video is not ingested yet.
+        """
+        job = self._active_jobs.get(video_id)
+        if job is not None:
+            raise json_error(web.HTTPConflict, f"Video {video_id} is being ingested (job {job['job_id']}), "
+                                               f"try again once the job is done.")
+        if not self.is_ingested(video_id):
+            raise json_error(web.HTTPNotFound, f"Video {video_id} is not ingested yet (POST /ingest first).")
+
+    def submit_ingestion(self, video_id: str, summarize: bool = SUMMARY_PYRAMID_AT_INGESTION) -> dict:
+        """
+        Starts the ingestion of a video in the background (or returns the job already running for it).
+        """
+        job = self._active_jobs.get(video_id)
+        if job is not None:
+            return job
+
+        job = {'job_id': uuid.uuid4().hex, 'video_id': video_id, 'status': 'queued'}
+        self.jobs[job['job_id']] = job
+        self._active_jobs[video_id] = job
+        task = asyncio.create_task(self._run_ingestion(job, summarize))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run_ingestion(self, job: dict, summarize: bool):
+        start = time.perf_counter()
+        job['status'] = 'running'
+        try:
+            _, job['stages'] = await self.run(ingest_video, job['video_id'], self.fetcher, self.stage_limits,
+                                              summarize=summarize)
+            job['status'] = 'done'
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = f"{type(e).__name__}: {e}"
+        finally:
+            job['seconds'] = round(time.perf_counter() - start, 3)
+            del self._active_jobs[job['video_id']]
+            # The video may have been rebuilt: drop its tools and agent
+            self._videos.pop(job['video_id'], None)
+            self._expire_jobs()
+
+    def _expire_jobs(self):
+        """
+        Drops the oldest finished jobs beyond `max_jobs` (queued and running jobs are kept).
+        """
+        excess = len(self.jobs) - self.max_jobs
+        if excess > 0:
+            finished = [job_id for job_id, job in self.jobs.items() if job['status'] in ('done', 'failed')]
+            for job_id in finished[:excess]:
+                del self.jobs[job_id]
+
+    def load_timeline(self, video_id: str) -> TimelineIndex | None:
+        """
+        Reads the English timeline of an ingested video from the store (None if it is not saved).
+        """
+        store = get_video_store()
+        return store.load_timeline(video_id, store.english_kind(video_id), window=TRANSCRIBED_TEXT_TIME_DURATION)
+
+    async def get_video(self, video_id: str) -> dict:
+        """
+        Returns the timeline and the tools (by name) of an ingested video, building them once.
+        The agent (which needs the chat model) is only compiled by the first chat message.
+
+        Raises:
+            web.HTTPConflict: If the video is being ingested.
+            web.HTTPNotFound: If the video is not ingested yet.
+        """
+        self.check_ingested(video_id)
+        if video_id in self._videos:
+            self._videos.move_to_end(video_id)
+            return self._videos[video_id]
+
+        lock = self._video_locks.setdefault(video_id, asyncio.Lock())
+        async with lock:
+            entry = self._videos.get(video_id)
+            if entry is None:
+                timeline = await self.run(self.load_timeline, video_id)
+                if timeline is None:
+                    raise json_error(web.HTTPNotFound, f"Video {video_id} is not ingested yet (POST /ingest first).")
+                tools = await self.run(create_tools, timeline, vector_db_path=os.path.join(VECTOR_DB_PATH, video_id),
+                                       summarization_group_time=SUMMARIZATION_TIME_DURATION,
+                                       map_max_concurrency=SUMMARIZATION_MAX_CONCURRENCY,
+                                       reduce_token_budget=SUMMARIZATION_REDUCE_TOKEN_BUDGET,
+                                       reduce_fan_in=SUMMARIZATION_REDUCE_FAN_IN, video_id=video_id,
+                                       summary_base_window=SUMMARY_PYRAMID_BASE_WINDOW,
+                                       summarization_token_budget=SUMMARIZATION_TOKEN_BUDGET,
+                                       summary_background_fill=SUMMARY_PYRAMID_BACKGROUND_FILL)
+                entry = {'timeline': timeline, 'tools': {t.name: t for t in tools}, 'agent': None}
+                # Not kept if an ingestion of the video started meanwhile (it may rebuild it)
+                if video_id not in self._active_jobs:
+                    self._videos[video_id] = entry
+                    while len(self._videos) > self.max_videos:
+                        self._videos.popitem(last=False)
+
+        return entry
+
+    async def invoke_tool(self, video_id: str, name: str, args: dict):
+        video = await self.get_video(video_id)
+        return await self.run(video['tools'][name].invoke, args)
+
+    async def get_time_related_info(self, video_id: str, time_in_sec: int | float) -> str | None:
+        """
+        Same result as the `Get_Time_Related_Information` tool, but only reads the
+        chunks around the timestamp from the store when the video is not loaded.
+        """
+        if video_id in self._videos:
+            return await self.invoke_tool(video_id, 'Get_Time_Related_Information', {'time_in_sec': time_in_sec})
+
+        self.check_ingested(video_id)
+
+        def read():
+            store = get_video_store()
+            timeline = store.load_around(video_id, store.english_kind(video_id), time_in_sec)
+            return get_time_related_info_text(timeline, time_in_sec) if timeline is not None else None
+        return await self.run(read)
+
+    async def get_agent(self, video_id: str):
+        video = await self.get_video(video_id)
+        if video['agent'] is None:
+            video['agent'] = create_agent(video['timeline'], vector_db_path=os.path.join(VECTOR_DB_PATH, video_id),
+                                          tools=list(video['tools'].values()),
+                                          tool_output_max_tokens=CHAT_TOOL_OUTPUT_MAX_TOKENS)
+        return video['agent']
+
+    def get_session(self, session_id: str | None, video_id: str) -> tuple[str, dict]:
+        """
+        Returns the chat session (a new one if `session_id` is unknown or belongs to another video).
+        """
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None or session['video_id'] != video_id:
+            session_id = uuid.uuid4().hex
+            context = ChatContext(SYSTEM_PROMPT, token_budget=CHAT_HISTORY_TOKEN_BUDGET,
+                                  keep_turns=CHAT_HISTORY_KEEP_TURNS, summarize=CHAT_HISTORY_SUMMARIZE)
+            session = {'video_id': video_id, 'context': context, 'lock': asyncio.Lock()}
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return session_id, session
+
+    def end_session(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    async def chat(self, video_id: str, session_id: str | None, message: str) -> dict:
+        """
+        Answers one chat message, with the history of the session (turns of a session run one at a time).
+        """
+        result = None
+        async for event in self.chat_stream(video_id, session_id, message):
+            if event['type'] == 'answer':
+                result = {name: value for name, value in event.items() if name != 'type'}
+        return result
+
+    async def chat_stream(self, video_id: str, session_id: str | None, message: str) -> AsyncIterator[dict]:
+        """
+        Same as `chat`, but yields the output as it is produced: the answer tokens
+        (`{'type': 'token', 'text'}`), the interval summaries, in chronological order, as soon as
+        they are ready (`{'type': 'interval_summary', 'index', 'count', 'start', 'end', 'summary'}`),
+        then the answer (`{'type': 'answer'}` with the keys returned by `chat`).
+        """
+        agent = await self.get_agent(video_id)
+        session_id, session = self.get_session(session_id, video_id)
+
+        async with session['lock']:
+            context = session['context']
+            # Answers depend on the conversation before the message (e.g. "What happens next?")
+            context_key = context.key()
+            cached = await self.run(self.answer_cache.lookup, video_id, message, context_key)
+            if cached:
+                context.add_turn(message, cached['answer'])
+                yield {'type': 'answer', 'session_id': session_id, 'answer': cached['answer'],
+                       'sources': cached['sources'], 'cached': True}
+                return
+
+            messages = []
+            async for kind, value in self.iterate(stream_agent, agent, context.messages(message)):
+                if kind == 'messages':
+                    messages = value
+                elif kind == 'token':
+                    yield {'type': 'token', 'text': value}
+                else:
+                    yield {'type': kind, **value}
+
+            last_message = messages[-1]
+            answer = get_message_text(last_message)
+            context.add_turn(message, answer)
+
+            # Only answers grounded on the video (a tool was called) are reused later
+            sources = get_turn_sources(messages)
+            if sources is not None and isinstance(last_message.content, str):
+                await self.run(self.answer_cache.store, video_id, message, answer, sources, context_key)
+
+        # Older turns are summarized after the answer is sent (the next turn of the session waits for it)
+        if context.needs_compaction():
+            task = asyncio.create_task(self.compact_session(session))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        yield {'type': 'answer', 'session_id': session_id, 'answer': answer, 'sources': sources or [], 'cached': False}
+
+    async def compact_session(self, session: dict):
+        async with session['lock']:
+            await self.run(session['context'].compact)
+
+    def stats(self) -> dict:
+        return {
+            'videos_loaded': len(self._videos),
+            'sessions': len(self._sessions),
+            'jobs': len(self.jobs),
+            'llm_cache': self.llm_cache.stats(),
+            'answer_cache': self.answer_cache.stats(),
+            'embedding_cache': get_embeddings().stats(),
+            'fetcher': self.fetcher.stats(),
+            'library': get_library_index().stats(),
+            'stages': get_metrics().snapshot()
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        get_library_index().save()
+
+
+def json_error(error_class: type[web.HTTPException], message: str) -> web.HTTPException:
+    return error_class(text=json.dumps({'error': message}), content_type='application/json')
+
+
+def get_video_id(request: web.Request) -> str:
+    video_id = request.match_info['video_id']
+    if not VIDEO_ID_PATTERN.match(video_id):
+        raise json_error(web.HTTPBadRequest, f"Invalid video id: {video_id}")
+    return video_id
+
+
+def get_number(request: web.Request, name: str) -> float:
+    try:
+        return float(request.query[name])
+    except (KeyError, ValueError):
+        raise json_error(web.HTTPBadRequest, f"Query parameter '{name}' must be a number (seconds).")
+
+
+async def get_json(request: web.Request) -> dict:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise json_error(web.HTTPBadRequest, "The request body must be a JSON object.")
+    if not isinstance(body, dict):
+        raise json_error(web.HTTPBadRequest, "The request body must be a JSON object.")
+    return body
+
+
+routes = web.RouteTableDef()
+
+
+@routes.get('/health')
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({'status': 'ok'})
+
+
+@routes.get('/stats')
+async def stats(request: web.Request) -> web.Response:
+    return web.json_response(request.app['service'].stats())
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """
+    Per-stage metrics in the Prometheus text format (registered if `METRICS_PROMETHEUS_ENDPOINT` is set).
+    """
+    return web.Response(text=get_metrics().to_prometheus(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+@routes.post('/ingest')
+async def ingest(request: web.Request) -> web.Response:
+    """
+    Body: {"url": "..."} or {"video_id": "..."}, optionally "summarize": true. Returns the background job.
+    """
+    body = await get_json(request)
+    value = body.get('url') or body.get('video_id') or ''
+    video_id = extract_video_id(value) or (value if VIDEO_ID_PATTERN.match(value) else None)
+    if video_id is None:
+        raise json_error(web.HTTPBadRequest, "Expected a YouTube 'url' or 'video_id'.")
+
+    job = request.app['service'].submit_ingestion(video_id, summarize=bool(body.get('summarize', SUMMARY_PYRAMID_AT_INGESTION)))
+    return web.json_response(job, status=202)
+
+
+@routes.get('/jobs/{job_id}')
+async def get_job(request: web.Request) -> web.Response:
+    job = request.app['service'].jobs.get(request.match_info['job_id'])
+    if job is None:
+        raise json_error(web.HTTPNotFound, "Unknown job.")
+    return web.json_response(job)
+
+
+@routes.get('/videos/{video_id}/summary')
+async def summary(request: web.Request) -> web.Response:
+    video_id = get_video_id(request)
+    result = await request.app['service'].invoke_tool(video_id, 'Youtube_Video_Summarizer', {})
+    return web.json_response({'video_id': video_id, 'summary': result})
+
+
+@routes.get('/videos/{video_id}/summaries')
+async def interval_summaries(request: web.Request) -> web.Response:
+    """
+    Query: ?interval=<seconds>. One summary per interval, in chronological order.
+    """
+    video_id = get_video_id(request)
+    interval = get_number(request, 'interval')
+    result = await request.app['service'].invoke_tool(
+        video_id, 'Youtube_Video_Summarizer_Per_Given_Time_Chunk', {'time_in_sec': interval})
+    if isinstance(result, str):
+        raise json_error(web.HTTPBadRequest, result)
+    return web.json_response({'video_id': video_id, 'interval': interval, 'summaries': result})
+
+
+@routes.get('/videos/{video_id}/timestamp')
+async def timestamp(request: web.Request) -> web.Response:
+    """
+    Query: ?t=<seconds>. What is said around the timestamp (previous, current and next chunks).
+    """
+    video_id = get_video_id(request)
+    t = get_number(request, 't')
+    result = await request.app['service'].get_time_related_info(video_id, t)
+    return web.json_response({'video_id': video_id, 't': t, 'result': result})
+
+
+@routes.post('/videos/{video_id}/chat')
+async def chat(request: web.Request) -> web.Response:
+    """
+    Body: {"message": "...", "session_id": "..." (optional, returned by the first answer)}.
+    """
+    video_id = get_video_id(request)
+    body = await get_json(request)
+    message = body.get('message')
+    if not isinstance(message, str) or not message.strip():
+        raise json_error(web.HTTPBadRequest, "Expected a non-empty 'message'.")
+
+    result = await request.app['service'].chat(video_id, body.get('session_id'), message)
+    return web.json_response(result)
+
+
+@routes.post('/videos/{video_id}/chat/stream')
+async def chat_stream(request: web.Request) -> web.StreamResponse:
+    """
+    Same body as /chat. Answers with newline-delimited JSON events, sent as they are produced:
+    answer tokens, interval summaries (in chronological order, as soon as they are ready), then
+    the answer (same keys as /chat, with "type": "answer").
+    """
+    video_id = get_video_id(request)
+    body = await get_json(request)
+    message = body.get('message')
+    if not isinstance(message, str) or not message.strip():
+        raise json_error(web.HTTPBadRequest, "Expected a non-empty 'message'.")
+
+    service = request.app['service']
+    # Errors (e.g. video not ingested) are still sent as a regular response
+    await service.get_agent(video_id)
+
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+    await response.prepare(request)
+    async for event in service.chat_stream(video_id, body.get('session_id'), message):
+        await response.write((json.dumps(event) + "\n").encode())
+    await response.write_eof()
+    return response
+
+
+@routes.post('/library/search')
+async def library_search(request: web.Request) -> web.Response:
+    """
+    Body: {"query": "...", "k": 5 (optional), "video_ids": [...] (optional, e.g. the videos of a playlist)}.
+    The most relevant chunks across the ingested videos, best first.
+    """
+    body = await get_json(request)
+    query = body.get('query')
+    if not isinstance(query, str) or not query.strip():
+        raise json_error(web.HTTPBadRequest, "Expected a non-empty 'query'.")
+    video_ids = body.get('video_ids')
+    if video_ids is not None and (not isinstance(video_ids, list) or not all(isinstance(v, str) for v in video_ids)):
+        raise json_error(web.HTTPBadRequest, "'video_ids' must be a list of video ids.")
+    k = body.get('k', 5)
+    if not isinstance(k, int) or not 0 < k <= 100:
+        raise json_error(web.HTTPBadRequest, "'k' must be an integer between 1 and 100.")
+
+    results = await request.app['service'].run(search_library, query, k=k, video_ids=video_ids)
+    return web.json_response({'query': query, 'results': results})
+
+
+@routes.delete('/sessions/{session_id}')
+async def end_session(request: web.Request) -> web.Response:
+    if not request.app['service'].end_session(request.match_info['session_id']):
+        raise json_error(web.HTTPNotFound, "Unknown session.")
+    return web.json_response({'status': 'deleted'})
+
+
+def create_app(service: VideoService | None = None) -> web.Application:
+    """
+    Creates the HTTP application (a new `VideoService` is created if not given).
+    """
+    validate_config()
+
+    app = web.Application()
+    app['service'] = service or VideoService()
+    app.add_routes(routes)
+    if METRICS_PROMETHEUS_ENDPOINT:
+        app.router.add_get('/metrics', metrics)
+
+    async def close_service(app: web.Application):
+        app['service'].close()
+    app.on_cleanup.append(close_service)
+
+    return app
+
+
+def run_server(host: str = SERVER_HOST, port: int = SERVER_PORT):
+    web.run_app(create_app(), host=host, port=port)
+
+
+if __name__ == '__main__':
+    run_server()
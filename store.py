@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import time
+import threading
+from array import array
+from bisect import bisect_right
+from config import VIDEO_STORE_PATH
+from timeline import TimelineIndex
+from llm.cache import open_sqlite
+
+# Kinds of data stored per video
+RAW = 'raw'  # Captions as fetched ('text', 'start', 'duration')
+GROUPED = 'grouped'  # Captions merged into ~1 minute chunks
+TRANSLATED = 'translated'  # English translation of the grouped chunks
+
+
+def _to_blob(values: array) -> bytes:
+    # Little-endian on disk, whatever the machine
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_blob(typecode: str, blob: bytes) -> array:
+    values = array(typecode, blob)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+class VideoStore:
+    """
+    Compact SQLite store of the transcripts of every video.
+
+    Each (video, kind) row is columnar, with the same layout as `TimelineIndex`:
+    start / end times are packed float64 arrays, and the texts are stored once,
+    joined by a single space, with an int64 offsets array. Loading a video is
+    a single row read with no parsing per segment, and a time range is read
+    without the rest of the text (binary search over the start times, then
+    `substr` on the text column).
+
+    Raw captions, grouped chunks and translations live under the same video id.
+    Grouped chunks and translations remember the grouping window they were
+    built with, and are only reused with the same window.
+    """
+
+    def __init__(self, database_path: str):
+        """
+        Args:
+            database_path: Path of the SQLite database file.
+        """
+        self.database_path = database_path
+        self._local = threading.local()
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS segments (
+                    video_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    language TEXT,
+                    language_code TEXT,
+                    group_window REAL,
+                    count INTEGER NOT NULL,
+                    starts BLOB NOT NULL,
+                    ends BLOB NOT NULL,
+                    offsets BLOB NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (video_id, kind)
+                )
+            """)
+            # Nodes of the summary pyramids (see `llm.pyramid.SummaryPyramid`), and summaries of
+            # chunk ranges [position, position - level) under a negative level
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    video_id TEXT NOT NULL,
+                    base_window REAL NOT NULL,
+                    level INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    summary TEXT NOT NULL,
+                    PRIMARY KEY (video_id, base_window, level, position)
+                )
+            """)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = open_sqlite(self.database_path)
+            self._local.conn = conn
+        return conn
+
+    def has(self, video_id: str, kind: str, window: int | float | None = None) -> bool:
+        """
+        Whether the video has data of this kind (built with this grouping window, if given).
+        """
+        row = self._connection().execute(
+            "SELECT group_window FROM segments WHERE video_id = ? AND kind = ?", (video_id, kind)).fetchone()
+        return row is not None and (window is None or row[0] == window)
+
+    def _save(self, video_id: str, kind: str, starts: array, ends: array, offsets: array, text: str,
+              language: str | None = None, language_code: str | None = None, window: int | float | None = None):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO segments
+                   (video_id, kind, language, language_code, group_window, count, starts, ends, offsets, text, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (video_id, kind, language, language_code, window, len(starts),
+                 _to_blob(starts), _to_blob(ends), _to_blob(offsets), text, time.time())
+            )
+
+    def save_timeline(self, video_id: str, kind: str, timeline: TimelineIndex, window: int | float | None = None):
+        """
+        Saves grouped chunks or a translation (any `TimelineIndex`) under the video id.
+        The summaries of the video are deleted (they may have been built from other chunks).
+        """
+        starts, ends, offsets, buffer = timeline.columns()
+        # Grouped indexes share a bigger buffer: only keep their part, with offsets from 0
+        base = offsets[0]
+        text = buffer[base:offsets[-1] - 1]
+        if base:
+            offsets = array('q', (offset - base for offset in offsets))
+        self._save(video_id, kind, starts, ends, offsets, text, window=window)
+        self.delete_summaries(video_id)
+
+    def load_timeline(self, video_id: str, kind: str, window: int | float | None = None) -> TimelineIndex | None:
+        """
+        Loads grouped chunks or a translation, or None if missing (or built with another grouping window).
+        """
+        row = self._connection().execute(
+            "SELECT group_window, starts, ends, offsets, text FROM segments WHERE video_id = ? AND kind = ?",
+            (video_id, kind)).fetchone()
+        if row is None or (window is not None and row[0] != window):
+            return None
+
+        _, starts, ends, offsets, text = row
+        return TimelineIndex(_from_blob('d', starts), _from_blob('d', ends), _from_blob('q', offsets), text)
+
+    def save_transcription(self, video_id: str, transcription: dict):
+        """
+        Saves raw captions (`language`, `language_code` and `data` keys, as returned by the transcript API).
+        The caption durations are kept in the `ends` column.
+        """
+        data = transcription['data']
+        timeline = TimelineIndex.from_records(
+            {'start': d['start'], 'end': d['duration'], 'text': d['text']} for d in data)
+        starts, durations, offsets, buffer = timeline.columns()
+        self._save(video_id, RAW, starts, durations, offsets, buffer,
+                   language=transcription['language'], language_code=transcription['language_code'])
+
+    def load_transcription(self, video_id: str) -> dict | None:
+        """
+        Loads raw captions in the format given to `save_transcription`, or None if missing.
+        """
+        row = self._connection().execute(
+            "SELECT language, language_code, starts, ends, offsets, text FROM segments WHERE video_id = ? AND kind = ?",
+            (video_id, RAW)).fetchone()
+        if row is None:
+            return None
+
+        language, language_code, starts, durations, offsets, text = row
+        timeline = TimelineIndex(_from_blob('d', starts), _from_blob('d', durations), _from_blob('q', offsets), text)
+        return {
+            'language': language,
+            'language_code': language_code,
+            'data': [{'text': timeline.text(i), 'start': timeline.starts[i], 'duration': timeline.ends[i]}
+                     for i in range(len(timeline))]
+        }
+
+    def get_language(self, video_id: str) -> tuple[str, str] | None:
+        """
+        Returns the language and language code of the raw captions, or None if they are not saved.
+        """
+        row = self._connection().execute(
+            "SELECT language, language_code FROM segments WHERE video_id = ? AND kind = ?", (video_id, RAW)).fetchone()
+        return tuple(row) if row else None
+
+    def english_kind(self, video_id: str) -> str:
+        """
+        Returns the kind holding the English chunks of the video (the grouped captions of an English video, else the translation).
+        """
+        language, _ = self.get_language(video_id) or ('', '')
+        return GROUPED if 'english' in language.lower() else TRANSLATED
+
+    def load_range(self, video_id: str, kind: str, first: int, last: int) -> TimelineIndex | None:
+        """
+        Loads segments `first` to `last` (exclusive, clamped) without reading the rest of the text.
+        """
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT starts, ends, offsets FROM segments WHERE video_id = ? AND kind = ?", (video_id, kind)).fetchone()
+        if row is None:
+            return None
+
+        starts, ends, offsets = (_from_blob(typecode, blob) for typecode, blob in zip('ddq', row))
+        first, last = max(0, first), min(len(starts), last)
+        if first >= last:
+            return TimelineIndex(array('d'), array('d'), array('q', [0]), "")
+
+        base = offsets[first]
+        # SQLite strings are 1-based (and count characters, like Python)
+        (text,) = conn.execute(
+            "SELECT substr(text, ?, ?) FROM segments WHERE video_id = ? AND kind = ?",
+            (base + 1, offsets[last] - 1 - base, video_id, kind)).fetchone()
+
+        return TimelineIndex(starts[first:last], ends[first:last],
+                             array('q', (offset - base for offset in offsets[first:last + 1])), text)
+
+    def load_around(self, video_id: str, kind: str, time: int | float, context: int = 1) -> TimelineIndex | None:
+        """
+        Loads the segment containing `time` (or the first one after it) and `context` segments on each side
+        (enough for a timestamp lookup, without loading the whole transcript).
+        """
+        row = self._connection().execute(
+            "SELECT starts FROM segments WHERE video_id = ? AND kind = ?", (video_id, kind)).fetchone()
+        if row is None:
+            return None
+
+        i = bisect_right(_from_blob('d', row[0]), time) - 1
+        return self.load_range(video_id, kind, i - context, i + context + 2)
+
+    def load_summaries(self, video_id: str, base_window: int | float) -> dict[tuple[int, int], str]:
+        """
+        Returns the summary pyramid nodes of the video, by (level, position).
+        """
+        rows = self._connection().execute(
+            "SELECT level, position, summary FROM summaries WHERE video_id = ? AND base_window = ?",
+            (video_id, base_window)).fetchall()
+        return {(level, position): summary for level, position, summary in rows}
+
+    def save_summaries(self, video_id: str, base_window: int | float, summaries: dict[tuple[int, int], str]):
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO summaries (video_id, base_window, level, position, summary) VALUES (?, ?, ?, ?, ?)",
+                ((video_id, base_window, level, position, summary) for (level, position), summary in summaries.items())
+            )
+
+    def delete_summaries(self, video_id: str):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM summaries WHERE video_id = ?", (video_id,))
+
+    def delete(self, video_id: str):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM segments WHERE video_id = ?", (video_id,))
+            conn.execute("DELETE FROM summaries WHERE video_id = ?", (video_id,))
+
+    def migrate_json(self, transcription_dir: str, translation_dir: str, grouping_window: int | float,
+                     remove: bool = False) -> dict[str, int]:
+        """
+        Imports the per-video JSON files written by previous versions (`<dir>/<video_id>.json`).
+
+        Translations are assumed to be built from chunks of `grouping_window` seconds
+        (the configured `TRANSCRIBED_TEXT_TIME_DURATION`).
+
+        Args:
+            transcription_dir: Folder of the raw caption files.
+            translation_dir: Folder of the translation files.
+            grouping_window: Grouping window of the translated chunks, in seconds.
+            remove: Delete every JSON file once it is imported.
+
+        Returns:
+            The number of imported transcriptions and translations.
+        """
+        counts = {'transcriptions': 0, 'translations': 0}
+        for directory, kind in ((transcription_dir, RAW), (translation_dir, TRANSLATED)):
+            if not os.path.isdir(directory):
+                continue
+
+            for file_name in sorted(os.listdir(directory)):
+                # Translation journals (`<id>.journal.jsonl`) and other files are left alone
+                video_id, extension = os.path.splitext(file_name)
+                if extension != '.json' or '.' in video_id:
+                    continue
+
+                path = os.path.join(directory, file_name)
+                with open(path, 'r') as f:
+                    data = json.load(f)
+
+                if kind == RAW:
+                    self.save_transcription(video_id, data)
+                    counts['transcriptions'] += 1
+                else:
+                    self.save_timeline(video_id, TRANSLATED, TimelineIndex.from_records(data), window=grouping_window)
+                    counts['translations'] += 1
+
+                if remove:
+                    os.remove(path)
+
+        return counts
+
+
+_video_store = None
+_video_store_lock = threading.Lock()
+
+
+def get_video_store() -> VideoStore:
+    """
+    Returns the process-wide store (`config.VIDEO_STORE_PATH`), opened on first use.
+    """
+    global _video_store
+    with _video_store_lock:
+        if _video_store is None:
+            _video_store = VideoStore(VIDEO_STORE_PATH)
+        return _video_store
+
+
+def set_video_store(store: VideoStore):
+    """
+    Replaces the process-wide store (e.g. a temporary one in the benchmarks).
+    """
+    global _video_store
+    with _video_store_lock:
+        _video_store = store
@@ -0,0 +1,64 @@
+import pytest
+from llm.fake import FakeEmbeddings
+from llm.answer_cache import SemanticAnswerCache, get_numbers
+
+
+@pytest.fixture
+def embeddings():
+    return FakeEmbeddings()
+
+
+@pytest.fixture
+def cache(tmp_path, embeddings):
+    return SemanticAnswerCache(str(tmp_path / 'answers.sqlite'), embeddings)
+
+
+def test_get_numbers():
+    assert get_numbers("What happens at 3:20 in part 5?") == "3:20 5"
+    assert get_numbers("Who is the speaker?") == ""
+
+
+def test_same_question_hits(cache):
+    cache.store('video', "What is the main topic of the video?", "Transformers.", ['0s to 120s'])
+
+    cached = cache.lookup('video', "What is the main topic of the video?")
+
+    assert cached['answer'] == "Transformers."
+    assert cached['sources'] == ['0s to 120s']
+
+
+def test_follow_up_only_hits_after_the_same_history(cache):
+    cache.store('video', "What happens next?", "The training starts.", [], context='conversation-a')
+
+    assert cache.lookup('video', "What happens next?", context='conversation-b') is None
+    assert cache.lookup('video', "What happens next?") is None
+    assert cache.lookup('video', "What happens next?", context='conversation-a')['answer'] == "The training starts."
+
+
+def test_numbers_must_match_exactly(cache):
+    cache.store('video', "What happens at 3:20?", "The demo.", ['180s to 240s'])
+
+    assert cache.lookup('video', "What happens at 3:25?") is None
+    assert cache.lookup('video', "What happens at 3:20?")['answer'] == "The demo."
+
+
+def test_no_embedding_call_without_candidates(cache, embeddings):
+    assert cache.lookup('video', "What is the main topic of the video?") is None
+    cache.store('video', "What is the main topic of the video?", "Transformers.", [])
+    cache.lookup('other-video', "What is the main topic of the video?")
+
+    assert embeddings.usage.snapshot().get('calls', 0) == 0
+
+
+def test_stored_questions_are_embedded_once(tmp_path, embeddings):
+    path = str(tmp_path / 'answers.sqlite')
+    cache = SemanticAnswerCache(path, embeddings)
+    cache.store('video', "What is the main topic of the video?", "Transformers.", [])
+    cache.lookup('video', "Which dataset is used?")
+    calls = embeddings.usage.snapshot()['calls']
+
+    # The stored vector is reused, by this process and by another one
+    cache.lookup('video', "Which model is trained?")
+    SemanticAnswerCache(path, embeddings).lookup('video', "Which layer is frozen?")
+
+    assert embeddings.usage.snapshot()['calls'] == calls + 2
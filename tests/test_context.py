@@ -0,0 +1,108 @@
+import llm.context as context
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+from llm.context import ChatContext, compact_tool_messages, get_sources
+from llm.fake import FakeChatModel
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def make_context(**kwargs) -> ChatContext:
+    return ChatContext("You answer questions about a video.", count_tokens=count_words, **kwargs)
+
+
+def test_get_sources():
+    text = "FROM: 120.0s to 240.0s ... SUMMARY OF 0s to 120s ... VIDEO abc-123_xyz FROM: 5.0s to 10.0s FROM: 120.0s to 240.0s"
+
+    assert get_sources(text) == ["120.0s to 240.0s", "0s to 120s", "abc-123_xyz 5.0s to 10.0s"]
+
+
+def test_no_compaction_under_the_budget():
+    chat = make_context(token_budget=100, summarize=False)
+    chat.add_turn("one two", "three four")
+
+    assert not chat.compact()
+    assert chat.tokens() == 4 and chat.key()
+
+
+def test_compaction_keeps_recent_turns_and_frees_down_to_the_target():
+    chat = make_context(token_budget=100, keep_turns=2, summarize=False)
+    for i in range(6):
+        chat.add_turn(f"question {i} " + "word " * 8, f"answer {i} " + "word " * 8)
+
+    assert chat.compact()
+
+    # 20 tokens per turn: down to 60% of the budget, the 2 most recent turns always kept
+    assert [question.split()[1] for question, _, _ in chat.turns] == ["3", "4", "5"]
+    assert chat.tokens() <= 100
+    assert "question 2" in chat.summary and chat.compactions == 1
+    messages = chat.messages("next question")
+    assert isinstance(messages[0], SystemMessage) and "question 2" in messages[1].content
+    assert messages[-1] == HumanMessage(content="next question")
+
+
+def test_summary_is_capped_to_its_share():
+    chat = make_context(token_budget=100, keep_turns=1, summarize=False)
+    for i in range(20):
+        chat.add_turn(f"question {i} " + "word " * 8, f"answer {i} " + "word " * 8)
+        chat.compact()
+
+    assert chat.summary_tokens <= 100 * context.SUMMARY_SHARE
+    # The oldest turns go first
+    first_kept = int(chat.turns[0][0].split()[1])
+    assert "question 0 " not in chat.summary and f"question {first_kept - 1} " in chat.summary
+
+
+def test_compaction_summarizes_the_evicted_turns_only(monkeypatch):
+    llm = FakeChatModel()
+    monkeypatch.setattr(context, 'get_chat_model', lambda: llm)
+    chat = make_context(token_budget=50, keep_turns=1)
+    for i in range(6):
+        chat.add_turn(f"question {i} " + "word " * 8, f"answer {i}")
+
+    assert chat.compact()
+    assert llm.usage.snapshot()['calls'] == 1
+    assert "question 0 " in chat.summary and len(chat.turns) < 6
+
+
+def test_history_key_changes_with_the_history():
+    chat = make_context()
+    assert chat.key() == ""
+    chat.add_turn("a", "b")
+    key = chat.key()
+    chat.add_turn("c", "d")
+
+    assert chat.key() != key and len(key) == 64
+
+
+def tool_call(call_id: str) -> AIMessage:
+    return AIMessage(content="", tool_calls=[{'name': 'Question_Answering', 'args': {}, 'id': call_id, 'type': 'tool_call'}])
+
+
+def test_answered_large_tool_outputs_are_replaced():
+    large = "FROM: 120.0s to 240.0s " + "word " * 500
+    messages = [
+        HumanMessage(content="first question"),
+        tool_call("1"),
+        ToolMessage(content=large, tool_call_id="1", name="Question_Answering"),
+        AIMessage(content="first answer"),
+        HumanMessage(content="second question"),
+        tool_call("2"),
+        ToolMessage(content=large, tool_call_id="2", name="Question_Answering"),
+    ]
+
+    compacted = compact_tool_messages(messages, max_tokens=100, count_tokens=count_words)
+
+    assert "120.0s to 240.0s" in compacted[2].content and count_words(compacted[2].content) < 100
+    assert compacted[2].tool_call_id == "1"
+    # Not answered yet: kept whole
+    assert compacted[6].content == large
+    # The agent state itself is not modified
+    assert messages[2].content == large
+
+
+def test_small_tool_outputs_are_kept():
+    messages = [tool_call("1"), ToolMessage(content="short output", tool_call_id="1"), AIMessage(content="answer")]
+
+    assert compact_tool_messages(messages, max_tokens=1000, count_tokens=count_words) == messages
@@ -0,0 +1,55 @@
+import pytest
+import fetcher
+from fetcher import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(fetcher.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(fetcher.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_burst_then_rate(clock):
+    bucket = TokenBucket(rate=4, capacity=2)
+
+    waits = [bucket.acquire() for _ in range(6)]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2:] == pytest.approx([0.25] * 4)
+    assert clock.now == pytest.approx(1.0)
+
+
+def test_refill_is_capped_by_capacity(clock):
+    bucket = TokenBucket(rate=4, capacity=2)
+    for _ in range(2):
+        bucket.acquire()
+
+    clock.now += 0.25  # One token refilled
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.25)
+
+    clock.now += 60  # Idle: no more than `capacity` tokens saved up
+    assert [bucket.acquire() for _ in range(3)] == pytest.approx([0.0, 0.0, 0.25])
+
+
+def test_rate_over_many_calls(clock):
+    bucket = TokenBucket(rate=50)
+
+    for _ in range(550):
+        bucket.acquire()
+
+    # 50 tokens at start, then 50 per second
+    assert clock.now == pytest.approx(10.0)
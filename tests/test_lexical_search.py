@@ -0,0 +1,40 @@
+import pytest
+from langchain_community.vectorstores import FAISS
+from lexical_index import BM25Index
+from llm.fake import FakeEmbeddings
+from llm.vector_store import search_lexical_index
+
+FILLER = ["the model is trained on the data", "then the results are compared", "the speaker explains the idea",
+          "questions from the audience", "a short break", "the next part starts", "the training loss goes down",
+          "the team shows a demo", "closing remarks"]
+
+
+@pytest.fixture
+def index():
+    texts = FILLER * 3 + ["the speaker introduces the XR-7 prototype codename Falcon"]
+    store = FAISS.from_texts(texts, FakeEmbeddings(size=16),
+                             metadatas=[{'start_time': i, 'end_time': i + 1} for i in range(len(texts))])
+    return store, BM25Index.from_texts(texts)
+
+
+def test_rare_terms_take_the_fast_path(index):
+    docs, is_strong = search_lexical_index(*index, "XR-7 prototype Falcon", k=3)
+
+    assert is_strong
+    assert "Falcon" in docs[0].page_content
+
+
+def test_single_term_is_not_strong(index):
+    _, is_strong = search_lexical_index(*index, "Who is the speaker?", k=3)
+
+    assert not is_strong
+
+
+def test_weak_hits_are_not_returned(index):
+    docs, _ = search_lexical_index(*index, "Who is the speaker?", k=3)
+    assert docs
+    docs, _ = search_lexical_index(*index, "Who is the speaker?", k=3, score_threshold=100)
+    assert docs == []
+
+    docs, is_strong = search_lexical_index(*index, "What is the weather like?", k=3)
+    assert docs == [] and not is_strong
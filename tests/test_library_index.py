@@ -0,0 +1,101 @@
+import os
+import numpy as np
+import pytest
+from llm.library_index import LibraryIndex, VECTORS_FILE
+
+DIM = 8
+
+
+def make_video(video_id: str, count: int, seed: int) -> tuple[list[dict], np.ndarray]:
+    chunks = [{'start': i * 60, 'end': (i + 1) * 60, 'text': f"{video_id} chunk {i}"} for i in range(count)]
+    return chunks, np.random.default_rng(seed).normal(size=(count, DIM))
+
+
+@pytest.fixture
+def path(tmp_path):
+    index = LibraryIndex(str(tmp_path))
+    index.add('first', *make_video('first', 3, seed=0), namespace='fake')
+    index.add('second', *make_video('second', 4, seed=1), namespace='fake')
+    return str(tmp_path)
+
+
+def test_reopen_keeps_every_video(path):
+    index = LibraryIndex(path)
+
+    assert len(index) == 7
+    assert index.has('first') and index.has('second')
+    chunks, vectors = make_video('second', 4, seed=1)
+    assert index.search(vectors[2], k=1)[0]['text'] == chunks[2]['text']
+
+
+def test_vectors_of_an_interrupted_add_are_dropped(path):
+    # Vectors are written before the metadata: a crash in between leaves extra rows
+    with open(os.path.join(path, VECTORS_FILE), 'ab') as f:
+        f.write(np.ones((5, DIM), dtype='float32').tobytes())
+
+    index = LibraryIndex(path)
+
+    assert len(index) == 7
+    assert os.path.getsize(os.path.join(path, VECTORS_FILE)) == 7 * DIM * 4
+    index.add('third', *make_video('third', 2, seed=2), namespace='fake')
+    assert LibraryIndex(path).search(make_video('third', 2, seed=2)[1][1], k=1)[0]['video_id'] == 'third'
+
+
+def test_videos_without_their_vectors_are_dropped(path):
+    # Lost tail of the vectors file: the video whose vectors are incomplete can be added again
+    with open(os.path.join(path, VECTORS_FILE), 'r+b') as f:
+        f.truncate(5 * DIM * 4)
+
+    index = LibraryIndex(path)
+
+    assert len(index) == 3
+    assert index.has('first') and not index.has('second')
+    assert index.add('second', *make_video('second', 4, seed=1), namespace='fake') == 4
+    assert {chunk['video_id'] for chunk in index.search(make_video('second', 4, seed=1)[1][0], k=7)} == {'first', 'second'}
+
+
+def test_graph_catches_up_with_unsaved_videos(tmp_path):
+    pytest.importorskip('faiss')
+    index = LibraryIndex(str(tmp_path), hnsw_threshold=5)
+    index.add('first', *make_video('first', 6, seed=0), namespace='fake')
+    index.save()
+    chunks, vectors = make_video('second', 3, seed=1)
+    index.add('second', chunks, vectors, namespace='fake')  # Not saved in the graph
+
+    reopened = LibraryIndex(str(tmp_path))
+
+    assert reopened.stats()['hnsw']
+    assert reopened.search(vectors[1], k=1)[0]['text'] == chunks[1]['text']
+
+
+def test_other_embeddings_are_rejected(path):
+    with pytest.raises(ValueError):
+        LibraryIndex(path).add('third', *make_video('third', 2, seed=2), namespace='other')
+
+
+def test_two_writers_never_reuse_ids(path):
+    # Two processes (e.g. the HTTP service and a batch ingestion) opened the index before adding
+    service, batch = LibraryIndex(path), LibraryIndex(path)
+    service.add('third', *make_video('third', 2, seed=2), namespace='fake')
+    batch.add('fourth', *make_video('fourth', 5, seed=3), namespace='fake')
+    assert batch.add('third', *make_video('third', 2, seed=2), namespace='fake') == 0
+
+    index = LibraryIndex(path)
+    assert len(index) == 14
+    for video_id, count, seed in (('third', 2, 2), ('fourth', 5, 3)):
+        chunks, vectors = make_video(video_id, count, seed=seed)
+        assert index.search(vectors[-1], k=1)[0]['text'] == chunks[-1]['text']
+
+
+def test_graph_catches_up_with_other_writers(tmp_path):
+    pytest.importorskip('faiss')
+    first = LibraryIndex(str(tmp_path), hnsw_threshold=5)
+    first.add('first', *make_video('first', 6, seed=0), namespace='fake')
+    second = LibraryIndex(str(tmp_path), hnsw_threshold=5)
+    chunks, vectors = make_video('second', 3, seed=1)
+    second.add('second', chunks, vectors, namespace='fake')
+
+    first.add('third', *make_video('third', 2, seed=2), namespace='fake')
+
+    assert len(first) == 11
+    assert first.search(vectors[1], k=1)[0]['text'] == chunks[1]['text']
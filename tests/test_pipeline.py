@@ -0,0 +1,96 @@
+import pytest
+from pipeline import IngestionPipeline, iter_aligned
+from utils import iter_grouped
+
+
+def make_blocks(count: int, size: int) -> list[list[dict]]:
+    return [[{'start': (i * size + j) * 30, 'end': (i * size + j + 1) * 30, 'text': f"chunk {i * size + j}"}
+             for j in range(size)] for i in range(count)]
+
+
+class Recorder:
+    def __init__(self, failing: str | None = None):
+        self.texts = []
+        self.failing = failing
+
+    def __call__(self, texts: list[str]) -> list:
+        if self.failing in texts:
+            raise ValueError("Embedding failed")
+        self.texts += texts
+        return [[0.0] for _ in texts]
+
+
+def test_blocks_submitted_out_of_order_are_grouped_in_order():
+    blocks = make_blocks(4, 3)
+    embed = Recorder()
+    pipeline = IngestionPipeline(embed, granularities=[60])
+
+    for i in (2, 0, 3, 1):
+        pipeline.submit(i, blocks[i])
+
+    stats = pipeline.close()
+    chunks = [chunk for block in blocks for chunk in block]
+    assert embed.texts == [window.text for window in iter_grouped(chunks, time=60)]
+    assert stats == {'embedded': 4, 'summarized': 0}
+
+
+def test_every_granularity_is_embedded():
+    blocks = make_blocks(2, 4)
+    embed = Recorder()
+    pipeline = IngestionPipeline(embed, granularities=[30, 90])
+    for i, block in enumerate(blocks):
+        pipeline.submit(i, block)
+    pipeline.close()
+
+    chunks = [chunk for block in blocks for chunk in block]
+    expected = [window.text for time in (30, 90) for window in iter_grouped(chunks, time=time)]
+    assert sorted(embed.texts) == sorted(expected)
+
+
+def test_missing_block_is_reported():
+    blocks = make_blocks(3, 2)
+    pipeline = IngestionPipeline(Recorder(), granularities=[60])
+    pipeline.submit(0, blocks[0])
+    pipeline.submit(2, blocks[2])
+
+    with pytest.raises(RuntimeError, match="Block 1"):
+        pipeline.close()
+
+
+def test_failed_stage_drains_the_pipeline():
+    # More blocks than the queues can hold: the stages keep draining after the error
+    blocks = make_blocks(50, 2)
+    pipeline = IngestionPipeline(Recorder(failing="chunk 4 chunk 5"), granularities=[30], queue_size=1, batch_size=1)
+    for i, block in enumerate(blocks):
+        pipeline.submit(i, block)
+
+    with pytest.raises(ValueError, match="Embedding failed"):
+        pipeline.close()
+    # Closing again only reports the error again
+    with pytest.raises(ValueError):
+        pipeline.close()
+
+
+def test_aligned_windows():
+    chunks = [{'start': start, 'end': start + 50, 'text': f"at {start}"} for start in (0, 50, 130, 350)]
+
+    windows = list(iter_aligned(chunks, window=120))
+
+    assert [(window.start, window.end, window.text) for window in windows] == [
+        (0, 100, "at 0 at 50"), (130, 180, "at 130"), (350, 400, "at 350")]
+
+
+def test_leaves_are_summarized_by_position():
+    blocks = make_blocks(3, 4)
+    pipeline = IngestionPipeline(Recorder(), granularities=[60], summarize=lambda texts: [t.upper() for t in texts],
+                                 summary_window=120)
+    for i in (1, 2, 0):
+        pipeline.submit(i, blocks[i])
+
+    assert pipeline.close()['summarized'] == 3
+    assert pipeline.summaries == {k: " ".join(f"CHUNK {i}" for i in range(4 * k, 4 * k + 4)) for k in range(3)}
+
+
+def test_summaries_need_a_window():
+    with pytest.raises(ValueError):
+        IngestionPipeline(Recorder(), granularities=[60], summarize=lambda texts: texts)
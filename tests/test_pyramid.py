@@ -0,0 +1,150 @@
+import pytest
+import llm.pyramid as pyramid_module
+from timeline import TimelineIndex
+from store import VideoStore
+from llm.fake import FakeChatModel
+from llm.pyramid import SummaryPyramid
+
+
+def make_timeline(count: int, duration: float = 60) -> TimelineIndex:
+    return TimelineIndex.from_records({'start': i * duration, 'end': (i + 1) * duration - 0.5, 'text': f"chunk {i}"}
+                                      for i in range(count))
+
+
+def covered_leaves(nodes: list[tuple[int, int]]) -> list[int]:
+    return [leaf for level, position in nodes for leaf in range(position << level, (position + 1) << level)]
+
+
+@pytest.mark.parametrize('first_leaf, last_leaf', [(0, 1), (0, 8), (3, 4), (3, 11), (1, 16), (5, 6), (7, 9)])
+def test_cover_is_exact_and_ordered(first_leaf, last_leaf):
+    nodes = SummaryPyramid.cover(first_leaf, last_leaf)
+
+    assert covered_leaves(nodes) == list(range(first_leaf, last_leaf))
+
+
+def test_cover_uses_few_nodes():
+    assert SummaryPyramid.cover(0, 8) == [(3, 0)]
+    assert SummaryPyramid.cover(3, 11) == [(0, 3), (2, 1), (1, 4), (0, 10)]
+    assert SummaryPyramid.cover(4, 4) == []
+
+
+@pytest.mark.parametrize('time_in_sec', [30, 60, 90, 120, 300, 1000])
+def test_intervals_match_grouped_windows(time_in_sec):
+    timeline = make_timeline(25)
+    pyramid = SummaryPyramid(timeline)
+
+    grouped = timeline.grouped(time_in_sec)
+    intervals = pyramid.intervals(time_in_sec)
+
+    assert [timeline.starts[first] for first, _ in intervals] == list(grouped.starts)
+    assert [timeline.ends[last - 1] for _, last in intervals] == list(grouped.ends)
+    assert [timeline.text_between(first, last - 1) for first, last in intervals] == grouped.texts()
+
+
+def test_intervals_are_not_rounded_to_the_base_window():
+    timeline = make_timeline(12, duration=30)
+    pyramid = SummaryPyramid(timeline, base_window=120)
+
+    # 90 s windows of 30 s chunks: 3 chunks each, not 4 (one base window)
+    assert pyramid.intervals(60) == [(i, i + 3) for i in range(0, 12, 3)]
+    assert pyramid.intervals(90) == [(0, 4), (4, 8), (8, 12)]
+
+
+def test_pieces_split_edges_and_nodes():
+    timeline = make_timeline(24, duration=30)
+    pyramid = SummaryPyramid(timeline, base_window=60)
+
+    # Leaf k holds chunks 2k and 2k + 1
+    assert pyramid.pieces(0, 8) == [('node', (2, 0))]
+    assert pyramid.pieces(3, 12) == [('chunks', (3, 4)), ('node', (1, 1)), ('node', (1, 2))]
+    assert pyramid.pieces(3, 15) == [('chunks', (3, 4)), ('node', (1, 1)), ('node', (1, 2)), ('node', (0, 6)),
+                                     ('chunks', (14, 15))]
+    # Shorter than a base window
+    assert pyramid.pieces(3, 4) == [('chunks', (3, 4))]
+
+
+@pytest.mark.parametrize('first, last', [(0, 24), (1, 23), (3, 4), (5, 17), (6, 14)])
+def test_pieces_cover_the_range(first, last):
+    timeline = make_timeline(24, duration=30)
+    pyramid = SummaryPyramid(timeline, base_window=60)
+
+    chunks = []
+    for kind, piece in pyramid.pieces(first, last):
+        if kind == 'chunks':
+            chunks += range(*piece)
+        else:
+            for leaf in covered_leaves([piece]):
+                chunks += range(*pyramid.leaves[leaf])
+
+    assert chunks == list(range(first, last))
+
+
+@pytest.fixture
+def chat_model(monkeypatch):
+    chat_model = FakeChatModel(summary_words=8)
+    monkeypatch.setattr(pyramid_module, 'get_chat_model', lambda: chat_model)
+    return chat_model
+
+
+def calls(chat_model: FakeChatModel) -> int:
+    return chat_model.usage.snapshot().get('calls', 0)
+
+
+def test_built_pyramid_answers_aligned_intervals_without_calls(chat_model):
+    pyramid = SummaryPyramid(make_timeline(16), base_window=60)
+    pyramid.build()
+    before = calls(chat_model)
+
+    # Chunks start every 60 s: 180 s windows hold 4 chunks (one level-2 node)
+    intervals = pyramid.summarize_intervals(180)
+
+    assert calls(chat_model) == before
+    assert [interval['summary'] for interval in intervals] == [pyramid._summaries[(2, i)] for i in range(4)]
+
+
+def test_unaligned_intervals_are_labelled_nodes_plus_edges(chat_model):
+    timeline = make_timeline(24, duration=30)
+    pyramid = SummaryPyramid(timeline, base_window=60)
+    pyramid.build()
+    before = calls(chat_model)
+
+    # 60 s windows of 30 s chunks (3 chunks each): every other window starts in the middle of a leaf
+    intervals = pyramid.summarize_intervals(60)
+    edges = sum(kind == 'chunks' for first, last in pyramid.intervals(60) for kind, _ in pyramid.pieces(first, last))
+
+    assert calls(chat_model) - before == edges > 0
+    assert intervals[1]['summary'].startswith(f"FROM {timeline.starts[3]}s to ")
+
+    # Asked again: nothing left to summarize
+    assert pyramid.summarize_intervals(60) == intervals
+    assert calls(chat_model) - before == edges
+
+
+def test_repeated_request_before_the_pyramid_is_built(tmp_path, chat_model):
+    store = VideoStore(str(tmp_path / 'videos.sqlite'))
+    timeline = make_timeline(20)
+
+    cold = SummaryPyramid(timeline, video_id='video', store=store).summarize_intervals(300)
+    cold_calls = calls(chat_model)
+    warm = SummaryPyramid(timeline, video_id='video', store=store).summarize_intervals(300)
+
+    assert cold_calls == 4
+    assert calls(chat_model) == cold_calls
+    assert warm == cold
+
+
+def test_added_leaves_are_not_summarized_again(tmp_path, chat_model):
+    store = VideoStore(str(tmp_path / 'videos.sqlite'))
+    timeline = make_timeline(8)
+    pyramid = SummaryPyramid(timeline, video_id='video', store=store)
+    leaves = {position: summary for position, summary in
+              enumerate(pyramid_module.summarize_leaves([timeline.text(i) for i in range(8)]))}
+    before = calls(chat_model)
+
+    pyramid.add_leaves(leaves)
+    pyramid.build()
+
+    # Only the 7 nodes above the leaves, and the leaves are saved
+    assert calls(chat_model) - before == 7
+    assert {position: SummaryPyramid(timeline, video_id='video', store=store)._summaries[(0, position)]
+            for position in range(8)} == leaves
@@ -0,0 +1,35 @@
+import pytest
+from timeline import TimelineIndex
+from store import VideoStore, TRANSLATED
+
+TEXTS = ["Grüße aus Köln", "naïve café ☕", "東京の夜景", "emoji 🎬🎥 scene", "plain ascii", "Ελληνικά κείμενα",
+         "", "last one ✓"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VideoStore(str(tmp_path / 'videos.sqlite'))
+    timeline = TimelineIndex.from_records({'start': i * 60, 'end': (i + 1) * 60 - 1, 'text': text}
+                                          for i, text in enumerate(TEXTS))
+    store.save_timeline('video', TRANSLATED, timeline, window=60)
+    return store
+
+
+@pytest.mark.parametrize('time', [0, 59.5, 60, 130, 200, 420, 479, 1000])
+def test_load_around_matches_full_load(store, time):
+    full = store.load_timeline('video', TRANSLATED, window=60)
+    i = max(0, [start <= time for start in full.starts].count(True) - 1)
+
+    around = store.load_around('video', TRANSLATED, time, context=1)
+
+    first, last = max(0, i - 1), min(len(full), i + 3)
+    assert list(around.starts) == list(full.starts[first:last])
+    assert list(around.ends) == list(full.ends[first:last])
+    assert around.texts() == full.texts()[first:last]
+
+
+def test_load_range_is_clamped(store):
+    assert store.load_range('video', TRANSLATED, -5, 2).texts() == TEXTS[:2]
+    assert store.load_range('video', TRANSLATED, 6, 50).texts() == TEXTS[6:]
+    assert len(store.load_range('video', TRANSLATED, 9, 12)) == 0
+    assert store.load_around('other', TRANSLATED, 10) is None
@@ -0,0 +1,57 @@
+import pytest
+from llm.fake import FakeChatModel
+from llm.summarizer import get_reduce_batches, reduce_summarize
+
+
+def flatten(batches: list[list[str]]) -> list[str]:
+    return [summary for batch in batches for summary in batch]
+
+
+@pytest.mark.parametrize('fan_in', [2, 3, 8])
+def test_batches_respect_the_fan_in(fan_in):
+    summaries = [f"summary {i}" for i in range(20)]
+
+    batches = get_reduce_batches(summaries, [10] * 20, token_budget=10_000, fan_in=fan_in)
+
+    assert flatten(batches) == summaries
+    assert all(len(batch) <= fan_in for batch in batches)
+    assert len(batches) == -(-20 // fan_in)
+
+
+def test_batches_respect_the_token_budget():
+    summaries = [f"summary {i}" for i in range(6)]
+    tokens = [40, 50, 30, 80, 10, 10]
+
+    batches = get_reduce_batches(summaries, tokens, token_budget=100, fan_in=8)
+
+    assert batches == [summaries[0:2], summaries[2:3], summaries[3:6]]
+
+
+def test_oversized_summary_gets_its_own_batch():
+    summaries = ["a", "b", "c", "d"]
+
+    assert get_reduce_batches(summaries, [10, 10, 500, 10], token_budget=100, fan_in=8) == [["a", "b"], ["c"], ["d"]]
+
+
+def test_every_level_shrinks():
+    summaries = [f"summary {i}" for i in range(5)]
+
+    # No two summaries fit together: adjacent pairs are merged anyway
+    batches = get_reduce_batches(summaries, [100] * 5, token_budget=100, fan_in=8)
+
+    assert batches == [summaries[0:2], summaries[2:4], summaries[4:5]]
+
+
+def test_reduce_ends_with_a_single_summary():
+    llm = FakeChatModel(summary_words=5)
+
+    summary = reduce_summarize(llm, [f"part {i} of the video" for i in range(30)], token_budget=10_000, fan_in=3)
+
+    assert isinstance(summary, str) and summary
+    # 30 -> 10 -> 4 -> 2 -> 1 at most
+    assert llm.usage.snapshot()['calls'] <= 10 + 4 + 2 + 1
+
+
+def test_fan_in_below_two_is_rejected():
+    with pytest.raises(ValueError):
+        reduce_summarize(FakeChatModel(), ["a", "b"], fan_in=1)
@@ -0,0 +1,100 @@
+import random
+import pytest
+from timeline import TimelineIndex
+from utils import get_grouped_data
+
+
+@pytest.fixture
+def timeline():
+    rng = random.Random(0)
+    records = []
+    start = 0.0
+    for i in range(200):
+        duration = rng.uniform(1, 8)
+        records.append({'start': start, 'end': start + duration - 0.5,
+                        'text': " ".join(["word"] * rng.randint(1, 30))})
+        start += duration
+    return TimelineIndex.from_records(records)
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def assert_contiguous(bounds: list[tuple[int, int]], n: int):
+    assert bounds[0][0] == 0 and bounds[-1][1] == n
+    assert all(first < last for first, last in bounds)
+    assert all(bounds[i][1] == bounds[i + 1][0] for i in range(len(bounds) - 1))
+
+
+def test_records_round_trip(timeline):
+    records = timeline.to_records()
+
+    assert TimelineIndex.from_records(records).to_records() == records
+    assert [timeline.text(i) for i in range(len(timeline))] == [r['text'] for r in records]
+
+
+def test_point_lookups_match_a_linear_scan(timeline):
+    records = timeline.to_records()
+    for time in [0, 3.3, 100, 250.7, records[-1]['end'], records[-1]['end'] + 1]:
+        inside = [i for i, r in enumerate(records) if r['start'] <= time <= r['end']]
+        after = [i for i, r in enumerate(records) if r['start'] > time]
+
+        assert timeline.find(time) == (inside[0] if inside else -1)
+        assert timeline.next_after(time) == (after[0] if after else -1)
+
+
+def test_range_matches_a_linear_scan(timeline):
+    records = timeline.to_records()
+
+    assert list(timeline.range(100, 200)) == [i for i, r in enumerate(records) if r['end'] >= 100 and r['start'] <= 200]
+
+
+@pytest.mark.parametrize('time', [10, 60, 120, 10_000])
+def test_time_windows_match_the_streaming_grouping(timeline, time):
+    bounds = timeline.group_bounds(time)
+    grouped = get_grouped_data(timeline.to_records(), time)
+
+    assert_contiguous(bounds, len(timeline))
+    assert [timeline.text_between(first, last - 1) for first, last in bounds] == [g['text'] for g in grouped]
+    assert timeline.grouped(time).to_records() == grouped
+
+
+def test_grouped_is_cached(timeline):
+    assert timeline.grouped(60) is timeline.grouped(60)
+
+
+@pytest.mark.parametrize('max_tokens', [10, 50, 200])
+def test_packing_stays_within_the_budget(timeline, max_tokens):
+    bounds = timeline.group_bounds(None, max_tokens, count_words)
+
+    assert_contiguous(bounds, len(timeline))
+    for first, last in bounds:
+        tokens = sum(count_words(timeline.text(i)) for i in range(first, last))
+        # Segments are never split: only a window of a single segment may exceed the budget
+        assert tokens <= max_tokens or last - first == 1
+        # Greedy: the next segment would not have fitted
+        if last < len(timeline):
+            assert tokens + count_words(timeline.text(last)) > max_tokens
+
+
+def test_packing_with_a_time_window(timeline):
+    bounds = timeline.group_bounds(60, 100, count_words)
+
+    assert_contiguous(bounds, len(timeline))
+    for first, last in bounds:
+        assert timeline.starts[last - 1] - timeline.starts[first] <= 60
+        assert sum(count_words(timeline.text(i)) for i in range(first, last)) <= 100 or last - first == 1
+
+
+@pytest.mark.parametrize('time, max_tokens', [(None, 80), (60, 100)])
+def test_packed_bounds_match_the_streaming_grouping(timeline, time, max_tokens):
+    bounds = timeline.group_bounds(time, max_tokens, count_words)
+    grouped = get_grouped_data(timeline.to_records(), time, max_tokens=max_tokens, count_tokens=count_words)
+
+    assert [timeline.text_between(first, last - 1) for first, last in bounds] == [g['text'] for g in grouped]
+
+
+def test_time_or_budget_required(timeline):
+    with pytest.raises(ValueError):
+        timeline.group_bounds(None)
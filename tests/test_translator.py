@@ -0,0 +1,102 @@
+import re
+import pytest
+import llm.translator as translator
+from llm.fake import FakeChatModel
+from langchain_core.messages import AIMessage
+
+
+class DroppingChatModel(FakeChatModel):
+    """
+    Echoes the segments like `FakeChatModel`, but always drops the ones in `dropped`.
+    """
+    dropped: set[int] = set()
+
+    def _respond(self, messages, tools):
+        message, input_tokens = super()._respond(messages, tools)
+        content = re.sub(r"<SEG_(\d+)>[^<]*", lambda m: "" if int(m.group(1)) in self.dropped else m.group(0),
+                         message.content)
+        return AIMessage(content=content), input_tokens
+
+
+def make_chunks(count: int) -> list[dict]:
+    return [{'start': i * 60, 'end': (i + 1) * 60, 'text': f"bonjour {i}"} for i in range(count)]
+
+
+def test_dropped_segment_is_flagged_and_not_journaled(tmp_path, monkeypatch):
+    journal_path = str(tmp_path / 'video.journal.jsonl')
+    monkeypatch.setattr(translator, 'get_chat_model', lambda: DroppingChatModel(dropped={2}))
+
+    output = translator.translate_to_english(make_chunks(4), 'fr', max_duration=120, journal_path=journal_path)
+
+    assert [chunk.get('untranslated', False) for chunk in output] == [False, True, False, False]
+    assert output[1]['text'] == "bonjour 1"
+    assert 2 not in translator.load_translation_journal(journal_path)
+
+
+def test_rerun_only_retries_untranslated_segments(tmp_path, monkeypatch):
+    journal_path = str(tmp_path / 'video.journal.jsonl')
+    monkeypatch.setattr(translator, 'get_chat_model', lambda: DroppingChatModel(dropped={2}))
+    translator.translate_to_english(make_chunks(4), 'fr', max_duration=120, journal_path=journal_path)
+
+    model = DroppingChatModel()
+    monkeypatch.setattr(translator, 'get_chat_model', lambda: model)
+    output = translator.translate_to_english(make_chunks(4), 'fr', max_duration=120, journal_path=journal_path)
+
+    assert not any(chunk.get('untranslated') for chunk in output)
+    # Only the block of the dropped segment is sent again
+    assert model.usage.snapshot()['calls'] == 1
+
+
+class TranslatingChatModel(FakeChatModel):
+    """
+    "Translates" the segments by upper-casing them, and fails on the segments containing `failing`.
+    """
+    failing: str | None = None
+
+    def _respond(self, messages, tools):
+        message, input_tokens = super()._respond(messages, tools)
+        if self.failing and self.failing in message.content:
+            raise ValueError("Translation failed")
+        return AIMessage(content=re.sub(r"(<SEG_\d+>)([^<]*)", lambda m: m.group(1) + m.group(2).upper(),
+                                        message.content)), input_tokens
+
+
+def test_every_finished_block_is_journaled(tmp_path, monkeypatch):
+    journal_path = str(tmp_path / 'video.journal.jsonl')
+    monkeypatch.setattr(translator, 'get_chat_model', lambda: TranslatingChatModel())
+
+    output = translator.translate_to_english(make_chunks(6), 'fr', max_duration=60, journal_path=journal_path)
+
+    assert [chunk['text'] for chunk in output] == [f"BONJOUR {i}" for i in range(6)]
+    assert [(chunk['start'], chunk['end']) for chunk in output] == [(i * 60, (i + 1) * 60) for i in range(6)]
+    with open(journal_path) as f:
+        assert len(f.readlines()) == 3
+    assert translator.load_translation_journal(journal_path) == {i + 1: f"BONJOUR {i}" for i in range(6)}
+
+
+def test_truncated_journal_line_is_ignored(tmp_path):
+    journal_path = tmp_path / 'video.journal.jsonl'
+    journal_path.write_text('{"block": 0, "segments": {"1": "hello", "2": "world"}}\n{"block": 1, "segm')
+
+    assert translator.load_translation_journal(str(journal_path)) == {1: "hello", 2: "world"}
+
+
+def test_failed_block_keeps_the_others_and_resumes(tmp_path, monkeypatch):
+    journal_path = str(tmp_path / 'video.journal.jsonl')
+    monkeypatch.setattr(translator, 'get_chat_model', lambda: TranslatingChatModel(failing="bonjour 4"))
+
+    with pytest.raises(RuntimeError):
+        translator.translate_to_english(make_chunks(6), 'fr', max_duration=60, journal_path=journal_path,
+                                        max_retries=1)
+    assert set(translator.load_translation_journal(journal_path)) == {1, 2, 3, 4}
+
+    model = TranslatingChatModel()
+    monkeypatch.setattr(translator, 'get_chat_model', lambda: model)
+    blocks = []
+    output = translator.translate_to_english(make_chunks(6), 'fr', max_duration=60, journal_path=journal_path,
+                                             on_block=lambda i, chunks: blocks.append(i))
+
+    assert [chunk['text'] for chunk in output] == [f"BONJOUR {i}" for i in range(6)]
+    # Only the failed block is sent again, the journaled ones are handed over first
+    assert model.usage.snapshot()['calls'] == 1
+    assert blocks == [0, 1, 2]
@@ -0,0 +1,50 @@
+import os
+import pytest
+from llm import vector_store
+from llm.embedding_cache import CachedEmbeddings
+from llm.fake import FakeEmbeddings
+from llm.vector_store import (create_vector_store, replace_vector_store, load_vector_store,
+                              get_granularity_path)
+
+GRANULARITIES = [60, 120]
+
+
+def records(texts):
+    return [{'start': i * 30, 'end': i * 30 + 30, 'text': text} for i, text in enumerate(texts)]
+
+
+@pytest.fixture(autouse=True)
+def embeddings(tmp_path, monkeypatch):
+    embedding = CachedEmbeddings(FakeEmbeddings(size=16), str(tmp_path / 'embeddings.sqlite'), namespace='fake')
+    monkeypatch.setattr(vector_store, 'get_embeddings', lambda: embedding)
+    return embedding
+
+
+def contents(path):
+    return sorted(doc.page_content for doc in load_vector_store(path).docstore._dict.values())
+
+
+def test_replaced_store_is_reloaded(tmp_path):
+    path = str(tmp_path / 'video')
+    create_vector_store(records(["hola", "the talk starts"]), GRANULARITIES, path)
+    granularity_path = get_granularity_path(path, 60)
+    assert contents(granularity_path) == ["hola the talk starts"]
+
+    replace_vector_store(records(["hello", "the talk starts"]), GRANULARITIES, path)
+
+    # Served from the new files, not from the process-wide cache
+    assert contents(granularity_path) == ["hello the talk starts"]
+    assert sorted(os.listdir(path)) == ["120s", "60s"]
+    assert not os.path.exists(path + '.new') and not os.path.exists(path + '.old')
+
+
+def test_interrupted_rebuild_is_cleaned_up(tmp_path):
+    path = str(tmp_path / 'video')
+    create_vector_store(records(["hola"]), GRANULARITIES, path)
+    # Half-built folder of a previous rebuild
+    os.makedirs(os.path.join(path + '.new', '60s'))
+
+    replace_vector_store(records(["hello"]), GRANULARITIES, path)
+
+    assert contents(get_granularity_path(path, 120)) == ["hello"]
+    assert not os.path.exists(path + '.new')
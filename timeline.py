@@ -0,0 +1,192 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Callable, Iterable, Iterator
+
+
+class TimelineIndex:
+    """
+    Compact, array-backed index of time-stamped transcript segments.
+
+    Start and end times are kept in two `array('d')` columns, and the texts
+    are stored once, joined by a single space, in a shared string buffer that
+    is addressed by offsets. Point lookups and range queries are binary
+    searches over the start times, so they cost O(log n) and allocate nothing
+    besides the returned text.
+
+    Grouping the timeline into larger time windows (`grouped`) reuses the
+    same text buffer, and every granularity is computed only once per index.
+    """
+
+    __slots__ = ('starts', 'ends', '_offsets', '_buffer', '_groups')
+
+    def __init__(self, starts: array, ends: array, offsets: array, buffer: str):
+        """
+        Args:
+            starts: Start time (in seconds) of every segment, in ascending order.
+            ends: End time (in seconds) of every segment.
+            offsets: `len(starts) + 1` offsets into `buffer`; the text of segment `i`
+                     is `buffer[offsets[i]:offsets[i + 1] - 1]`.
+            buffer: Texts of all segments, joined by a single space.
+        """
+        self.starts = starts
+        self.ends = ends
+        self._offsets = offsets
+        self._buffer = buffer
+        self._groups = {}
+
+    @classmethod
+    def from_records(cls, data: Iterable[dict]) -> 'TimelineIndex':
+        """
+        Builds the index from a list of dictionaries with 'start', 'end' and 'text' keys
+        (e.g. the output of `get_grouped_transcriptions` or `translate_to_english`).
+        """
+        starts = array('d')
+        ends = array('d')
+        offsets = array('q', [0])
+        texts = []
+        offset = 0
+        for d in data:
+            starts.append(d['start'])
+            ends.append(d['end'])
+            texts.append(d['text'])
+            offset += len(d['text']) + 1
+            offsets.append(offset)
+
+        return cls(starts, ends, offsets, " ".join(texts))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Timeline index out of range")
+
+        return {'start': self.starts[i], 'end': self.ends[i], 'text': self.text(i)}
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_records(self) -> list[dict]:
+        """
+        Returns the segments as a list of dictionaries with 'start', 'end' and 'text' keys.
+        """
+        return list(self)
+
+    def columns(self) -> tuple[array, array, array, str]:
+        """
+        Returns the underlying columns: start times, end times, text offsets and text buffer
+        (the buffer may be shared with a finer index, see `grouped`).
+        """
+        return self.starts, self.ends, self._offsets, self._buffer
+
+    def text(self, i: int) -> str:
+        """
+        Returns the text of segment `i`.
+        """
+        return self._buffer[self._offsets[i]:self._offsets[i + 1] - 1]
+
+    def texts(self) -> list[str]:
+        """
+        Returns the texts of all segments, in order.
+        """
+        return [self.text(i) for i in range(len(self))]
+
+    def text_between(self, first: int, last: int) -> str:
+        """
+        Returns the text of the segments `first` to `last` (inclusive), joined by spaces.
+        """
+        return self._buffer[self._offsets[first]:self._offsets[last + 1] - 1]
+
+    def find(self, time: int | float) -> int:
+        """
+        Returns the index of the segment containing `time` (start <= time <= end), or -1.
+        """
+        i = bisect_right(self.starts, time) - 1
+        if i >= 0 and time <= self.ends[i]:
+            return i
+        return -1
+
+    def next_after(self, time: int | float) -> int:
+        """
+        Returns the index of the first segment starting after `time`, or -1 if there is none.
+        Useful when `time` falls into a gap between two segments.
+        """
+        i = bisect_right(self.starts, time)
+        return i if i < len(self) else -1
+
+    def range(self, start: int | float, end: int | float) -> range:
+        """
+        Returns the indices of the segments overlapping the [start, end] time range,
+        e.g. `index.range(12 * 60, 18 * 60 + 30)` for everything between 12:00 and 18:30.
+        """
+        first = bisect_left(self.ends, start)
+        last = bisect_right(self.starts, end)
+        return range(first, max(first, last))
+
+    def neighbors(self, i: int) -> tuple[int | None, int | None]:
+        """
+        Returns the indices of the previous and the next segment of segment `i`
+        (None when `i` is the first / the last segment).
+        """
+        return (i - 1 if i > 0 else None, i + 1 if i + 1 < len(self) else None)
+
+    def group_bounds(self, time: int | float | None, max_tokens: int | None = None,
+                     count_tokens: Callable[[str], int] | None = None) -> list[tuple[int, int]]:
+        """
+        Returns the `[first, last)` index bounds of the time windows used by `grouped`.
+
+        A window starts at a segment and takes every following segment that starts
+        at most `time` seconds after it (same rule as `get_grouped_data`). With
+        `max_tokens`, it also stops before the segment that would take it over the
+        budget (packing mode, `time` may then be None).
+        """
+        if time is None and max_tokens is None:
+            raise ValueError("A time window or a token budget is required to group segments.")
+
+        n = len(self)
+        # Tokens of every segment, counted once
+        tokens = [count_tokens(self.text(i)) for i in range(n)] if max_tokens is not None else None
+
+        bounds = []
+        first = 0
+        while first < n:
+            last = bisect_right(self.starts, self.starts[first] + time, lo=first + 1) if time is not None else n
+            if tokens is not None:
+                window_tokens = tokens[first]
+                for i in range(first + 1, last):
+                    window_tokens += tokens[i]
+                    if window_tokens > max_tokens:
+                        last = i
+                        break
+            bounds.append((first, last))
+            first = last
+
+        return bounds
+
+    def grouped(self, time: int | float | None, max_tokens: int | None = None,
+                count_tokens: Callable[[str], int] | None = None) -> 'TimelineIndex':
+        """
+        Returns the timeline merged into windows of ~`time` seconds (and of at most
+        `max_tokens` tokens, see `group_bounds`).
+
+        The result shares the text buffer of this index and is cached, so asking
+        for the same granularity again costs nothing.
+        """
+        key = (time, max_tokens, count_tokens) if max_tokens is not None else time
+        if key not in self._groups:
+            starts = array('d')
+            ends = array('d')
+            offsets = array('q')
+            for first, last in self.group_bounds(time, max_tokens, count_tokens):
+                starts.append(self.starts[first])
+                ends.append(self.ends[last - 1])
+                offsets.append(self._offsets[first])
+            offsets.append(self._offsets[len(self)])
+
+            self._groups[key] = TimelineIndex(
+                starts, ends, offsets, self._buffer)
+
+        return self._groups[key]
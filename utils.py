@@ -1,3 +1,4 @@
+from typing import Callable, Iterable, Iterator, NamedTuple
 from urllib.parse import urlparse, parse_qs
 
 
@@ -30,6 +31,62 @@ def extract_video_id(url: str):
     return None
 
 
+class GroupedChunk(NamedTuple):
+    """
+    Lightweight view of a grouped chunk, yielded by `iter_grouped`.
+    """
+    start: float
+    end: float
+    text: str
+
+
+def iter_grouped(data: Iterable[dict], time: int | float | None, end_key: str = 'end', max_tokens: int | None = None,
+                 count_tokens: Callable[[str], int] | None = None) -> Iterator[GroupedChunk]:
+    """
+    Streams the given time-stamped segments grouped into windows of the given time.
+
+    A window starts at a segment and takes every following segment that starts at most
+    `time` seconds after it. The source is never copied or modified, it can be any
+    iterable (e.g. a generator), and the text of every window is joined exactly once.
+
+    Packing mode: with `max_tokens`, a window also stops before the segment that would
+    take it over `max_tokens` tokens (segments are never split, so a segment above the
+    budget gets a window of its own). With `time` set to None, windows are cut by tokens
+    only, so every LLM call gets about the same amount of text whatever the speech rate.
+
+    :param data: Segments with 'start', 'text' and `end_key` keys, in chronological order
+    :type data: Iterable[dict]
+    :param time: The given time (in second) frame to which the segments will be grouped (None: no time limit)
+    :type time: int | float | None
+    :param end_key: Key holding the end time of a segment ('start' for raw transcriptions, which have no end)
+    :type end_key: str
+    :param max_tokens: Maximum number of tokens of a window (packing mode)
+    :type max_tokens: int | None
+    :param count_tokens: Token counter of the model the windows are sent to (required with `max_tokens`)
+    :type count_tokens: Callable[[str], int] | None
+    """
+    if time is None and max_tokens is None:
+        raise ValueError("A time window or a token budget is required to group segments.")
+
+    start = end = None
+    texts = []
+    window_tokens = 0
+    for d in data:
+        tokens = count_tokens(d['text']) if max_tokens is not None else 0
+        if (texts and (time is None or d['start'] - start <= time)
+                and (max_tokens is None or window_tokens + tokens <= max_tokens)):
+            texts.append(d['text'])
+            end = d[end_key]
+            window_tokens += tokens
+        else:
+            if texts:
+                yield GroupedChunk(start, end, " ".join(texts))
+            start, end, texts, window_tokens = d['start'], d[end_key], [d['text']], tokens
+
+    if texts:
+        yield GroupedChunk(start, end, " ".join(texts))
+
+
 def get_grouped_transcriptions(transcriptions: list[dict], time: int | float) -> list[dict]:
     """
     Returns grouped transcription of the transcribed text with the given time window
@@ -39,64 +96,44 @@ def get_grouped_transcriptions(transcriptions: list[dict], time: int | float) ->
     :param time: The given time (in second) frame to which the transcription will be grouped
     :type time: int | float
     """
-    curr_res = {
-        'start': transcriptions[0]['start'],
-        'end': transcriptions[0]['start'],
-        'text': transcriptions[0]['text']
-    }
-
-    output = []
-    for tr in transcriptions[1:]:
-        if tr['start'] - curr_res['start'] <= time:
-            curr_res['text'] += (" " + tr['text'])
-            curr_res['end'] = tr['start']
-        else:
-            output.append(curr_res)
-            curr_res = {
-                'start': tr['start'],
-                'end': tr['start'],
-                'text': tr['text']
-            }
-
-    output.append(curr_res)
-    return output
+    return [chunk._asdict() for chunk in iter_grouped(transcriptions, time, end_key='start')]
 
-def get_grouped_data(data: list[dict], time: int | float) -> list[dict]:
+def get_grouped_data(data: list[dict], time: int | float | None, max_tokens: int | None = None,
+                     count_tokens: Callable[[str], int] | None = None) -> list[dict]:
     """
     Use it only after initital grouping using `get_grouped_transcriptions` has been done for the raw transcription data.
     
     Returns grouped transcription of the processed transcribed text with the given time window
+    (or packed by tokens, see `iter_grouped`)
 
     :param data: Dictionary version of the transcription result (obtained through res.to_raw_data())
     :type data: list[dict]
-    :param time: The given time (in second) frame to which the transcription will be grouped
-    :type time: int | float
+    :param time: The given time (in second) frame to which the transcription will be grouped (None: no time limit)
+    :type time: int | float | None
+    :param max_tokens: Maximum number of tokens of a group (packing mode)
+    :type max_tokens: int | None
+    :param count_tokens: Token counter of the model the groups are sent to (required with `max_tokens`)
+    :type count_tokens: Callable[[str], int] | None
     """
-    curr_res = {
-        'start': data[0]['start'],
-        'end': data[0]['end'],
-        'text': data[0]['text']
-    }
-
-    output = []
-    for d in data[1:]:
-        if d['start'] - curr_res['start'] <= time:
-            curr_res['text'] += (" " + d['text'])
-            curr_res['end'] = d['end']
-        else:
-            output.append(curr_res)
-            curr_res = {
-                'start': d['start'],
-                'end': d['end'],
-                'text': d['text']
-            }
+    return [chunk._asdict() for chunk in iter_grouped(data, time, max_tokens=max_tokens, count_tokens=count_tokens)]
 
-    output.append(curr_res)
-    return output
 
+def parse_segments(translated: str) -> dict[int, str]:
+    """
+    Parses the `<SEG_X> text` formatted output of the translator into a dictionary.
+
+    Malformed markers (e.g. `<SEG_>`, `<SEG_3` without `>`) and the text before the
+    first marker are skipped. IDs that appear more than once are ambiguous (the model
+    merged or repeated segments), so they are left out of the result as well; the
+    caller can find them with the missing IDs and request them again.
 
-def parse_segments(translated: str):
+    :param translated: Raw output of the translator
+    :type translated: str
+    :return: Mapping of SEG id to its text
+    :rtype: dict[int, str]
+    """
     result = {}
+    duplicates = set()
     parts = translated.split("<SEG_")
 
     for part in parts:
@@ -104,9 +141,17 @@ def parse_segments(translated: str):
         if not part:
             continue
 
-        seg_id, content = part.split(">", 1)
+        seg_id, sep, content = part.partition(">")
+        seg_id = seg_id.strip()
+        if not sep or not seg_id.isdigit():
+            continue
         seg_id = int(seg_id)
 
+        if seg_id in result:
+            duplicates.add(seg_id)
         result[seg_id] = content.strip()
 
+    for seg_id in duplicates:
+        del result[seg_id]
+
     return result